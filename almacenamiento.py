@@ -0,0 +1,270 @@
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+# Capa de almacenamiento en SQLite: conexión con los ajustes de rendimiento, esquema de
+# la tabla datos, inserción en bloque, índices secundarios y consultas que usan la
+# interfaz y los scripts.
+
+# Campos homologados en el orden de las columnas de la tabla datos
+FIELDS = [
+    'Nombre', 'Cliente_Cuenta', 'Tipo_de_Dispositivo', 'IMEI', 'ICCID',
+    'Fecha_de_Activacion', 'Fecha_de_Desactivacion', 'Hora_de_Ultimo_Mensaje',
+    'Ultimo_Reporte', 'Vehiculo', 'Servicios', 'Grupo', 'Telefono', 'Origen', 'Fecha_Archivo'
+]
+
+# Campos de fecha/hora. Cada uno tiene una columna derivada <campo>_Epoch con los
+# segundos desde 1970-01-01 de la fecha tal como viene en el exporte (sin zona
+# horaria), que se puede ordenar e indexar sin importar el formato de origen.
+DATE_FIELDS = ['Fecha_de_Activacion', 'Fecha_de_Desactivacion', 'Hora_de_Ultimo_Mensaje', 'Ultimo_Reporte']
+
+# Función para obtener el nombre de la columna epoch de un campo de fecha
+def epoch_column(field):
+    return f'{field}_Epoch'
+
+# Columna con el nombre del archivo de origen de cada registro, en datos y en
+# no_insertados (la interfaz muestra solo los registros del archivo procesado)
+SOURCE_COLUMN = 'Archivo'
+
+# Columnas de la tabla datos que no vienen del Excel sino que se calculan en la carga
+# (Huella: huella de los campos no clave, usada por el registro de cambios diarios;
+# <campo>_Epoch: fechas normalizadas por el módulo fechas; Archivo: archivo de origen)
+DERIVED_COLUMNS = {
+    'Huella': 'TEXT',
+    **{epoch_column(field): 'INTEGER' for field in DATE_FIELDS},
+    SOURCE_COLUMN: 'TEXT',
+}
+
+# Tabla con los registros que no se insertaron en datos por tener una clave repetida
+# (la interfaz los consulta por páginas). Guarda solo la última carga de cada archivo.
+NOT_INSERTED_TABLE = 'no_insertados'
+
+# Ajustes de cada conexión: WAL para que las lecturas de la interfaz no bloqueen la
+# carga, synchronous NORMAL (seguro con WAL), 64 MB de caché de páginas y tablas
+# temporales en memoria
+PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -65536',
+    'PRAGMA temp_store = MEMORY',
+]
+
+# Índices secundarios de la tabla datos (se crean después de la carga en bloque)
+INDEXES = {
+    'idx_datos_cliente_cuenta': 'Cliente_Cuenta',
+    'idx_datos_origen': 'Origen',
+    'idx_datos_imei': 'IMEI',
+    'idx_datos_iccid': 'ICCID',
+    'idx_datos_telefono': 'Telefono',
+    'idx_datos_activacion_epoch': epoch_column('Fecha_de_Activacion'),
+    'idx_datos_desactivacion_epoch': epoch_column('Fecha_de_Desactivacion'),
+    'idx_datos_ultimo_mensaje_epoch': epoch_column('Hora_de_Ultimo_Mensaje'),
+    'idx_datos_ultimo_reporte_epoch': epoch_column('Ultimo_Reporte'),
+    'idx_datos_archivo': SOURCE_COLUMN,
+}
+
+# Función para abrir la conexión de una corrida con los ajustes de rendimiento
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# Función para crear la tabla datos (y la de registros no insertados) si no existe
+def create_schema(conn):
+    cursor = conn.cursor()
+    cursor.execute(''' 
+        CREATE TABLE IF NOT EXISTS datos ( 
+            Nombre TEXT,
+            Cliente_Cuenta TEXT,
+            Tipo_de_Dispositivo TEXT,
+            IMEI TEXT,
+            ICCID TEXT,
+            Fecha_de_Activacion TEXT,
+            Fecha_de_Desactivacion TEXT,
+            Hora_de_Ultimo_Mensaje TEXT,
+            Ultimo_Reporte TEXT,
+            Vehiculo TEXT,
+            Servicios TEXT,
+            Grupo TEXT,
+            Telefono TEXT,
+            Origen TEXT,
+            Fecha_Archivo TEXT,
+            UNIQUE(Nombre, Cliente_Cuenta, Telefono)
+        ) 
+    ''')
+    # Columnas derivadas agregadas después; se crean también en bases de datos existentes
+    existing = {row[1] for row in cursor.execute('PRAGMA table_info(datos)')}
+    for column, column_type in DERIVED_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE datos ADD COLUMN {column} {column_type}')
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS {NOT_INSERTED_TABLE} ({", ".join(f"{field} TEXT" for field in FIELDS)})')
+    if SOURCE_COLUMN not in {row[1] for row in cursor.execute(f'PRAGMA table_info({NOT_INSERTED_TABLE})')}:
+        cursor.execute(f'ALTER TABLE {NOT_INSERTED_TABLE} ADD COLUMN {SOURCE_COLUMN} TEXT')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{NOT_INSERTED_TABLE}_archivo ON {NOT_INSERTED_TABLE} ({SOURCE_COLUMN})')
+    conn.commit()
+
+# Función para crear la base de datos con la tabla datos
+def create_database(db_path):
+    conn = connect(db_path)
+    try:
+        create_schema(conn)
+    finally:
+        conn.close()
+
+# Función para crear los índices secundarios; se llama después de la carga en bloque
+# para no mantenerlos fila por fila durante la primera inserción
+def create_indexes(conn):
+    for name, column in INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON datos ({column})')
+    conn.commit()
+
+# Función para eliminar la base de datos junto con sus archivos WAL
+def delete_database(db_path):
+    os.remove(db_path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+# Función para insertar lotes de registros en bloque. Cada lote se envía una sola vez
+# con un INSERT OR IGNORE (executemany) que clasifica e inserta a la vez: SQLite
+# descarta las claves (Nombre, Cliente_Cuenta, Telefono) que ya existen en datos,
+# incluidas las de los lotes anteriores, y las repetidas dentro del lote después de
+# su primera aparición (las claves con algún NULL nunca se consideran duplicadas).
+# Cada registro lleva rowid = base + su posición en el lote (desde 1), donde base es
+# el mayor rowid de datos antes del lote, así que los rowid nuevos (un rango sobre la
+# llave primaria) indican qué registros se insertaron. Solo si el lote tuvo
+# duplicados, los registros no insertados se escriben en no_insertados.
+# Cada lote puede ser una lista de tuplas o cualquier secuencia que se itere como
+# tuplas en el orden de FIELDS. De los lotes en columnas (lotes.RecordBatch) se
+# toman sus registros para SQLite (fechas ya como texto) y los campos nulos en todo
+# el lote se omiten del INSERT y quedan en NULL: sqlite3 pasa cada parámetro None o
+# datetime por la búsqueda de adaptadores, que cuesta más que guardar el valor.
+# Con archivo, los registros de datos y de no_insertados llevan ese nombre en la
+# columna Archivo (sin archivo la columna también se omite).
+# Devuelve un bytearray con 1 (insertado) o 0 (duplicado) por registro, en el
+# mismo orden en que llegaron.
+def bulk_insert(conn, batches, archivo=None):
+    flags = bytearray()
+    cursor = conn.cursor()
+    try:
+        for batch in batches:
+            if hasattr(batch, 'sql_rows'):
+                null_fields = batch.null_fields()
+                fields = [field for field in FIELDS if field not in null_fields]
+                records = batch.sql_rows(fields)
+            else:
+                fields, records = FIELDS, batch
+            if archivo is None:
+                columns = ', '.join(fields)
+                suffix = ()
+            else:
+                columns = f'{", ".join(fields)}, {SOURCE_COLUMN}'
+                suffix = (archivo,)
+            placeholders = ', '.join('?' for _ in range(len(fields) + len(suffix)))
+            base = cursor.execute('SELECT COALESCE(MAX(rowid), 0) FROM datos').fetchone()[0]
+            rows = [(base + position, *record, *suffix) for position, record in enumerate(records, 1)]
+            cursor.executemany(f'INSERT OR IGNORE INTO datos (rowid, {columns}) VALUES (?, {placeholders})', rows)
+            batch_flags = bytearray(len(rows))
+            for (position,) in cursor.execute('SELECT rowid - ? - 1 FROM datos WHERE rowid > ?', (base, base)):
+                batch_flags[position] = 1
+            if sum(batch_flags) < len(rows):
+                cursor.executemany(f'INSERT INTO {NOT_INSERTED_TABLE} ({columns}) VALUES ({placeholders})',
+                                   (row[1:] for row, flag in zip(rows, batch_flags) if not flag))
+            flags += batch_flags
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    inserted = sum(flags)
+    logging.info(f"Insertados {inserted} registros en la base de datos; {len(flags) - inserted} duplicados.")
+    return flags
+
+# Función para quitar de no_insertados los registros de una carga anterior del mismo
+# archivo. No confirma la transacción: se llama antes de bulk_insert, que la confirma
+# o la revierte junto con la nueva carga.
+def clear_not_inserted(conn, archivo):
+    conn.execute(f'DELETE FROM {NOT_INSERTED_TABLE} WHERE {SOURCE_COLUMN} = ?', (archivo,))
+
+# Consultas
+
+def _query(conn, where, params, order_by='Origen, Cliente_Cuenta, Nombre', limit=None):
+    sql = f'SELECT {", ".join(FIELDS)} FROM datos'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += f' ORDER BY {order_by}'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params = [*params, limit]
+    return pd.read_sql_query(sql, conn, params=params)
+
+# Función para buscar dispositivos por IMEI, ICCID o Telefono (usa los índices de cada campo)
+def find_devices(conn, imei=None, iccid=None, telefono=None, limit=None):
+    where, params = [], []
+    for column, value in (('IMEI', imei), ('ICCID', iccid), ('Telefono', telefono)):
+        if value:
+            where.append(f'{column} = ?')
+            params.append(str(value).strip())
+    if not where:
+        return pd.DataFrame(columns=FIELDS)
+    return _query(conn, where, params, limit=limit)
+
+# Función para listar los dispositivos de un cliente, opcionalmente de una sola plataforma
+def devices_by_client(conn, cliente, origen=None, limit=None):
+    where, params = ['Cliente_Cuenta = ?'], [cliente]
+    if origen:
+        where.append('Origen = ?')
+        params.append(origen)
+    return _query(conn, where, params, limit=limit)
+
+# Función para obtener los clientes distintos, opcionalmente de una sola plataforma
+def list_clients(conn, origen=None):
+    if origen:
+        rows = conn.execute('SELECT DISTINCT Cliente_Cuenta FROM datos WHERE Origen = ? ORDER BY 1', (origen,))
+    else:
+        rows = conn.execute('SELECT DISTINCT Cliente_Cuenta FROM datos ORDER BY 1')
+    return [row[0] for row in rows if row[0] is not None]
+
+# Función para convertir una fecha a segundos desde 1970-01-01, con la misma
+# convención que las columnas <campo>_Epoch (la hora se toma tal cual, sin zona)
+def to_epoch(value):
+    return int((value - datetime(1970, 1, 1)).total_seconds())
+
+# Función para listar los dispositivos sin mensaje ni reporte desde hace `days` días
+# (respecto a `reference`, por defecto ahora). Cada condición es un rango sobre el
+# índice de su columna epoch. Se usa la hora del último mensaje y, si la plataforma
+# no la tiene, la del último reporte.
+def stale_devices(conn, days, reference=None, origen=None, limit=None):
+    limite = to_epoch(reference or datetime.now()) - int(days * 86400)
+    mensaje, reporte = epoch_column('Hora_de_Ultimo_Mensaje'), epoch_column('Ultimo_Reporte')
+    sql = f'''
+        SELECT {", ".join(FIELDS)}, datetime(COALESCE({mensaje}, {reporte}), 'unixepoch') AS Ultimo_Contacto
+        FROM datos
+        WHERE ({mensaje} < ? OR ({mensaje} IS NULL AND {reporte} < ?))
+    '''
+    params = [limite, limite]
+    if origen:
+        sql += ' AND Origen = ?'
+        params.append(origen)
+    sql += ' ORDER BY Ultimo_Contacto'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return pd.read_sql_query(sql, conn, params=params)
+
+# Función para listar los dispositivos activados entre dos fechas (rango sobre el
+# índice de la columna epoch de Fecha_de_Activacion; el límite final es exclusivo)
+def activated_between(conn, start, end, origen=None, limit=None):
+    column = epoch_column('Fecha_de_Activacion')
+    where, params = [f'{column} >= ?', f'{column} < ?'], [to_epoch(start), to_epoch(end)]
+    if origen:
+        where.append('Origen = ?')
+        params.append(origen)
+    return _query(conn, where, params, order_by=column, limit=limit)
+
+# Función para contar los registros de cada plataforma
+def count_by_origin(conn):
+    return dict(conn.execute('SELECT Origen, COUNT(*) FROM datos GROUP BY Origen'))
@@ -0,0 +1,130 @@
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+
+import openpyxl
+
+from procesamiento import default_mappings
+
+# Generador de libros Excel sintéticos con las mismas pestañas y encabezados que
+# default_mappings, para medir el rendimiento con tamaños y tasas de duplicados e
+# inválidos controlados.
+#
+#   python -m benchmarks.generar_libros 100000 --duplicados 0.05 --invalidos 0.02
+
+# Proporción de filas de cada plataforma
+SHEET_SHARES = {'WIALON': 0.5, 'ADAS': 0.25, 'COMBUSTIBLE': 0.25}
+
+CLIENTS = [f'CLIENTE {i:03d}' for i in range(250)]
+DEVICE_TYPES = {
+    'WIALON': ['Teltonika FMB920', 'Teltonika FMC130', 'Queclink GV300', 'Concox GT06N', 'Ruptela FM-Eco4'],
+    'ADAS': ['JC400', 'JC450', 'AD-Plus', 'MDVR 4CH'],
+    'COMBUSTIBLE': ['1 tanque', '2 tanques', '3 tanques'],
+}
+GROUPS = ['Norte', 'Centro', 'Sur', 'Bajío', 'Occidente', 'Foráneas', None]
+SERVICES = ['Rastreo', 'Rastreo, Combustible', 'Combustible', None]
+
+# Encabezados de una pestaña: las columnas de origen del mapeo, sin repetir
+def sheet_headers(sheet):
+    headers = []
+    for field, column in default_mappings[sheet].items():
+        if field in ('Origen', 'Fecha_Archivo') or column is None or column in headers:
+            continue
+        headers.append(column)
+    return headers
+
+def _phone(rng, n):
+    number = 5500000000 + n
+    style = rng.random()
+    if style < 0.4:
+        return number
+    if style < 0.7:
+        return f'+52 {str(number)[:2]} {str(number)[2:6]} {str(number)[6:]}'
+    if style < 0.9:
+        return str(number)
+    return None
+
+def _row_values(rng, sheet, n, base_date):
+    created = base_date - timedelta(days=rng.randint(30, 2000), seconds=rng.randint(0, 86399))
+    last_message = base_date - timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+    return {
+        'Nombre': f'UNIDAD-{n:07d}',
+        'Cliente_Cuenta': rng.choice(CLIENTS),
+        'Tipo_de_Dispositivo': rng.choice(DEVICE_TYPES[sheet]),
+        'IMEI': str(350000000000000 + n) if rng.random() < 0.5 else 350000000000000 + n,
+        'ICCID': f'89520{n:015d}' if rng.random() < 0.95 else None,
+        'Fecha_de_Activacion': created,
+        'Fecha_de_Desactivacion': created + timedelta(days=365) if rng.random() < 0.1 else None,
+        'Hora_de_Ultimo_Mensaje': last_message,
+        'Ultimo_Reporte': last_message.strftime('%d.%m.%Y %H:%M:%S'),
+        'Vehiculo': f'UNIDAD-{n:07d}',
+        'Servicios': rng.choice(SERVICES),
+        'Grupo': rng.choice(GROUPS),
+        'Telefono': _phone(rng, n),
+    }
+
+# Función para generar un libro con el número de filas indicado. duplicate_rate es la
+# fracción de filas que repiten la clave (Nombre, Cuenta, Teléfono) de una fila anterior
+# e invalid_rate la fracción de filas sin la cuenta del cliente.
+def generate_workbook(path, rows, duplicate_rate=0.05, invalid_rate=0.02, seed=0, base_date=None):
+    rng = random.Random(seed)
+    base_date = base_date or datetime(2024, 5, 1, 8, 0, 0)
+    workbook = openpyxl.Workbook(write_only=True)
+    serial = 0
+    for sheet, share in SHEET_SHARES.items():
+        mapping = default_mappings[sheet]
+        headers = sheet_headers(sheet)
+        worksheet = workbook.create_sheet(sheet)
+        worksheet.append(headers)
+        previous = []
+        for _ in range(int(rows * share)):
+            if previous and rng.random() < duplicate_rate:
+                values = dict(rng.choice(previous))
+            else:
+                serial += 1
+                values = _row_values(rng, sheet, serial, base_date)
+                if len(previous) < 10000:
+                    previous.append(values)
+            if rng.random() < invalid_rate:
+                values = dict(values, Cliente_Cuenta=None)
+            row = dict.fromkeys(headers)
+            for field, column in mapping.items():
+                if column in row and row[column] is None:
+                    row[column] = values.get(field)
+            worksheet.append([row[header] for header in headers])
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    workbook.save(path)
+    return path
+
+# Función para exportar cada pestaña de un libro a un .csv por plataforma
+# (<nombre del libro>_<pestaña>.csv en out_dir), como los que entrega el lector csv
+def export_csv(excel_file, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(excel_file))[0]
+    workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.sheetnames:
+            with open(os.path.join(out_dir, f'{stem}_{sheet}.csv'), 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                for row in workbook[sheet].iter_rows(values_only=True):
+                    writer.writerow(['' if value is None else value for value in row])
+    finally:
+        workbook.close()
+    return out_dir
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un libro Excel sintético para pruebas de rendimiento")
+    parser.add_argument('rows', type=int, help="Número total de filas (repartidas entre las pestañas)")
+    parser.add_argument('--salida', default=None, help="Ruta del archivo .xlsx generado")
+    parser.add_argument('--duplicados', type=float, default=0.05, help="Fracción de filas duplicadas")
+    parser.add_argument('--invalidos', type=float, default=0.02, help="Fracción de filas sin cuenta de cliente")
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+    path = args.salida or os.path.join('benchmarks', 'datos', f'2024-05-01_sintetico_{args.rows}.xlsx')
+    generate_workbook(path, args.rows, args.duplicados, args.invalidos, args.semilla)
+    print(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import closing
+from datetime import datetime
+
+import openpyxl
+import pandas as pd
+
+from almacenamiento import FIELDS, bulk_insert, connect, create_indexes, create_schema
+from benchmarks.generar_libros import export_csv, generate_workbook
+from lectores import CSV, available_readers, iter_sheets, resolve_reader
+from lotes import count_records
+from procesamiento import (
+    build_profiles,
+    default_mappings,
+    partition_records,
+    process_excel_file,
+    summarize_by_platform,
+)
+
+# Medición por fases del procesamiento: lectura del libro con cada lector disponible
+# (carga_<lector>; el lector csv lee una copia del libro en un .csv por pestaña),
+# homologación (process_excel_file con el lector predeterminado), inserción en SQLite
+# en bloque (bulk_insert), creación de los índices secundarios, inserción con el bucle
+# original de un INSERT por registro (insercion_bucle, sobre una base vacía, sin
+# índices secundarios y con la misma clasificación de duplicados) y cálculo de
+# estadísticas/perfiles. Cada fase se mide por separado (tiempo de reloj, tiempo de
+# CPU y filas por segundo) y, en una segunda ejecución bajo tracemalloc, su pico de
+# memoria. También se reporta la memoria por millón de registros (contenedores y
+# valores) de los lotes en columnas frente a la lista de tuplas. El resultado se
+# escribe en JSON para comparar entre commits.
+#
+#   python -m benchmarks.medir_fases --tamanos 10000 100000 --salida resultados.json
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DATA_DIR = os.path.join('benchmarks', 'datos')
+
+def _read_workbook(path, reader):
+    rows = 0
+    with closing(iter_sheets(path, list(default_mappings), reader)) as sheets:
+        for _, _, sheet_rows, _ in sheets:
+            for _ in sheet_rows:
+                rows += 1
+    return rows
+
+def _insert(all_data, db_path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    with closing(connect(db_path)) as conn:
+        create_schema(conn)
+        return bulk_insert(conn, all_data)
+
+def _create_indexes(db_path):
+    with closing(connect(db_path)) as conn:
+        create_indexes(conn)
+
+# Inserción original de la interfaz: un INSERT por registro y la excepción de
+# IntegrityError para separar los duplicados. Devuelve la marca de insertado de cada
+# registro, como bulk_insert.
+def _insert_loop(records, db_path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    with closing(connect(db_path)) as conn:
+        create_schema(conn)
+    flags = bytearray(len(records))
+    with closing(sqlite3.connect(db_path)) as conn:
+        cursor = conn.cursor()
+        sql = f'INSERT INTO datos ({", ".join(FIELDS)}) VALUES ({", ".join("?" for _ in FIELDS)})'
+        for position, record in enumerate(records):
+            try:
+                cursor.execute(sql, record)
+                flags[position] = 1
+            except sqlite3.IntegrityError:
+                pass
+        conn.commit()
+    return flags
+
+def _stats(all_data, total_records):
+    df_all, partitions, counts = partition_records(all_data, default_mappings)
+    summarize_by_platform(counts, total_records, default_mappings)
+    return build_profiles(partitions)
+
+# Función para medir una fase: tiempo de reloj y de CPU y, si se pide, el pico de
+# memoria asignada por Python (incluye numpy/pandas) en una segunda ejecución
+def measure(phase, rows, track_memory=True):
+    gc.collect()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    result = phase()
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    metrics = {
+        'wall_s': round(wall, 4),
+        'cpu_s': round(cpu, 4),
+        'rows_per_s': round(rows / wall, 1) if wall > 0 else None,
+    }
+    if track_memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = phase()
+        metrics['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+        tracemalloc.stop()
+    return result, metrics
+
+# Función para sumar el tamaño de los objetos distintos de una secuencia que no se
+# hayan contado antes (un valor compartido por varios registros se cuenta una vez)
+def _values_size(values, seen):
+    total = 0
+    for value in values:
+        if id(value) not in seen:
+            seen.add(id(value))
+            total += sys.getsizeof(value)
+    return total
+
+# Función para medir la memoria de la estructura que guarda los registros
+# homologados, en MB por millón de registros: los lotes en columnas que produce
+# process_excel_file y la lista de tuplas equivalente (la representación anterior).
+# Cada medida incluye los contenedores (arreglos, listas y tuplas) y los valores a
+# los que apuntan, contando una sola vez cada objeto compartido.
+def memory_per_million(all_data):
+    records = count_records(all_data)
+    if not records:
+        return None
+    seen = set()
+    size = 0
+    for batch in all_data:
+        size += batch.nbytes() + _values_size(batch.constants.values(), seen)
+        for _, categories in batch.encoded.values():
+            size += _values_size(categories, seen)
+        for values in batch.values.values():
+            size += _values_size(values, seen)
+    sizes = {'lotes': size}
+    rows = [record for batch in all_data for record in batch]
+    seen = set()
+    sizes['tuplas'] = sys.getsizeof(rows) + sum(sys.getsizeof(record) + _values_size(record, seen) for record in rows)
+    del rows
+    return {name: round(size / 1024 ** 2 / records * 1_000_000, 1) for name, size in sizes.items()}
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Función para ejecutar todas las fases sobre un libro de `size` filas
+def run_size(size, duplicate_rate, invalid_rate, seed, track_memory, work_dir):
+    excel_file = os.path.join(DATA_DIR, f'2024-05-01_sintetico_{size}_d{duplicate_rate}_i{invalid_rate}_s{seed}.xlsx')
+    if not os.path.exists(excel_file):
+        generate_workbook(excel_file, size, duplicate_rate, invalid_rate, seed)
+    phases = {}
+    for reader in available_readers():
+        if reader == CSV:
+            path = export_csv(excel_file, os.path.join(work_dir, f'{os.path.basename(excel_file)[:-5]}_csv'))
+        else:
+            path = excel_file
+        rows, phases[f'carga_{reader}'] = measure(lambda: _read_workbook(path, reader), size, track_memory)
+    (all_data, invalid_data, total_records), phases['homologacion'] = measure(
+        lambda: process_excel_file(excel_file, default_mappings), size, track_memory)
+    db_path = os.path.join(work_dir, f'benchmark_{size}.db')
+    valid_rows = count_records(all_data)
+    flags, phases['insercion'] = measure(lambda: _insert(all_data, db_path), valid_rows, track_memory)
+    _, phases['indices'] = measure(lambda: _create_indexes(db_path), valid_rows, False)
+    records = [record for batch in all_data for record in batch]
+    loop_flags, phases['insercion_bucle'] = measure(lambda: _insert_loop(records, db_path), valid_rows,
+                                                    track_memory)
+    del records
+    _, phases['estadisticas'] = measure(lambda: _stats(all_data, total_records), valid_rows, track_memory)
+    return {
+        'rows': size,
+        'lector': resolve_reader(excel_file),
+        'valid_rows': valid_rows,
+        'invalid_rows': len(invalid_data),
+        'inserted_rows': sum(flags),
+        'insercion_bucle_coincide': loop_flags == flags,
+        'file_bytes': os.path.getsize(excel_file),
+        'mb_por_millon': memory_per_million(all_data),
+        'phases': phases,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el rendimiento de cada fase del procesamiento")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=DEFAULT_SIZES, help="Número de filas por libro")
+    parser.add_argument('--duplicados', type=float, default=0.05, help="Fracción de filas duplicadas")
+    parser.add_argument('--invalidos', type=float, default=0.02, help="Fracción de filas sin cuenta de cliente")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--sin-memoria', action='store_true', help="No medir el pico de memoria (más rápido)")
+    parser.add_argument('--salida', default=None, help="Archivo JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    report = {
+        'commit': _git_commit(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'openpyxl': openpyxl.__version__,
+        'lectores': available_readers(),
+        'parametros': {'duplicados': args.duplicados, 'invalidos': args.invalidos, 'semilla': args.semilla},
+        'resultados': [],
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args.tamanos:
+            result = run_size(size, args.duplicados, args.invalidos, args.semilla, not args.sin_memoria, work_dir)
+            report['resultados'].append(result)
+            print(f"{size} filas: " + ', '.join(f"{name} {metrics['wall_s']:.2f}s" for name, metrics
+                                                 in result['phases'].items())
+                  + f"; MB por millón de registros (contenedores y valores): {result['mb_por_millon']}",
+                  file=sys.stderr)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
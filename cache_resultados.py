@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from lectores import resolve_reader
+from lotes import RecordBatch, count_records, records_frame
+from procesamiento import FIELDS, default_excel_path, ingest_excel_file
+
+# Caché en disco de los resultados de ingesta (registros homologados y clasificación
+# de inserción). Cada entrada es un archivo Parquet; el índice JSON guarda la huella
+# de cada archivo Excel y los conteos, y se usa para desalojar las entradas menos
+# usadas cuando el caché supera MAX_CACHE_BYTES.
+
+CACHE_DIR = os.path.join(default_excel_path, 'cache')
+INDEX_FILE = 'indice.json'
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def _load_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'hashes': {}, 'entries': {}}
+
+# Cada escritura usa su propio archivo temporal, como el registro de vigilancia.py
+def _save_index(cache_dir, index):
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=INDEX_FILE + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(cache_dir, INDEX_FILE))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Lectura, cambio y escritura del índice desde los hilos de un mismo proceso (la
+# interfaz, sus trabajos en segundo plano y la vigilancia). El índice se vuelve a leer
+# dentro del candado, así que los cambios de otro hilo mientras se procesaba un
+# archivo no se pierden.
+_index_lock = threading.Lock()
+
+# Función para calcular el hash SHA-256 del contenido de un archivo
+def file_content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Función para obtener la huella (ruta, tamaño, mtime y hash de contenido) de un archivo.
+# El hash solo se recalcula si cambió el tamaño o la fecha de modificación respecto
+# a la huella guardada en el índice (ver _remember_hash).
+def file_fingerprint(path, index):
+    stat = os.stat(path)
+    path = os.path.abspath(path)
+    known = index['hashes'].get(path)
+    if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        content_hash = known['sha256']
+    else:
+        content_hash = file_content_hash(path)
+    return {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': content_hash}
+
+# Función para guardar en el índice la huella de un archivo
+def _remember_hash(index, fingerprint):
+    index['hashes'][fingerprint['path']] = {key: fingerprint[key] for key in ('size', 'mtime_ns', 'sha256')}
+
+# Función para calcular la firma de los mapeos de las pestañas
+def mappings_digest(mappings):
+    raw = json.dumps(mappings, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+# La clave incluye los mapeos y el lector, que cambian los registros homologados
+# aunque el archivo sea el mismo
+def _cache_key(fingerprint, db_path, mappings, reader):
+    raw = '|'.join([fingerprint['path'], str(fingerprint['size']), str(fingerprint['mtime_ns']),
+                    fingerprint['sha256'], os.path.abspath(db_path), mappings_digest(mappings), reader])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+# Los valores se guardan como texto, igual que en las columnas TEXT de la tabla datos
+def _as_text(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+# Las columnas categóricas de los lotes se escriben como columnas de diccionario de
+# Parquet y se leen de vuelta como un solo lote en columnas
+def _write_entry(path, result):
+    df = records_frame(result['all_data'])
+    for field in FIELDS:
+        df[field] = df[field].map(_as_text)
+    df['Insertado'] = pd.Series(result['flags'], dtype='uint8').astype(bool)
+    df.to_parquet(path, index=False)
+
+def _read_entry(path, entry):
+    df = pd.read_parquet(path)
+    return {
+        'all_data': [RecordBatch.from_frame(df)],
+        'flags': bytearray(df['Insertado'].to_numpy(dtype='uint8').tobytes()),
+        'total_records': entry['total_records'],
+        'invalid_records': entry['invalid_records'],
+        'metricas': entry.get('metricas'),
+        'encabezados': entry.get('encabezados', {}),
+    }
+
+# Función para desalojar las entradas usadas hace más tiempo hasta respetar el tamaño máximo
+def _evict(cache_dir, index, max_bytes):
+    total = sum(entry['bytes'] for entry in index['entries'].values())
+    for key, entry in sorted(index['entries'].items(), key=lambda item: item[1]['last_access']):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, f'{key}.parquet'))
+        except OSError:
+            pass
+        total -= entry['bytes']
+        del index['entries'][key]
+        logging.info(f"Caché: entrada de '{entry['path']}' desalojada")
+
+# Función para obtener el resultado de ingesta de un archivo Excel desde el caché o,
+# si no está, procesarlo e insertarlo en la base de datos y guardarlo en el caché.
+# El resultado guardado corresponde a la corrida que cargó la base de datos, por lo
+# que si la base de datos ya no existe se vuelve a procesar. progress, cancel y
+# reader se pasan a ingest_excel_file. El resultado incluye el hash del contenido del
+# archivo (sha256), para no volver a calcularlo al registrar la carga.
+def load_or_ingest(excel_file, mappings, db_path, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES,
+                   progress=None, cancel=None, reader=None):
+    index = _load_index(cache_dir)
+    fingerprint = file_fingerprint(excel_file, index)
+    key = _cache_key(fingerprint, db_path, mappings, resolve_reader(excel_file, reader))
+    entry_path = os.path.join(cache_dir, f'{key}.parquet')
+    entry = index['entries'].get(key)
+    if entry and os.path.exists(db_path) and os.path.exists(entry_path):
+        try:
+            wall, cpu = time.perf_counter(), time.process_time()
+            result = _read_entry(entry_path, entry)
+        except Exception as e:
+            logging.warning(f"Caché: no se pudo leer la entrada de '{excel_file}': {e}")
+        else:
+            with _index_lock:
+                index = _load_index(cache_dir)
+                _remember_hash(index, fingerprint)
+                if key in index['entries']:
+                    index['entries'][key]['last_access'] = time.time()
+                _save_index(cache_dir, index)
+            logging.info(f"Caché: resultado de '{excel_file}' recuperado")
+            result['sha256'] = fingerprint['sha256']
+            # Las métricas son las de la corrida que cargó la base de datos, más el
+            # tiempo de lectura del caché
+            if result['metricas'] is not None:
+                wall_s = round(time.perf_counter() - wall, 4)
+                rows = count_records(result['all_data'])
+                result['metricas']['phases']['lectura_cache'] = {
+                    'rows': rows,
+                    'wall_s': wall_s,
+                    'cpu_s': round(time.process_time() - cpu, 4),
+                    'rows_per_s': round(rows / wall_s) if wall_s > 0 else None,
+                }
+            return result
+
+    result = ingest_excel_file(excel_file, mappings, db_path, progress, cancel, reader)
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_entry(entry_path, result)
+    entry = {
+        'path': fingerprint['path'],
+        'db_path': os.path.abspath(db_path),
+        'total_records': result['total_records'],
+        'invalid_records': result['invalid_records'],
+        'metricas': result['metricas'],
+        'encabezados': result['encabezados'],
+        'bytes': os.path.getsize(entry_path),
+        'last_access': time.time(),
+    }
+    with _index_lock:
+        index = _load_index(cache_dir)
+        _remember_hash(index, fingerprint)
+        index['entries'][key] = entry
+        _evict(cache_dir, index, max_bytes)
+        _save_index(cache_dir, index)
+    result['sha256'] = fingerprint['sha256']
+    return result
+
+# Función para eliminar del caché los resultados asociados a una base de datos
+def invalidate_database(db_path, cache_dir=CACHE_DIR):
+    db_path = os.path.abspath(db_path)
+    with _index_lock:
+        index = _load_index(cache_dir)
+        for key in [key for key, entry in index['entries'].items() if entry['db_path'] == db_path]:
+            try:
+                os.remove(os.path.join(cache_dir, f'{key}.parquet'))
+            except OSError:
+                pass
+            del index['entries'][key]
+        _save_index(cache_dir, index)
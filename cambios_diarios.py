@@ -0,0 +1,207 @@
+import glob
+import hashlib
+import logging
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from almacenamiento import create_schema
+
+# Registro de cambios entre bases de datos diarias (AAAA-MM-DD.db). Cada registro de
+# datos lleva una huella de sus campos no clave; al comparar con la base del día
+# anterior por la clave (Nombre, Cliente_Cuenta, Telefono) solo se guardan en la
+# tabla cambios las altas, bajas y modificaciones.
+
+KEY_FIELDS = ['Nombre', 'Cliente_Cuenta', 'Telefono']
+
+# Campos que forman la huella. Se excluyen la clave, Fecha_Archivo y las marcas de
+# telemetría (Hora_de_Ultimo_Mensaje, Ultimo_Reporte), que cambian todos los días en
+# los equipos que reportan y harían aparecer a cada uno como modificado.
+FINGERPRINT_FIELDS = [
+    'Tipo_de_Dispositivo', 'IMEI', 'ICCID', 'Fecha_de_Activacion', 'Fecha_de_Desactivacion',
+    'Vehiculo', 'Servicios', 'Grupo', 'Origen'
+]
+
+CHANGE_TYPES = ('alta', 'baja', 'cambio')
+
+# Función para calcular la huella de un registro (se registra como función SQL)
+def fingerprint(*values):
+    raw = '\x1f'.join('\x00' if value is None else str(value) for value in values)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+
+# Agregado SQL con la huella de todos los registros de una misma clave. Las claves
+# con NULL no son únicas en datos, así que la comparación se hace por grupo de clave;
+# el orden de los registros dentro del grupo no afecta el resultado.
+class _GroupFingerprint:
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        self.values.append(value)
+
+    def finalize(self):
+        if len(self.values) == 1:
+            return self.values[0]
+        return fingerprint(*sorted(self.values, key=lambda value: '' if value is None else value))
+
+def _create_change_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cambios (
+            Fecha_Archivo TEXT,
+            Fecha_Anterior TEXT,
+            Tipo TEXT,
+            Nombre TEXT,
+            Cliente_Cuenta TEXT,
+            Telefono TEXT,
+            Origen TEXT,
+            Huella_Anterior TEXT,
+            Huella_Nueva TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_cambios_fecha ON cambios (Fecha_Archivo, Tipo)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS deltas (
+            Fecha_Archivo TEXT,
+            Fecha_Anterior TEXT,
+            Altas INTEGER,
+            Bajas INTEGER,
+            Cambios INTEGER,
+            Calculado TEXT,
+            PRIMARY KEY (Fecha_Archivo, Fecha_Anterior)
+        )
+    ''')
+    # Tamaño y mtime de la base anterior al calcular (columnas agregadas después)
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(deltas)')}
+    for column in ('Tamano_Anterior', 'Mtime_Anterior'):
+        if column not in existing:
+            conn.execute(f'ALTER TABLE deltas ADD COLUMN {column} INTEGER')
+    conn.commit()
+
+# Función para obtener el estado (tamaño y mtime) de una base de datos, contando su
+# archivo -wal, donde quedan los cambios que aún no pasan a la base
+def _database_state(db_path):
+    size, mtime_ns = 0, 0
+    for path in (db_path, db_path + '-wal'):
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            stat = os.stat(path)
+            size += stat.st_size
+            mtime_ns = max(mtime_ns, stat.st_mtime_ns)
+    return size, mtime_ns
+
+# Función para obtener la fecha (AAAA-MM-DD) de una base de datos diaria por su nombre
+def database_date(db_path):
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    try:
+        datetime.strptime(name, '%Y-%m-%d')
+    except ValueError:
+        return None
+    return name
+
+# Función para encontrar la base de datos diaria más reciente anterior a db_path
+def find_previous_database(db_path):
+    current = database_date(db_path)
+    if current is None:
+        return None
+    candidates = []
+    for path in glob.glob(os.path.join(os.path.dirname(os.path.abspath(db_path)), '*.db')):
+        date = database_date(path)
+        if date is not None and date < current:
+            candidates.append((date, path))
+    return max(candidates)[1] if candidates else None
+
+# Función para completar la huella de los registros que aún no la tienen
+def update_fingerprints(conn):
+    conn.create_function('huella', len(FINGERPRINT_FIELDS), fingerprint, deterministic=True)
+    cursor = conn.execute(f'UPDATE datos SET Huella = huella({", ".join(FINGERPRINT_FIELDS)}) WHERE Huella IS NULL')
+    conn.commit()
+    return cursor.rowcount
+
+# Función para calcular los cambios de la base de datos de conn respecto a la del día
+# anterior. Solo se escriben altas, bajas y modificaciones. Si no llegaron registros
+# nuevos desde el último cálculo contra la misma base anterior y esa base no cambió,
+# no se hace nada.
+# Devuelve el conteo por tipo de cambio.
+def compute_delta(conn, db_path, previous_db_path=None):
+    create_schema(conn)
+    _create_change_tables(conn)
+    previous_db_path = previous_db_path or find_previous_database(db_path)
+    if previous_db_path is None:
+        logging.info(f"Sin base de datos anterior para comparar con '{os.path.basename(db_path)}'")
+        return None
+    fecha = database_date(db_path) or datetime.now().strftime('%Y-%m-%d')
+    fecha_anterior = database_date(previous_db_path)
+    updated = update_fingerprints(conn)
+    previous_state = _database_state(previous_db_path)
+    previous = conn.execute('SELECT Altas, Bajas, Cambios, Tamano_Anterior, Mtime_Anterior FROM deltas '
+                            'WHERE Fecha_Archivo = ? AND Fecha_Anterior = ?', (fecha, fecha_anterior)).fetchone()
+    if previous is not None and updated == 0 and tuple(previous[3:]) == previous_state:
+        logging.info(f"Cambios {fecha_anterior} -> {fecha} sin registros nuevos; se conserva el cálculo anterior")
+        return dict(zip(CHANGE_TYPES, previous[:3]))
+
+    conn.execute('ATTACH DATABASE ? AS anterior', (previous_db_path,))
+    try:
+        previous_columns = {row[1] for row in conn.execute('PRAGMA anterior.table_info(datos)')}
+        # La huella de la base anterior se calcula al vuelo si no la tiene: las bases
+        # anteriores a la columna Huella y las cargadas sin registrar cambios
+        huella_calculada = f'huella({", ".join(FINGERPRINT_FIELDS)})'
+        huella_anterior = (f'COALESCE(Huella, {huella_calculada})' if 'Huella' in previous_columns
+                           else huella_calculada)
+        conn.create_aggregate('huella_grupo', 1, _GroupFingerprint)
+        keys = ', '.join(KEY_FIELDS)
+        for table, source, huella in (('delta_hoy', 'main.datos', 'Huella'),
+                                      ('delta_anterior', 'anterior.datos', huella_anterior)):
+            conn.execute(f'DROP TABLE IF EXISTS temp.{table}')
+            conn.execute(f'''
+                CREATE TEMP TABLE {table} AS
+                SELECT {keys}, MIN(Origen) AS Origen, huella_grupo({huella}) AS Huella
+                FROM {source} GROUP BY {keys}
+            ''')
+            conn.execute(f'CREATE INDEX temp.idx_{table} ON {table} ({keys})')
+        same_key = ' AND '.join(f'p.{field} IS t.{field}' for field in KEY_FIELDS)
+        conn.execute('DELETE FROM cambios WHERE Fecha_Archivo = ? AND Fecha_Anterior = ?', (fecha, fecha_anterior))
+        params = {'fecha': fecha, 'anterior': fecha_anterior}
+        conn.execute(f'''
+            INSERT INTO cambios
+            SELECT :fecha, :anterior, 'alta', t.Nombre, t.Cliente_Cuenta, t.Telefono, t.Origen, NULL, t.Huella
+            FROM delta_hoy t
+            WHERE NOT EXISTS (SELECT 1 FROM delta_anterior p WHERE {same_key})
+        ''', params)
+        conn.execute(f'''
+            INSERT INTO cambios
+            SELECT :fecha, :anterior, 'baja', p.Nombre, p.Cliente_Cuenta, p.Telefono, p.Origen, p.Huella, NULL
+            FROM delta_anterior p
+            WHERE NOT EXISTS (SELECT 1 FROM delta_hoy t WHERE {same_key})
+        ''', params)
+        conn.execute(f'''
+            INSERT INTO cambios
+            SELECT :fecha, :anterior, 'cambio', t.Nombre, t.Cliente_Cuenta, t.Telefono, t.Origen, p.Huella, t.Huella
+            FROM delta_hoy t JOIN delta_anterior p ON {same_key}
+            WHERE t.Huella IS NOT p.Huella
+        ''', params)
+        counts = dict.fromkeys(CHANGE_TYPES, 0)
+        counts.update(conn.execute('SELECT Tipo, COUNT(*) FROM cambios WHERE Fecha_Archivo = ? AND Fecha_Anterior = ? '
+                                   'GROUP BY Tipo', (fecha, fecha_anterior)))
+        conn.execute('INSERT OR REPLACE INTO deltas (Fecha_Archivo, Fecha_Anterior, Altas, Bajas, Cambios, '
+                     'Calculado, Tamano_Anterior, Mtime_Anterior) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     (fecha, fecha_anterior, counts['alta'], counts['baja'], counts['cambio'],
+                      datetime.now().isoformat(timespec='seconds'), *previous_state))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('DROP TABLE IF EXISTS temp.delta_hoy')
+        conn.execute('DROP TABLE IF EXISTS temp.delta_anterior')
+        conn.execute('DETACH DATABASE anterior')
+    logging.info(f"Cambios {fecha_anterior} -> {fecha}: {counts}")
+    return counts
+
+# Función para obtener el reporte de cambios de un día (una consulta sobre idx_cambios_fecha)
+def changes_report(conn, fecha, tipo=None):
+    sql = 'SELECT * FROM cambios WHERE Fecha_Archivo = ?'
+    params = [fecha]
+    if tipo:
+        sql += ' AND Tipo = ?'
+        params.append(tipo)
+    return pd.read_sql_query(sql + ' ORDER BY Tipo, Origen, Cliente_Cuenta, Nombre', conn, params=params)
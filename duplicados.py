@@ -0,0 +1,140 @@
+import difflib
+import logging
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import FIELDS
+from unificacion import TELEFONO_DIGITS
+
+# Detección de posibles duplicados. La tabla datos solo descarta duplicados exactos
+# por UNIQUE(Nombre, Cliente_Cuenta, Telefono), así que "ABC-123 " y "abc-123", o un
+# Telefono con y sin lada internacional, cuentan como equipos distintos. Aquí las
+# claves se normalizan (mayúsculas, espacios, acentos, signos y lada) y:
+#   - clave_normalizada: registros con la misma clave normalizada (agrupados con un
+#     índice hash, sin comparar pares);
+#   - nombre_similar: registros del mismo cliente cuyos nombres tienen los mismos
+#     dígitos y son muy parecidos, con el mismo teléfono (o ambos sin teléfono).
+#     Solo se comparan los registros de un mismo bloque (cliente, prefijo del nombre
+#     y dígitos del nombre), y los bloques de más de MAX_BLOCK_SIZE registros se
+#     omiten, así que el costo se mantiene cercano a lineal.
+
+NAME_PREFIX = 3
+MAX_BLOCK_SIZE = 50
+SIMILARITY_THRESHOLD = 0.88
+
+REASONS = ('clave_normalizada', 'nombre_similar')
+
+# Función para normalizar texto: sin acentos, en minúsculas y solo letras y dígitos.
+# En las columnas categóricas se normaliza una vez por categoría.
+def normalize_text(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        categories = normalize_text(pd.Series(column.cat.categories, dtype=object)).to_numpy()
+        return pd.Series(np.append(categories, None)[column.cat.codes.to_numpy()], index=column.index)
+    text = column.where(column.isna(), column.astype(str))
+    text = text.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+    text = text.str.lower().str.replace(r'[^0-9a-z]', '', regex=True)
+    return text.where(text.ne(''), None)
+
+# Función para normalizar teléfonos: solo dígitos (sin el '.0' de los números leídos
+# como flotantes) y, si tienen al menos TELEFONO_DIGITS dígitos, los últimos
+# TELEFONO_DIGITS (sin lada internacional). Los números más cortos se conservan
+# completos para que dos teléfonos cortos distintos no se confundan entre sí ni con
+# un teléfono vacío, que queda como nulo.
+def normalize_phone(column):
+    text = column.where(column.isna(), column.astype(str)).str.replace(r'\.0$', '', regex=True)
+    digits = text.str.replace(r'\D', '', regex=True)
+    digits = digits.where(digits.str.len().lt(TELEFONO_DIGITS).fillna(True), digits.str[-TELEFONO_DIGITS:])
+    return digits.where(digits.ne(''), None)
+
+# Función para calcular las claves normalizadas de un DataFrame con las columnas
+# Nombre, Cliente_Cuenta y Telefono
+def normalized_keys(df):
+    telefono = df['Telefono']
+    if isinstance(telefono.dtype, pd.CategoricalDtype):
+        telefono = telefono.astype(object)
+    keys = pd.DataFrame({
+        'nombre': normalize_text(df['Nombre']),
+        'cliente': normalize_text(df['Cliente_Cuenta']),
+        'telefono': normalize_phone(telefono.where(telefono.notna(), None)),
+    }, index=df.index)
+    keys['digitos'] = keys['nombre'].str.replace(r'\D', '', regex=True)
+    return keys
+
+class _Groups:
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.reasons = {}
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a, b, reason):
+        self.reasons.setdefault(a, set()).add(reason)
+        self.reasons.setdefault(b, set()).add(reason)
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+# Función para comparar dos registros del mismo bloque
+def _similar(nombre_a, nombre_b, telefono_a, telefono_b):
+    if telefono_a != telefono_b:
+        return False
+    matcher = difflib.SequenceMatcher(None, nombre_a, nombre_b, autojunk=False)
+    return matcher.quick_ratio() >= SIMILARITY_THRESHOLD and matcher.ratio() >= SIMILARITY_THRESHOLD
+
+# Función para encontrar los posibles duplicados de un DataFrame de registros.
+# Devuelve los registros que forman parte de algún grupo, con el número de grupo
+# (Grupo_Duplicado) y los motivos, ordenados por grupo.
+def find_near_duplicates(df):
+    keys = normalized_keys(df.reset_index(drop=True))
+    groups = _Groups(len(keys))
+    blocked = 0
+
+    # Misma clave normalizada: un grupo por clave (el Telefono vacío cuenta como un valor
+    # más, distinto de cualquier número).
+    # Solo se agrupan las claves repetidas.
+    exact = keys[keys['nombre'].notna() & keys['cliente'].notna()].fillna({'telefono': ''})
+    key = ['nombre', 'cliente', 'telefono']
+    repeated = exact[exact.duplicated(key, keep=False)]
+    rows = repeated.index.to_numpy()
+    for positions in repeated.groupby(key, sort=False).indices.values():
+        for position in rows[positions[1:]].tolist():
+            groups.union(int(rows[positions[0]]), position, 'clave_normalizada')
+
+    # Nombres parecidos: solo dentro de cada bloque del índice con más de un registro
+    block = ['cliente', 'prefijo', 'digitos']
+    candidates = exact.assign(prefijo=exact['nombre'].str[:NAME_PREFIX])
+    candidates = candidates[candidates.duplicated(block, keep=False)]
+    rows = candidates.index.to_numpy()
+    nombres, telefonos = keys['nombre'].tolist(), keys['telefono'].tolist()
+    for positions in candidates.groupby(block, sort=False).indices.values():
+        if len(positions) > MAX_BLOCK_SIZE:
+            blocked += 1
+            continue
+        members = rows[positions].tolist()
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if groups.find(a) != groups.find(b) and _similar(nombres[a], nombres[b], telefonos[a], telefonos[b]):
+                    groups.union(a, b, 'nombre_similar')
+    if blocked:
+        logging.info(f"Posibles duplicados: {blocked} bloques con más de {MAX_BLOCK_SIZE} registros sin comparar")
+
+    members = sorted(groups.reasons)
+    roots = [groups.find(i) for i in members]
+    numbers = {root: number for number, root in enumerate(dict.fromkeys(roots), 1)}
+    result = df.iloc[members].reset_index(drop=True)
+    result.insert(0, 'Motivo', [', '.join(reason for reason in REASONS if reason in groups.reasons[i])
+                                for i in members])
+    result.insert(0, 'Grupo_Duplicado', [numbers[root] for root in roots])
+    return result.sort_values('Grupo_Duplicado', kind='stable').reset_index(drop=True)
+
+# Función para buscar posibles duplicados entre todos los registros de la base de datos
+def database_near_duplicates(conn):
+    df = pd.read_sql_query(f'SELECT {", ".join(FIELDS)} FROM datos', conn, dtype=object)
+    return find_near_duplicates(df)
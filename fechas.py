@@ -0,0 +1,157 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import DATE_FIELDS, epoch_column
+
+# Normalización de las fechas de la tabla datos. Los campos de fecha llegan como
+# texto con el formato de cada plataforma (el de un datetime de openpyxl, cadenas
+# como '21.04.2024 01:07:00' o números de serie de Excel). Después de cada carga se
+# leen por bloques los registros nuevos, cada columna se convierte de forma
+# vectorizada con el formato detectado para su plataforma y el resultado se guarda
+# en las columnas <campo>_Epoch. Los valores que no corresponden a ningún formato
+# se acumulan en la tabla fechas_no_reconocidas.
+
+# Formatos que se prueban al detectar el de una columna, en orden de preferencia
+# (día antes que mes en las fechas con '/')
+CANDIDATE_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%d',
+    '%d.%m.%Y %H:%M:%S',
+    '%d.%m.%Y %H:%M',
+    '%d.%m.%Y',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d',
+    '%d-%m-%Y %H:%M:%S',
+    '%d-%m-%Y',
+]
+
+# Número de serie de Excel (días desde 1899-12-30) para fechas entre 1954 y 2119
+EXCEL_SERIAL = 'excel'
+EXCEL_SERIAL_RANGE = (20000, 80000)
+
+# Valores que se usan para detectar el formato de una columna
+DETECTION_SAMPLE = 200
+
+# Registros que se normalizan en cada bloque
+NORMALIZE_CHUNK_SIZE = 100000
+
+# Formatos detectados por (Origen, campo). Una columna puede mezclar formatos: si
+# quedan valores sin convertir con los formatos conocidos, se detecta uno más con
+# esos valores y se agrega a la lista.
+_format_cache = {}
+
+def _parse_with(values, fmt):
+    if fmt == EXCEL_SERIAL:
+        numbers = pd.to_numeric(values, errors='coerce')
+        numbers = numbers.where(numbers.between(*EXCEL_SERIAL_RANGE))
+        return pd.to_datetime(numbers, unit='D', origin='1899-12-30', errors='coerce')
+    return pd.to_datetime(values, format=fmt, errors='coerce')
+
+# Función para detectar el formato con el que se convierte la mayor parte de una
+# muestra de valores. Devuelve None si ninguno convierte alguno.
+def detect_format(values):
+    sample = pd.Series(values.drop_duplicates().head(DETECTION_SAMPLE).to_numpy(), dtype=object)
+    best, best_count = None, 0
+    for fmt in CANDIDATE_FORMATS + [EXCEL_SERIAL]:
+        count = int(_parse_with(sample, fmt).notna().sum())
+        if count > best_count:
+            best, best_count = fmt, count
+            if count == len(sample):
+                break
+    return best
+
+# Función para convertir una columna de texto a segundos desde 1970-01-01 con los
+# formatos de (origen, field). Devuelve los segundos (float, NaN donde no hay fecha)
+# y la máscara de valores no vacíos que no se pudieron convertir.
+def parse_dates(values, origen, field):
+    values = values.where(values.isna(), values.astype(str).str.strip())
+    pending = values.notna() & values.ne('')
+    result = pd.Series(np.nan, index=values.index)
+    formats = _format_cache.setdefault((origen, field), [])
+    position = 0
+    while pending.any():
+        if position == len(formats):
+            fmt = detect_format(values[pending])
+            if fmt is None:
+                break
+            formats.append(fmt)
+            logging.info(f"Formato de fecha detectado para {origen}.{field}: {fmt}")
+        parsed = _parse_with(values[pending], formats[position])
+        converted = parsed.notna()
+        if converted.any():
+            seconds = (parsed[converted] - pd.Timestamp(1970, 1, 1)) // pd.Timedelta(seconds=1)
+            result[seconds.index] = seconds.astype(float)
+            pending[seconds.index] = False
+        position += 1
+    return result, pending
+
+def _create_report_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fechas_no_reconocidas (
+            Origen TEXT,
+            Campo TEXT,
+            Valor TEXT,
+            Registros INTEGER,
+            PRIMARY KEY (Origen, Campo, Valor)
+        )
+    ''')
+    conn.execute('CREATE TABLE IF NOT EXISTS fechas_estado (Ultima_Fila INTEGER)')
+
+# Función para normalizar las fechas de los registros cargados desde la última
+# normalización. Devuelve el número de registros revisados y, por campo, cuántos
+# valores no se reconocieron.
+def normalize_dates(conn):
+    _create_report_table(conn)
+    row = conn.execute('SELECT Ultima_Fila FROM fechas_estado').fetchone()
+    last_row = row[0] if row else 0
+    epoch_columns = [epoch_column(field) for field in DATE_FIELDS]
+    update_sql = (f'UPDATE datos SET {", ".join(f"{column} = ?" for column in epoch_columns)} '
+                  'WHERE rowid = ?')
+    sql = f'SELECT rowid AS Fila, Origen, {", ".join(DATE_FIELDS)} FROM datos WHERE rowid > ? ORDER BY rowid'
+    reviewed = 0
+    unrecognized = dict.fromkeys(DATE_FIELDS, 0)
+    try:
+        for chunk in pd.read_sql_query(sql, conn, params=(last_row,), chunksize=NORMALIZE_CHUNK_SIZE, dtype=object):
+            # Sin filas nuevas pandas entrega un solo bloque vacío
+            if chunk.empty:
+                continue
+            epochs = pd.DataFrame(np.nan, index=chunk.index, columns=DATE_FIELDS)
+            for origen, rows in chunk.groupby('Origen', sort=False, dropna=False).groups.items():
+                for field in DATE_FIELDS:
+                    values = chunk.loc[rows, field]
+                    if values.isna().all():
+                        continue
+                    seconds, failed = parse_dates(values, origen, field)
+                    epochs.loc[rows, field] = seconds
+                    if failed.any():
+                        unrecognized[field] += int(failed.sum())
+                        counts = values[failed].astype(str).str.strip().value_counts()
+                        conn.executemany('''
+                            INSERT INTO fechas_no_reconocidas VALUES (?, ?, ?, ?)
+                            ON CONFLICT (Origen, Campo, Valor) DO UPDATE SET Registros = Registros + excluded.Registros
+                        ''', ((origen, field, valor, int(count)) for valor, count in counts.items()))
+            conn.executemany(update_sql, zip(*([None if v != v else int(v) for v in epochs[field].tolist()]
+                                               for field in DATE_FIELDS),
+                                             chunk['Fila'].tolist()))
+            reviewed += len(chunk)
+            last_row = int(chunk['Fila'].iloc[-1])
+        conn.execute('DELETE FROM fechas_estado')
+        conn.execute('INSERT INTO fechas_estado VALUES (?)', (last_row,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if any(unrecognized.values()):
+        logging.warning(f"Fechas no reconocidas en {reviewed} registros revisados: {unrecognized}")
+    return {'reviewed': reviewed, 'unrecognized': unrecognized}
+
+# Función para obtener el reporte de valores de fecha no reconocidos
+def unrecognized_dates_report(conn):
+    _create_report_table(conn)
+    return pd.read_sql_query('SELECT * FROM fechas_no_reconocidas ORDER BY Registros DESC, Origen, Campo', conn)
@@ -0,0 +1,270 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from almacenamiento import DATE_FIELDS, FIELDS, connect, epoch_column, to_epoch
+from cambios_diarios import database_date
+from procesamiento import default_excel_path
+
+# Histórico consolidado de las cargas diarias. Cada base diaria (AAAA-MM-DD.db) se
+# copia en una sola base, historico.db, particionada por Fecha_Archivo: la tabla
+# historico guarda los registros de todas las fechas con un índice que empieza por
+# Fecha_Archivo, y cada fecha se reemplaza completa (DELETE e INSERT de su rango en
+# el índice) cuando se vuelve a consolidar. Junto con cada partición se calcula el
+# resumen diario por Origen, Cliente_Cuenta y Tipo_de_Dispositivo, de modo que las
+# tendencias de varios meses se consultan sobre unos cuantos miles de filas del
+# resumen en lugar de abrir las bases de cada día.
+# La compactación borra el detalle de las fechas con más de DETAIL_DAYS días (su
+# resumen se conserva) y todo lo que tenga más de RETENTION_DAYS días.
+
+HISTORY_FILE = 'historico.db'
+
+# Días de detalle que se conservan; las fechas anteriores solo guardan su resumen
+DETAIL_DAYS = 35
+
+# Días de resumen que se conservan
+RETENTION_DAYS = 400
+
+# Un dispositivo está activo en una fecha si tuvo mensaje (o, sin él, reporte) en los
+# ACTIVE_DAYS días anteriores al final de esa fecha
+ACTIVE_DAYS = 7
+
+# Estados de una partición
+DETAILED = 'detalle'
+COMPACTED = 'compactada'
+
+# Columnas de la tabla historico: los campos de datos y sus fechas normalizadas
+HISTORY_COLUMNS = FIELDS + [epoch_column(field) for field in DATE_FIELDS]
+
+# Métricas del resumen diario
+ROLLUP_METRICS = ['Registros', 'Activos', 'Desactivados']
+
+# Índices del histórico: por fecha (reemplazo y compactación de particiones y
+# consultas de un rango de fechas) y por IMEI para la historia de un equipo
+HISTORY_INDEXES = {
+    'idx_historico_fecha': 'Fecha_Archivo, Origen, Cliente_Cuenta',
+    'idx_historico_imei': 'IMEI, Fecha_Archivo',
+}
+
+# Índices del resumen diario. Incluyen las métricas, así que una tendencia se
+# responde solo con el índice (un rango por fecha, o por plataforma y fecha) sin
+# leer la tabla.
+ROLLUP_INDEXES = {
+    'idx_resumen_fecha': f'Fecha_Archivo, Origen, Cliente_Cuenta, Tipo_de_Dispositivo, {", ".join(ROLLUP_METRICS)}',
+    'idx_resumen_origen': f'Origen, Fecha_Archivo, Cliente_Cuenta, Tipo_de_Dispositivo, {", ".join(ROLLUP_METRICS)}',
+}
+
+# Función para crear las tablas del histórico si no existen
+def create_history_schema(conn):
+    columns = ', '.join(f'{column} {"INTEGER" if column.endswith("_Epoch") else "TEXT"}' for column in HISTORY_COLUMNS)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS historico ({columns})')
+    for name, columns in HISTORY_INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON historico ({columns})')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS resumen_diario (
+            Fecha_Archivo TEXT,
+            Origen TEXT,
+            Cliente_Cuenta TEXT,
+            Tipo_de_Dispositivo TEXT,
+            Registros INTEGER,
+            Activos INTEGER,
+            Desactivados INTEGER
+        )
+    ''')
+    for name, columns in ROLLUP_INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON resumen_diario ({columns})')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS particiones (
+            Fecha_Archivo TEXT PRIMARY KEY,
+            Base TEXT,
+            Registros INTEGER,
+            Estado TEXT,
+            Consolidado TEXT
+        )
+    ''')
+    # Bases diarias ya consolidadas, con el tamaño y mtime que tenían
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bases_consolidadas (
+            Base TEXT PRIMARY KEY,
+            Tamano INTEGER,
+            Mtime_Ns INTEGER,
+            Consolidado TEXT
+        )
+    ''')
+    conn.commit()
+
+# Función para obtener la ruta del histórico de una carpeta de bases diarias
+def history_path(folder=default_excel_path):
+    return os.path.join(folder, HISTORY_FILE)
+
+# Función para abrir el histórico (lo crea si no existe)
+def open_history(path):
+    conn = connect(path)
+    create_history_schema(conn)
+    return conn
+
+# Función para obtener la fecha límite (AAAA-MM-DD) de `days` días antes de la
+# partición más reciente; con ella se compacta, así que el resultado no depende del
+# día en que se corre
+def _cutoff(conn, days):
+    newest = conn.execute('SELECT MAX(Fecha_Archivo) FROM particiones').fetchone()[0]
+    if newest is None:
+        return None
+    return (datetime.strptime(newest, '%Y-%m-%d') - timedelta(days=days)).strftime('%Y-%m-%d')
+
+def _is_date(fecha):
+    try:
+        datetime.strptime(fecha, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return False
+    return True
+
+# Función para calcular el resumen diario de una partición a partir de su detalle
+def _rollup_partition(conn, fecha):
+    limite = to_epoch(datetime.strptime(fecha, '%Y-%m-%d') + timedelta(days=1) - timedelta(days=ACTIVE_DAYS))
+    mensaje, reporte = epoch_column('Hora_de_Ultimo_Mensaje'), epoch_column('Ultimo_Reporte')
+    conn.execute('DELETE FROM resumen_diario WHERE Fecha_Archivo = ?', (fecha,))
+    conn.execute(f'''
+        INSERT INTO resumen_diario
+        SELECT Fecha_Archivo, Origen, Cliente_Cuenta, Tipo_de_Dispositivo, COUNT(*),
+               SUM(COALESCE({mensaje}, {reporte}, 0) >= :limite),
+               SUM(Fecha_de_Desactivacion IS NOT NULL AND TRIM(Fecha_de_Desactivacion) != '')
+        FROM historico
+        WHERE Fecha_Archivo = :fecha
+        GROUP BY Origen, Cliente_Cuenta, Tipo_de_Dispositivo
+    ''', {'fecha': fecha, 'limite': limite})
+
+# Función para copiar al histórico las fechas de una base diaria. Cada Fecha_Archivo
+# de la base reemplaza su partición completa (si dos bases tienen la misma fecha,
+# queda la última consolidada). Las fechas compactadas o fuera de la retención no se
+# vuelven a cargar. Devuelve los registros copiados por fecha.
+def consolidate_database(conn, db_path):
+    db_path = os.path.abspath(db_path)
+    conn.execute('ATTACH DATABASE ? AS diaria', (db_path,))
+    try:
+        existing = {row[1] for row in conn.execute('PRAGMA diaria.table_info(datos)')}
+        if not existing:
+            logging.info(f"'{db_path}' no tiene la tabla datos; no se consolida")
+            return {}
+        # Las bases anteriores a las columnas epoch las dejan vacías en el histórico
+        select = ', '.join(column if column in existing else 'NULL' for column in HISTORY_COLUMNS)
+        compacted = {row[0] for row in conn.execute('SELECT Fecha_Archivo FROM particiones WHERE Estado = ?',
+                                                    (COMPACTED,))}
+        retention = _cutoff(conn, RETENTION_DAYS)
+        copied = {}
+        fechas = [row[0] for row in conn.execute('SELECT DISTINCT Fecha_Archivo FROM diaria.datos')]
+        for fecha in sorted(fecha for fecha in fechas if fecha is not None):
+            if not _is_date(fecha):
+                logging.warning(f"Histórico: Fecha_Archivo no válida en '{db_path}': {fecha}")
+                continue
+            if fecha in compacted or (retention is not None and fecha < retention):
+                logging.info(f"Histórico: la fecha {fecha} ya se compactó o está fuera de la retención; se omite")
+                continue
+            conn.execute('DELETE FROM historico WHERE Fecha_Archivo = ?', (fecha,))
+            cursor = conn.execute(f'INSERT INTO historico ({", ".join(HISTORY_COLUMNS)}) '
+                                  f'SELECT {select} FROM diaria.datos WHERE Fecha_Archivo = ?', (fecha,))
+            _rollup_partition(conn, fecha)
+            copied[fecha] = cursor.rowcount
+            conn.execute('INSERT OR REPLACE INTO particiones VALUES (?, ?, ?, ?, ?)',
+                         (fecha, db_path, cursor.rowcount, DETAILED, datetime.now().isoformat(timespec='seconds')))
+        stat = os.stat(db_path)
+        conn.execute('INSERT OR REPLACE INTO bases_consolidadas VALUES (?, ?, ?, ?)',
+                     (db_path, stat.st_size, stat.st_mtime_ns, datetime.now().isoformat(timespec='seconds')))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('DETACH DATABASE diaria')
+    logging.info(f"Histórico: '{os.path.basename(db_path)}' consolidada ({copied})")
+    return copied
+
+# Función para consolidar las bases diarias de una carpeta que son nuevas o cambiaron
+# (por tamaño o mtime) desde la última consolidación. Una base con registros aún en
+# su archivo -wal siempre se vuelve a consolidar. Devuelve los registros copiados por base.
+def consolidate_folder(conn, folder=default_excel_path):
+    known = {row[0]: row[1:] for row in conn.execute('SELECT Base, Tamano, Mtime_Ns FROM bases_consolidadas')}
+    results = {}
+    for name in sorted(os.listdir(folder)):
+        path = os.path.abspath(os.path.join(folder, name))
+        if not name.endswith('.db') or database_date(path) is None:
+            continue
+        stat = os.stat(path)
+        wal_path = path + '-wal'
+        pending = os.path.exists(wal_path) and os.path.getsize(wal_path) > 0
+        if known.get(path) == (stat.st_size, stat.st_mtime_ns) and not pending:
+            continue
+        results[path] = consolidate_database(conn, path)
+    return results
+
+# Función para compactar el histórico: borra el detalle de las fechas con más de
+# detail_days días y el detalle y el resumen de las que tienen más de retention_days
+# (contados desde la partición más reciente). Las páginas que quedan libres se
+# reutilizan en las siguientes consolidaciones; con vacuum se reescribe la base para
+# devolverlas al disco, lo que toma tiempo proporcional a todo el histórico.
+# Devuelve cuántas particiones se compactaron y cuántas se eliminaron.
+def compact_history(conn, detail_days=DETAIL_DAYS, retention_days=RETENTION_DAYS, vacuum=False):
+    detail_cutoff, retention_cutoff = _cutoff(conn, detail_days), _cutoff(conn, retention_days)
+    if detail_cutoff is None:
+        return {'compactadas': 0, 'eliminadas': 0}
+    try:
+        expired = [row[0] for row in conn.execute('SELECT Fecha_Archivo FROM particiones WHERE Fecha_Archivo < ?',
+                                                  (retention_cutoff,))]
+        conn.execute('DELETE FROM historico WHERE Fecha_Archivo < ?', (retention_cutoff,))
+        conn.execute('DELETE FROM resumen_diario WHERE Fecha_Archivo < ?', (retention_cutoff,))
+        conn.execute('DELETE FROM particiones WHERE Fecha_Archivo < ?', (retention_cutoff,))
+        compacted = [row[0] for row in conn.execute(
+            'SELECT Fecha_Archivo FROM particiones WHERE Fecha_Archivo < ? AND Estado = ?', (detail_cutoff, DETAILED))]
+        conn.execute('DELETE FROM historico WHERE Fecha_Archivo < ?', (detail_cutoff,))
+        conn.execute('UPDATE particiones SET Estado = ? WHERE Fecha_Archivo < ?', (COMPACTED, detail_cutoff))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if vacuum:
+        conn.execute('VACUUM')
+    conn.execute('PRAGMA optimize')
+    logging.info(f"Histórico compactado: {len(compacted)} fechas compactadas, {len(expired)} eliminadas")
+    return {'compactadas': len(compacted), 'eliminadas': len(expired)}
+
+# Función para obtener el rango de fechas del histórico (None, None si está vacío)
+def history_range(conn):
+    return conn.execute('SELECT MIN(Fecha_Archivo), MAX(Fecha_Archivo) FROM particiones').fetchone()
+
+# Función para listar las particiones del histórico
+def partitions_report(conn):
+    return pd.read_sql_query('SELECT * FROM particiones ORDER BY Fecha_Archivo DESC', conn)
+
+# Función para consultar la tendencia de una métrica del resumen diario entre dos
+# fechas (AAAA-MM-DD, ambas incluidas), sumada por fecha y por `group_by` (una
+# columna del resumen o None para el total). Es un rango sobre el índice del resumen.
+def trend(conn, start, end, metric='Activos', origen=None, clientes=None, group_by='Cliente_Cuenta'):
+    if metric not in ROLLUP_METRICS:
+        raise ValueError(f"Métrica no válida: {metric}")
+    where, params = ['Fecha_Archivo >= ?', 'Fecha_Archivo <= ?'], [start, end]
+    if origen:
+        where.append('Origen = ?')
+        params.append(origen)
+    if clientes:
+        where.append(f'Cliente_Cuenta IN ({", ".join("?" for _ in clientes)})')
+        params.extend(clientes)
+    keys = 'Fecha_Archivo' + (f', {group_by}' if group_by else '')
+    sql = (f'SELECT {keys}, SUM({metric}) AS {metric} FROM resumen_diario WHERE {" AND ".join(where)} '
+           f'GROUP BY {keys} ORDER BY {keys}')
+    return pd.read_sql_query(sql, conn, params=params)
+
+# Función para listar los clientes del resumen, opcionalmente de una sola plataforma
+def history_clients(conn, origen=None):
+    sql = 'SELECT DISTINCT Cliente_Cuenta FROM resumen_diario WHERE Cliente_Cuenta IS NOT NULL'
+    params = []
+    if origen:
+        sql += ' AND Origen = ?'
+        params.append(origen)
+    return [row[0] for row in conn.execute(sql + ' ORDER BY 1', params)]
+
+# Función para obtener la historia de un equipo por IMEI en el detalle del histórico
+def device_history(conn, imei):
+    return pd.read_sql_query(f'SELECT {", ".join(FIELDS)} FROM historico WHERE IMEI = ? ORDER BY Fecha_Archivo',
+                             conn, params=[str(imei).strip()])
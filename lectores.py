@@ -0,0 +1,313 @@
+import csv
+import logging
+import os
+import re
+import zipfile
+from datetime import date, datetime
+from xml.etree import ElementTree
+
+import openpyxl
+
+# python-calamine es opcional: si no está instalado, los .xlsx se leen con openpyxl
+try:
+    import python_calamine
+except ImportError:
+    python_calamine = None
+
+# Lectores de los archivos de entrada. Cada lector entrega, por cada pestaña con
+# mapeo, su nombre, los encabezados, un iterador de filas (tuplas con los valores de
+# las celdas, None en las vacías) y las filas que declara el archivo (None si no se
+# conocen). iter_excel_batches homologa esas filas igual sin importar el lector, así
+# que todos producen los mismos lotes en columnas.
+#   - openpyxl: lectura en streaming del .xlsx (modo solo lectura);
+#   - calamine: lector nativo de python-calamine, más rápido pero carga cada pestaña
+#     completa en memoria; los valores se ajustan a los tipos que entrega openpyxl
+#     (enteros, datetime y None). Los textos con espacios al inicio o al final
+#     (incluidos los de solo espacios, que cambian la clave de un registro) llegan
+#     igual que en openpyxl cuando el libro los guarda con xml:space="preserve", como
+#     lo hacen Excel, LibreOffice, openpyxl y xlsxwriter. Sin ese atributo calamine
+#     los recorta, así que los libros con textos compartidos así se leen con openpyxl;
+#   - csv: un archivo .csv por plataforma, cuyo nombre termina con la pestaña de
+#     default_mappings (por ejemplo 2024-05-01_WIALON.csv), o una carpeta con ellos.
+#     Los valores llegan como texto, así que una cuenta '0' no se descarta como el
+#     número 0 de un .xlsx.
+
+OPENPYXL = 'openpyxl'
+CALAMINE = 'calamine'
+CSV = 'csv'
+
+# Lectores de .xlsx en orden de preferencia cuando no se indica uno. calamine solo se
+# prefiere cuando el resultado completo queda en memoria de todos modos; la carga en
+# streaming (sin retener los registros) usa openpyxl, cuya memoria no crece con el
+# tamaño del libro.
+XLSX_READERS = [CALAMINE, OPENPYXL]
+STREAMING_XLSX_READERS = [OPENPYXL]
+
+# Delimitadores que se prueban en los .csv
+CSV_DELIMITERS = ',;\t|'
+CSV_SNIFF_BYTES = 64 * 1024
+
+def _iter_openpyxl(path, sheet_names):
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet_name in workbook.sheetnames:
+            if sheet_name not in sheet_names:
+                continue
+            worksheet = workbook[sheet_name]
+            expected_rows = worksheet.max_row - 1 if worksheet.max_row else None
+            rows = worksheet.iter_rows(values_only=True)
+            headers = next(rows, None)
+            if headers is not None:
+                yield sheet_name, headers, rows, expected_rows
+    finally:
+        workbook.close()
+
+# openpyxl entrega los números sin decimales como enteros, las fechas como datetime y
+# None en las celdas vacías; calamine, float, date y ''
+def _calamine_value(value):
+    value_type = type(value)
+    if value_type is float:
+        return int(value) if value.is_integer() else value
+    if value_type is str:
+        return value if value else None
+    if value_type is date:
+        return datetime(value.year, value.month, value.day)
+    return value
+
+def _calamine_rows(rows):
+    for row in rows:
+        yield tuple(_calamine_value(value) for value in row)
+
+# Textos compartidos sin xml:space="preserve" que empiezan o terminan con espacios
+UNPRESERVED_BLANKS = re.compile(rb'<t>(?:\s[^<]*|[^<]*\s)</t>')
+SHARED_STRINGS = 'xl/sharedStrings.xml'
+SCAN_CHUNK_BYTES = 16 * 1024 * 1024
+SCAN_OVERLAP_BYTES = 1024
+
+# Función para saber si un .xlsx tiene textos compartidos que calamine recortaría.
+# Solo se revisa la tabla de textos compartidos (un texto por valor distinto, sin
+# descomprimir las pestañas): los textos en línea de las pestañas los escriben con
+# xml:space="preserve" los generadores que los usan, y calamine los entrega completos.
+# El XML se revisa por bloques, sin interpretarlo.
+def has_blank_strings(path):
+    with zipfile.ZipFile(path) as archive:
+        if SHARED_STRINGS not in archive.namelist():
+            return False
+        with archive.open(SHARED_STRINGS) as f:
+            tail = b''
+            for chunk in iter(lambda: f.read(SCAN_CHUNK_BYTES), b''):
+                if UNPRESERVED_BLANKS.search(tail + chunk):
+                    return True
+                tail = chunk[-SCAN_OVERLAP_BYTES:]
+    return False
+
+def _iter_calamine(path, sheet_names):
+    workbook = python_calamine.CalamineWorkbook.from_path(path)
+    try:
+        for sheet_name in workbook.sheet_names:
+            if sheet_name not in sheet_names:
+                continue
+            sheet = workbook.get_sheet_by_name(sheet_name)
+            rows = _calamine_rows(sheet.iter_rows())
+            headers = next(rows, None)
+            if headers is not None:
+                yield sheet_name, headers, rows, sheet.height - 1
+    finally:
+        workbook.close()
+
+# Función para obtener la pestaña de default_mappings a la que corresponde un .csv
+# (la que coincide con el final de su nombre, sin distinguir mayúsculas)
+def csv_sheet_name(path, sheet_names):
+    stem = os.path.splitext(os.path.basename(path))[0].upper()
+    matches = [name for name in sheet_names if stem == name.upper() or stem.endswith('_' + name.upper())]
+    return max(matches, key=len) if matches else None
+
+def _csv_rows(reader):
+    for row in reader:
+        yield tuple(value if value else None for value in row)
+
+# Archivos .csv de una ruta (el archivo mismo o los de la carpeta)
+def _csv_files(path):
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith('.csv')]
+    return [path]
+
+def _iter_csv(path, sheet_names):
+    by_sheet = {}
+    for csv_path in _csv_files(path):
+        sheet_name = csv_sheet_name(csv_path, sheet_names)
+        if sheet_name is None:
+            logging.info(f"Se omite '{csv_path}': no corresponde a ninguna pestaña del mapeo")
+        else:
+            by_sheet.setdefault(sheet_name, csv_path)
+    # Las plataformas se leen en el orden de los mapeos, como las pestañas de un libro
+    for sheet_name in sheet_names:
+        if sheet_name not in by_sheet:
+            continue
+        with open(by_sheet[sheet_name], newline='', encoding='utf-8-sig') as f:
+            try:
+                dialect = csv.Sniffer().sniff(f.read(CSV_SNIFF_BYTES), delimiters=CSV_DELIMITERS)
+            except csv.Error:
+                dialect = csv.excel
+            f.seek(0)
+            reader = csv.reader(f, dialect)
+            headers = next(reader, None)
+            if headers is not None:
+                yield sheet_name, tuple(headers), _csv_rows(reader), None
+
+def _sheets_openpyxl(path):
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+def _sheets_calamine(path):
+    workbook = python_calamine.CalamineWorkbook.from_path(path)
+    try:
+        return workbook.sheet_names
+    finally:
+        workbook.close()
+
+READERS = {
+    OPENPYXL: _iter_openpyxl,
+    CALAMINE: _iter_calamine,
+    CSV: _iter_csv,
+}
+
+# Función para listar los lectores que se pueden usar en esta máquina
+def available_readers():
+    return [name for name in READERS if name != CALAMINE or python_calamine is not None]
+
+# Función para elegir el lector de un archivo: csv para los .csv y las carpetas; para
+# los .xlsx, el indicado o el primero disponible de XLSX_READERS (de
+# STREAMING_XLSX_READERS con streaming). Si el indicado no está instalado se usa
+# openpyxl.
+def resolve_reader(path, reader=None, streaming=False):
+    if os.path.isdir(path) or path.lower().endswith('.csv'):
+        return CSV
+    if reader is None:
+        preferred = STREAMING_XLSX_READERS if streaming else XLSX_READERS
+        return next(name for name in preferred if name in available_readers())
+    if reader not in READERS or reader == CSV:
+        raise ValueError(f"Lector no válido para '{path}': {reader}")
+    if reader not in available_readers():
+        logging.warning(f"El lector {reader} no está instalado; se usa {OPENPYXL}")
+        return OPENPYXL
+    return reader
+
+# Espacios de nombres del XML de un .xlsx
+XLSX_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+XLSX_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+XLSX_PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# Función para obtener la ruta dentro del .xlsx del XML de cada pestaña
+def _xlsx_sheet_paths(archive):
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    relations = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in relations.iter(f'{XLSX_PACKAGE_REL_NS}Relationship')}
+    paths = {}
+    for sheet in workbook.iter(f'{XLSX_MAIN_NS}sheet'):
+        target = targets.get(sheet.get(f'{XLSX_REL_NS}id'), '')
+        paths[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+    return paths
+
+# Función para obtener el índice (desde 0) de la columna de una referencia como 'AB1'
+def _column_index(reference):
+    index = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - ord('A') + 1
+    return index - 1
+
+def _xlsx_text(element):
+    return ''.join(node.text or '' for node in element.iter(f'{XLSX_MAIN_NS}t'))
+
+# Función para leer la primera fila del XML de una pestaña. Las celdas de texto
+# compartido quedan como ('s', índice) hasta resolverlas.
+def _xlsx_first_row(archive, sheet_path):
+    cells = {}
+    with archive.open(sheet_path) as f:
+        for event, element in ElementTree.iterparse(f, events=('end',)):
+            if element.tag == f'{XLSX_MAIN_NS}c':
+                cell_type, value = element.get('t'), element.find(f'{XLSX_MAIN_NS}v')
+                if cell_type == 'inlineStr':
+                    cells[_column_index(element.get('r', ''))] = _xlsx_text(element)
+                elif value is not None and value.text is not None:
+                    if cell_type == 's':
+                        cells[_column_index(element.get('r', ''))] = ('s', int(value.text))
+                    elif cell_type in ('str', 'e'):
+                        cells[_column_index(element.get('r', ''))] = value.text
+                    else:
+                        number = float(value.text)
+                        cells[_column_index(element.get('r', ''))] = int(number) if number.is_integer() else number
+            elif element.tag == f'{XLSX_MAIN_NS}row':
+                break
+    return cells
+
+# Función para leer los textos compartidos del .xlsx hasta el índice `last`
+def _xlsx_shared_strings(archive, last):
+    strings = []
+    if last < 0 or 'xl/sharedStrings.xml' not in archive.namelist():
+        return strings
+    with archive.open('xl/sharedStrings.xml') as f:
+        for event, element in ElementTree.iterparse(f, events=('end',)):
+            if element.tag == f'{XLSX_MAIN_NS}si':
+                strings.append(_xlsx_text(element))
+                element.clear()
+                if len(strings) > last:
+                    break
+    return strings
+
+def _xlsx_headers(path, sheet_names):
+    with zipfile.ZipFile(path) as archive:
+        rows = {name: _xlsx_first_row(archive, sheet_path)
+                for name, sheet_path in _xlsx_sheet_paths(archive).items() if name in sheet_names}
+        shared = [value[1] for cells in rows.values() for value in cells.values() if isinstance(value, tuple)]
+        strings = _xlsx_shared_strings(archive, max(shared, default=-1))
+    headers = {}
+    for name, cells in rows.items():
+        values = [None] * (max(cells) + 1 if cells else 0)
+        for index, value in cells.items():
+            if isinstance(value, tuple):
+                value = strings[value[1]] if value[1] < len(strings) else None
+            # Igual que en los lectores, un texto vacío es una celda vacía
+            values[index] = value if value != '' else None
+        headers[name] = tuple(values)
+    return headers
+
+def _csv_headers(path, sheet_names):
+    headers = {}
+    for sheet_name, sheet_headers, _rows, _expected in _iter_csv(path, sheet_names):
+        headers[sheet_name] = sheet_headers
+    return headers
+
+# Función para leer solo los encabezados de las pestañas de `sheet_names` que tiene
+# un archivo, sin leer sus filas. En los .xlsx se lee directamente la primera fila
+# del XML de cada pestaña y los textos compartidos que usa, que suelen ser los
+# primeros del archivo, así que no depende del tamaño del exporte ni del lector.
+# Devuelve {pestaña: encabezados} en el orden del archivo.
+def read_headers(path, sheet_names, reader=None):
+    if resolve_reader(path, reader) == CSV:
+        return _csv_headers(path, sheet_names)
+    return _xlsx_headers(path, sheet_names)
+
+# Función para listar, en el orden del archivo, las pestañas de `sheet_names` que
+# contiene (sin leer sus filas)
+def list_sheets(path, sheet_names, reader=None):
+    reader = resolve_reader(path, reader)
+    if reader == CSV:
+        found = {csv_sheet_name(csv_path, sheet_names) for csv_path in _csv_files(path)}
+        return [name for name in sheet_names if name in found]
+    names = _sheets_calamine(path) if reader == CALAMINE else _sheets_openpyxl(path)
+    return [name for name in names if name in sheet_names]
+
+# Función para leer las pestañas de un archivo que están en `sheet_names`, en el
+# orden del archivo. Entrega (pestaña, encabezados, filas, filas declaradas).
+def iter_sheets(path, sheet_names, reader=None):
+    reader = resolve_reader(path, reader)
+    if reader == CALAMINE and has_blank_strings(path):
+        logging.info(f"'{path}' tiene textos compartidos con espacios sin preservar; se lee con {OPENPYXL}")
+        reader = OPENPYXL
+    return READERS[reader](path, sheet_names)
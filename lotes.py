@@ -0,0 +1,156 @@
+import itertools
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import DATE_FIELDS, FIELDS
+
+# Representación en columnas de los registros homologados. En lugar de una tupla de
+# 15 valores por registro, cada lote guarda una columna por campo:
+#   - los campos constantes en el lote (Origen, Fecha_Archivo y los campos sin mapeo
+#     en la pestaña) se guardan una sola vez;
+#   - los campos de pocos valores distintos (ENCODED_FIELDS) se guardan como códigos
+#     enteros más la lista de valores (codificación por diccionario);
+#   - el resto, como un arreglo de objetos.
+# Los lotes se pueden iterar como tuplas en el orden de FIELDS (lo que espera el
+# escritor de SQLite) y se convierten a un DataFrame con columnas categóricas para
+# la interfaz y la exportación a CSV.
+
+ENCODED_FIELDS = ['Cliente_Cuenta', 'Tipo_de_Dispositivo', 'Servicios', 'Grupo']
+
+# Función para codificar una columna por diccionario. Los códigos son -1 para los
+# valores nulos y se guardan con el entero más pequeño que alcance.
+def encode_column(values):
+    codes, categories = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    dtype = np.int8 if len(categories) < 127 else np.int16 if len(categories) < 32767 else np.int32
+    return codes.astype(dtype), np.asarray(categories, dtype=object)
+
+# Función para decodificar una columna: un arreglo de objetos con None en los nulos
+def decode_column(codes, categories):
+    return np.append(categories, None)[codes]
+
+class RecordBatch:
+    __slots__ = ('length', 'constants', 'encoded', 'values')
+
+    def __init__(self, length, constants, encoded, values):
+        self.length = length
+        self.constants = constants
+        self.encoded = encoded
+        self.values = values
+
+    # Construye un lote a partir de un DataFrame con las columnas FIELDS. Los campos
+    # de `constants` toman ese valor en todo el lote; las columnas categóricas se
+    # conservan con sus códigos.
+    @classmethod
+    def from_frame(cls, frame, constants=None):
+        constants = dict(constants or {})
+        encoded, values = {}, {}
+        for field in FIELDS:
+            if field in constants:
+                continue
+            column = frame[field]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                encoded[field] = (column.cat.codes.to_numpy(), np.asarray(column.cat.categories, dtype=object))
+            elif field in ENCODED_FIELDS:
+                encoded[field] = encode_column(column)
+            else:
+                values[field] = column.to_numpy(dtype=object)
+        return cls(len(frame), constants, encoded, values)
+
+    def __len__(self):
+        return self.length
+
+    # Columna completa de un campo como arreglo de objetos
+    def column(self, field):
+        if field in self.constants:
+            return np.full(self.length, self.constants[field], dtype=object)
+        if field in self.encoded:
+            return decode_column(*self.encoded[field])
+        return self.values[field]
+
+    # Campos nulos en todo el lote (los que la pestaña no mapea)
+    def null_fields(self):
+        return [field for field, value in self.constants.items() if value is None]
+
+    # Columnas de los campos indicados para iterar como tuplas (las constantes no se
+    # copian)
+    def _columns(self, fields):
+        columns = []
+        for field in fields:
+            if field in self.constants:
+                columns.append(itertools.repeat(self.constants[field], self.length))
+            else:
+                columns.append(self.column(field).tolist())
+        return columns
+
+    # Registros como tuplas en el orden de FIELDS
+    def __iter__(self):
+        return zip(*self._columns(FIELDS))
+
+    # Registros para el escritor de SQLite con los campos indicados, en ese orden. Las
+    # fechas (datetime) de los campos de fecha van ya como el texto que guarda sqlite3
+    # (isoformat con espacio): convertirlas columna por columna cuesta menos que pasar
+    # cada valor por el adaptador de sqlite3.
+    def sql_rows(self, fields):
+        columns = self._columns(fields)
+        for position, field in enumerate(fields):
+            if field in DATE_FIELDS and field not in self.constants:
+                columns[position] = [value.isoformat(' ') if type(value) is datetime else value
+                                     for value in columns[position]]
+        return zip(*columns)
+
+    # Bytes que ocupan los arreglos del lote (sin contar los objetos a los que apuntan)
+    def nbytes(self):
+        total = 0
+        for codes, categories in self.encoded.values():
+            total += codes.nbytes + categories.nbytes
+        for values in self.values.values():
+            total += values.nbytes
+        return total
+
+# Función para contar los registros de una lista de lotes
+def count_records(batches):
+    return sum(len(batch) for batch in batches)
+
+# Las categorías del DataFrame son texto, como en las columnas TEXT de la tabla datos
+# (una columna categórica con números y texto mezclados no se puede mostrar en
+# Streamlit)
+def _category(value):
+    return value if isinstance(value, str) else str(value)
+
+# Función para unir una lista de lotes en un DataFrame con las columnas FIELDS. Los
+# campos codificados y los que son constantes en todos los lotes (Origen,
+# Fecha_Archivo) quedan como columnas categóricas con la unión de sus valores; el
+# resto, como columnas de objetos.
+def records_frame(batches):
+    total = count_records(batches)
+    columns = {}
+    for field in FIELDS:
+        categorical = field in ENCODED_FIELDS or all(field in batch.constants for batch in batches)
+        if not categorical:
+            # Como Series de objetos para que pandas no convierta las fechas a datetime64
+            columns[field] = pd.Series(np.concatenate([batch.column(field) for batch in batches]), dtype=object)
+            continue
+        positions = {}
+        codes = np.empty(total, dtype=np.int32)
+        start = 0
+        for batch in batches:
+            stop = start + len(batch)
+            if field in batch.constants:
+                value = batch.constants[field]
+                if value is None:
+                    codes[start:stop] = -1
+                else:
+                    codes[start:stop] = positions.setdefault(_category(value), len(positions))
+            else:
+                if field in batch.encoded:
+                    local_codes, local_categories = batch.encoded[field]
+                else:
+                    local_codes, local_categories = encode_column(batch.values[field])
+                mapping = np.array([positions.setdefault(_category(value), len(positions))
+                                    for value in local_categories] + [-1], dtype=np.int32)
+                codes[start:stop] = mapping[local_codes]
+            start = stop
+        columns[field] = pd.Categorical.from_codes(codes, categories=pd.Index(list(positions), dtype=object))
+    return pd.DataFrame(columns, columns=FIELDS)
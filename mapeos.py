@@ -0,0 +1,191 @@
+import difflib
+import hashlib
+import logging
+import re
+import unicodedata
+
+from almacenamiento import FIELDS
+from lectores import read_headers
+
+# Compilador de mapeos. Cada mapeo de default_mappings nombra la columna de origen de
+# cada campo; al compilarlo contra la fila de encabezados real de una pestaña se
+# resuelve cada nombre a un índice de columna: primero por el texto exacto, después
+# por el texto normalizado (sin acentos, mayúsculas ni espacios de más) y por último
+# por similitud con difflib. El resultado es el plan de extracción de la pestaña
+# (índice de columna por campo) junto con el reporte de cómo se resolvió cada campo.
+# Los planes se guardan en memoria por la firma de los encabezados y del mapeo, así
+# que los exportes con el mismo formato no se vuelven a resolver. check_headers lee
+# solo los encabezados de un archivo, de modo que las diferencias se reportan antes
+# de leer cualquier fila.
+
+# Campos que no vienen de una columna (se llenan con constantes en la homologación)
+CONSTANT_FIELDS = ('Origen', 'Fecha_Archivo')
+
+# Campos sin los que todos los registros de la pestaña son inválidos
+REQUIRED_FIELDS = ('Cliente_Cuenta',)
+
+# Similitud mínima (entre textos normalizados) para aceptar un encabezado parecido
+HEADER_SIMILARITY = 0.85
+
+# Similitud mínima para sugerir un encabezado a un campo que no se encontró
+SUGGESTION_SIMILARITY = 0.6
+
+# Planes que se conservan en memoria (se descartan los más antiguos)
+MAX_CACHED_PLANS = 64
+
+# Forma en que se resolvió cada campo
+EXACT = 'exacto'
+NORMALIZED = 'normalizado'
+APPROXIMATE = 'aproximado'
+MISSING = 'faltante'
+
+_plans = {}
+
+# Función para normalizar un encabezado: sin acentos, en minúsculas y con las letras
+# y dígitos separados por un solo espacio
+def normalize_header(value):
+    if value is None:
+        return ''
+    text = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', text.lower()).split())
+
+# Los encabezados vacíos al final de la fila no cambian el plan
+def _trim_headers(headers):
+    headers = list(headers)
+    while headers and headers[-1] is None:
+        headers.pop()
+    return headers
+
+# Función para calcular la firma de una pestaña: su nombre, sus encabezados y el mapeo
+def header_signature(sheet_name, headers, mapping):
+    raw = '\x1e'.join([
+        str(sheet_name),
+        '\x1f'.join('\x00' if header is None else str(header) for header in _trim_headers(headers)),
+        '\x1f'.join(f'{field}={mapping.get(field)}' for field in FIELDS),
+    ])
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+def _similarity(a, b):
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+# Plan de extracción de una pestaña: `indices` tiene, por cada campo de FIELDS, el
+# índice de su columna de origen (None si no tiene), y `report` una fila por campo
+# mapeado con el encabezado esperado, el encontrado y la forma en que se resolvió
+class MappingPlan:
+    def __init__(self, sheet_name, indices, report):
+        self.sheet_name = sheet_name
+        self.indices = indices
+        self.report = report
+
+    # Campos que no se resolvieron por el texto exacto
+    def issues(self):
+        return [row for row in self.report if row['Resolución'] != EXACT]
+
+    # Campos requeridos sin columna de origen (todos los registros serían inválidos)
+    def missing_required(self):
+        return [row['Campo'] for row in self.report
+                if row['Resolución'] == MISSING and row['Campo'] in REQUIRED_FIELDS]
+
+def _compile(sheet_name, headers, mapping):
+    # Con encabezados repetidos gana la última columna, igual que al armar el
+    # diccionario de cada fila con dict(zip(encabezados, fila))
+    exact, normalized = {}, {}
+    for idx, header in enumerate(headers):
+        if header is None:
+            continue
+        exact[header] = idx
+        key = normalize_header(header)
+        if key:
+            normalized[key] = idx
+    # Cada nombre esperado se resuelve una vez aunque lo usen varios campos (en
+    # COMBUSTIBLE, Nombre y Vehiculo salen de la misma columna)
+    expected = list(dict.fromkeys(mapping[field] for field in FIELDS
+                                  if field not in CONSTANT_FIELDS and mapping.get(field)))
+    resolved = {}
+    for name in expected:
+        if name in exact:
+            resolved[name] = (exact[name], EXACT, 1.0)
+        elif normalize_header(name) in normalized:
+            resolved[name] = (normalized[normalize_header(name)], NORMALIZED, 1.0)
+    # Los nombres que faltan toman, de mayor a menor similitud, las columnas que
+    # ningún otro nombre usa
+    used = {idx for idx, _, _ in resolved.values()}
+    candidates = sorted(((_similarity(normalize_header(name), key), name, idx)
+                         for name in expected if name not in resolved
+                         for key, idx in normalized.items() if idx not in used), reverse=True)
+    for score, name, idx in candidates:
+        if score < HEADER_SIMILARITY:
+            break
+        if name not in resolved and idx not in used:
+            resolved[name] = (idx, APPROXIMATE, round(score, 3))
+            used.add(idx)
+
+    indices, report = [], []
+    for field in FIELDS:
+        name = None if field in CONSTANT_FIELDS else mapping.get(field)
+        if not name:
+            indices.append(None)
+            continue
+        idx, resolution, score = resolved.get(name, (None, MISSING, None))
+        suggestion = None
+        if idx is None:
+            matches = difflib.get_close_matches(normalize_header(name), list(normalized), n=1,
+                                                cutoff=SUGGESTION_SIMILARITY)
+            suggestion = headers[normalized[matches[0]]] if matches else None
+        indices.append(idx)
+        report.append({
+            'Pestaña': sheet_name,
+            'Campo': field,
+            'Encabezado esperado': name,
+            'Encabezado encontrado': headers[idx] if idx is not None else None,
+            'Columna': idx + 1 if idx is not None else None,
+            'Resolución': resolution,
+            'Similitud': score,
+            'Sugerencia': suggestion,
+        })
+    return MappingPlan(sheet_name, indices, report)
+
+# Función para obtener el plan de extracción de una pestaña a partir de su fila de
+# encabezados (del caché si ya se compiló uno con la misma firma)
+def compile_mapping(sheet_name, headers, mapping):
+    key = header_signature(sheet_name, headers, mapping)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = _compile(sheet_name, _trim_headers(headers), mapping)
+        while len(_plans) > MAX_CACHED_PLANS:
+            del _plans[next(iter(_plans))]
+    return plan
+
+# Función para describir en una línea un campo del reporte que no se resolvió por el
+# texto exacto
+def describe_issue(row):
+    text = f"pestaña '{row['Pestaña']}': "
+    if row['Resolución'] == MISSING:
+        text += f"no se encontró '{row['Encabezado esperado']}' ({row['Campo']})"
+        return text + (f"; ¿'{row['Sugerencia']}'?" if row['Sugerencia'] else '')
+    return text + (f"'{row['Encabezado esperado']}' ({row['Campo']}) se tomó de "
+                   f"'{row['Encabezado encontrado']}' ({row['Resolución']})")
+
+# Función para escribir en el log los campos de un plan que no se resolvieron por el
+# texto exacto (como error los requeridos que faltan)
+def log_plan_issues(plan, source):
+    for row in plan.issues():
+        level = logging.ERROR if row['Campo'] in plan.missing_required() else logging.WARNING
+        logging.log(level, f"Encabezados de '{source}', {describe_issue(row)}")
+
+# Función para compilar los mapeos de un archivo leyendo solo sus encabezados (no lee
+# filas). Con sheet_names se limita a esas pestañas. Devuelve {pestaña: MappingPlan}
+# de las pestañas con mapeo que tiene el archivo.
+def check_headers(excel_file, mappings, reader=None, sheet_names=None):
+    wanted = [sheet_name for sheet_name in mappings if sheet_names is None or sheet_name in sheet_names]
+    return {sheet_name: compile_mapping(sheet_name, headers, mappings[sheet_name])
+            for sheet_name, headers in read_headers(excel_file, wanted, reader).items()}
+
+# Función para obtener las filas de un reporte de encabezados ({pestaña: filas}, como
+# stats['encabezados']) que no se resolvieron por el texto exacto
+def header_issues(report):
+    return [row for rows in report.values() for row in rows if row['Resolución'] != EXACT]
+
+# Función para saber si en un reporte de encabezados falta algún campo requerido
+def missing_required(report):
+    return any(row['Resolución'] == MISSING and row['Campo'] in REQUIRED_FIELDS for row in header_issues(report))
@@ -0,0 +1,106 @@
+import logging
+import time
+from contextlib import contextmanager
+
+# Instrumentación del procesamiento: contadores por pestaña, tiempos por fase y el
+# resumen de la corrida. Sustituye al registro de cada fila en procesamiento.log,
+# que en exportes grandes era buena parte del tiempo de ejecución y de la escritura
+# a disco.
+
+# Contadores que se llevan por pestaña
+SHEET_COUNTERS = ('rows_read', 'valid', 'invalid', 'inserted', 'duplicates')
+
+# Detalle por fila: nivel de logging con el que se escribe y cada cuántas filas de
+# una pestaña se toma una muestra (0 desactiva el detalle por fila)
+ROW_LOG_LEVEL = logging.DEBUG
+ROW_LOG_EVERY = 1000
+
+# Función para obtener las posiciones de un bloque de `count` filas que entran en la
+# muestra, siendo `offset` el número de filas de la pestaña leídas antes del bloque.
+# No devuelve ninguna si el detalle por fila está desactivado o su nivel no está
+# habilitado, para no formatear filas que no se van a escribir.
+def sample_positions(offset, count):
+    if ROW_LOG_EVERY <= 0 or not logging.getLogger().isEnabledFor(ROW_LOG_LEVEL):
+        return range(0)
+    return range(-offset % ROW_LOG_EVERY, count, ROW_LOG_EVERY)
+
+# Función para escribir el detalle de una fila muestreada
+def log_row(message):
+    logging.log(ROW_LOG_LEVEL, message)
+
+# Métricas de una corrida: los contadores de cada pestaña y, por cada fase, el
+# tiempo de reloj, el tiempo de CPU y las filas por segundo
+class RunMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.sheets = {}
+        self.phases = {}
+
+    # Contadores de una pestaña (se crean en cero la primera vez)
+    def sheet(self, sheet_name):
+        if sheet_name not in self.sheets:
+            self.sheets[sheet_name] = dict.fromkeys(SHEET_COUNTERS, 0)
+        return self.sheets[sheet_name]
+
+    # Suma los contadores por pestaña que deja iter_excel_batches en stats['sheets']
+    def add_sheet_stats(self, sheet_stats):
+        for sheet_name, counters in sheet_stats.items():
+            target = self.sheet(sheet_name)
+            for counter, value in counters.items():
+                target[counter] += value
+
+    # Mide una fase. El número de filas puede fijarse al terminar:
+    #   with metrics.phase('insercion') as phase:
+    #       ...
+    #       phase['rows'] = len(flags)
+    @contextmanager
+    def phase(self, name, rows=0):
+        record = {'rows': rows}
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall, 4)
+            record['cpu_s'] = round(time.process_time() - cpu, 4)
+            record['rows_per_s'] = round(record['rows'] / record['wall_s']) if record['wall_s'] > 0 else None
+            self.phases[name] = record
+
+    # Totales de todas las pestañas
+    def totals(self):
+        totals = dict.fromkeys(SHEET_COUNTERS, 0)
+        for counters in self.sheets.values():
+            for counter in SHEET_COUNTERS:
+                totals[counter] += counters[counter]
+        return totals
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'sheets': {sheet_name: dict(counters) for sheet_name, counters in self.sheets.items()},
+            'phases': {name: dict(record) for name, record in self.phases.items()},
+            'totals': self.totals(),
+        }
+
+    # Escribe el resumen de la corrida en el log: una línea por pestaña, una por fase
+    # y los totales
+    def log_summary(self):
+        logging.info(f"Resumen de '{self.name}'")
+        for sheet_name, c in self.sheets.items():
+            logging.info(f"  Pestaña '{sheet_name}': {c['rows_read']} leídos, {c['valid']} válidos, "
+                         f"{c['invalid']} inválidos, {c['inserted']} insertados, {c['duplicates']} duplicados")
+        for name, record in self.phases.items():
+            logging.info(f"  Fase '{name}': {record['wall_s']:.3f} s reloj, {record['cpu_s']:.3f} s CPU, "
+                         f"{record['rows']} filas, {record['rows_per_s'] or 0} filas/s")
+        t = self.totals()
+        logging.info(f"  Total: {t['rows_read']} leídos, {t['valid']} válidos, {t['invalid']} inválidos, "
+                     f"{t['inserted']} insertados, {t['duplicates']} duplicados")
+
+# Función para convertir el resumen de unas métricas en tablas para la interfaz
+def metrics_tables(metrics):
+    sheets = [{'Pestaña': sheet_name, 'Leídos': c['rows_read'], 'Válidos': c['valid'],
+               'Inválidos': c['invalid'], 'Insertados': c['inserted'], 'Duplicados': c['duplicates']}
+              for sheet_name, c in metrics['sheets'].items()]
+    phases = [{'Fase': name, 'Tiempo (s)': record['wall_s'], 'CPU (s)': record['cpu_s'],
+               'Filas': record['rows'], 'Filas/s': record['rows_per_s']}
+              for name, record in metrics['phases'].items()]
+    return sheets, phases
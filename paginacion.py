@@ -0,0 +1,136 @@
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from almacenamiento import FIELDS, SOURCE_COLUMN
+from procesamiento import PROFILE_FIELDS, default_excel_path
+
+# Consultas por páginas para las tablas grandes de la interfaz (datos detallados,
+# registros con datos omitidos y registros no insertados del archivo procesado). Los
+# filtros se aplican en SQL sobre los índices de la tabla (entre ellos el de la
+# columna Archivo), a la interfaz solo llega la página que se muestra y las
+# exportaciones se generan cuando se piden, leyendo la consulta por bloques y
+# escribiéndolos uno a uno en el archivo.
+
+PAGE_SIZE = 100
+EXPORT_CHUNK_SIZE = 50000
+EXPORT_DIR = os.path.join(default_excel_path, 'exportes')
+# Antigüedad (en segundos) a partir de la cual se borran las exportaciones
+EXPORT_MAX_AGE = 24 * 60 * 60
+
+# Formatos de exportación y su tipo MIME
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Condición SQL equivalente a missing_values: valor nulo o vacío al quitar espacios
+def missing_condition(field):
+    return f"({field} IS NULL OR TRIM({field}) = '')"
+
+# Función para construir los filtros de una consulta (lista de condiciones y sus
+# parámetros). Con archivo solo se toman los registros cargados desde ese archivo
+# (columna Archivo). Con incompletos solo se toman los registros con algún campo de
+# PROFILE_FIELDS vacío; con campo_vacio, los que tienen vacío ese campo.
+def build_filters(archivo=None, origen=None, clientes=None, tipos=None, origenes=None, campo_vacio=None,
+                  incompletos=False):
+    where, params = [], []
+    if archivo:
+        where.append(f'{SOURCE_COLUMN} = ?')
+        params.append(archivo)
+    if origen:
+        where.append('Origen = ?')
+        params.append(origen)
+    for column, values in (('Cliente_Cuenta', clientes), ('Tipo_de_Dispositivo', tipos), ('Origen', origenes)):
+        if values:
+            where.append(f'{column} IN ({", ".join("?" for _ in values)})')
+            params.extend(values)
+    if campo_vacio:
+        where.append(missing_condition(campo_vacio))
+    elif incompletos:
+        where.append('(' + ' OR '.join(missing_condition(field) for field in PROFILE_FIELDS) + ')')
+    return where, params
+
+# Columna con la lista de campos vacíos de cada registro (como Campos_Omitidos del perfil)
+def _missing_fields_column():
+    cases = ' || '.join(f"CASE WHEN {missing_condition(field)} THEN ', {field}' ELSE '' END"
+                        for field in PROFILE_FIELDS)
+    return f'SUBSTR({cases}, 3) AS Campos_Omitidos'
+
+def _select(table, filters, with_missing):
+    where, params = filters
+    columns = ', '.join(FIELDS) + (', ' + _missing_fields_column() if with_missing else '')
+    sql = f'SELECT {columns} FROM {table}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return sql + ' ORDER BY rowid', list(params)
+
+# Función para contar los registros de una tabla que cumplen los filtros
+def count_rows(conn, table, filters):
+    where, params = filters
+    sql = f'SELECT COUNT(*) FROM {table}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return conn.execute(sql, params).fetchone()[0]
+
+# Función para obtener el número de páginas de un total de registros
+def page_count(total, page_size=PAGE_SIZE):
+    return max((total + page_size - 1) // page_size, 1)
+
+# Función para leer una página (empezando en 1) de los registros que cumplen los filtros
+def fetch_page(conn, table, filters, page, page_size=PAGE_SIZE, with_missing=False):
+    sql, params = _select(table, filters, with_missing)
+    return pd.read_sql_query(sql + ' LIMIT ? OFFSET ?', conn, params=params + [page_size, (page - 1) * page_size])
+
+# Función para obtener los valores distintos (no vacíos) de una columna
+def distinct_values(conn, table, column, filters=((), ())):
+    where, params = filters
+    sql = f'SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL AND TRIM({column}) != \'\''
+    if where:
+        sql += ' AND ' + ' AND '.join(where)
+    return [row[0] for row in conn.execute(sql + ' ORDER BY 1', list(params))]
+
+# Función para reservar el archivo de una exportación: file_name más un sufijo único,
+# así dos sesiones que exportan la misma tabla no escriben sobre el mismo archivo.
+# De paso se borran las exportaciones de más de max_age segundos.
+def export_path(file_name, fmt, max_age=EXPORT_MAX_AGE):
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    limit = time.time() - max_age
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < limit:
+                os.remove(path)
+        except OSError:
+            pass
+    fd, path = tempfile.mkstemp(dir=EXPORT_DIR, prefix=f'{file_name}_', suffix=f'.{fmt}')
+    os.close(fd)
+    return path
+
+# Función para exportar los registros que cumplen los filtros a un archivo CSV o
+# Parquet. La consulta se lee en bloques de chunk_size registros y cada bloque se
+# agrega al archivo (en Parquet, como un grupo de filas). Devuelve los registros escritos.
+def export_rows(conn, table, filters, fmt, path, with_missing=False, chunk_size=EXPORT_CHUNK_SIZE):
+    sql, params = _select(table, filters, with_missing)
+    columns = FIELDS + (['Campos_Omitidos'] if with_missing else [])
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    written = 0
+    writer = pq.ParquetWriter(path, schema) if fmt == 'parquet' else None
+    try:
+        if writer is None:
+            pd.DataFrame(columns=columns).to_csv(path, index=False, encoding='utf-8')
+        for chunk in pd.read_sql_query(sql, conn, params=params, chunksize=chunk_size, dtype=object):
+            if writer is None:
+                chunk.to_csv(path, mode='a', header=False, index=False, encoding='utf-8')
+            else:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            written += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
@@ -1,191 +1,153 @@
-import openpyxl
+import numpy as np
 import pandas as pd
-import sqlite3
-import re
 import os
+import time
 import streamlit as st
-import logging
-from datetime import datetime
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from almacenamiento import (
+    NOT_INSERTED_TABLE,
+    activated_between,
+    connect,
+    create_schema,
+    delete_database,
+    devices_by_client,
+    find_devices,
+    list_clients,
+    stale_devices,
+)
+from cambios_diarios import changes_report, compute_delta, database_date
+from cache_resultados import invalidate_database, load_or_ingest
+from duplicados import database_near_duplicates, find_near_duplicates
+from fechas import unrecognized_dates_report
+from historico import (
+    ROLLUP_METRICS,
+    compact_history,
+    consolidate_folder,
+    device_history,
+    history_clients,
+    history_path,
+    history_range,
+    open_history,
+    partitions_report,
+    trend,
+)
+from mapeos import EXACT, check_headers, header_issues, missing_required
+from metricas import metrics_tables
+from paginacion import (
+    EXPORT_FORMATS,
+    build_filters,
+    count_rows,
+    distinct_values,
+    export_path,
+    export_rows,
+    fetch_page,
+    page_count,
+)
+from procesamiento import (
+    build_profiles,
+    configure_logging,
+    default_excel_path,
+    default_mappings,
+    partition_records,
+    summarize_by_platform,
+)
+from trabajos import CANCELLED, FAILED, FINISHED, cancel_job, get_job, list_jobs, running_job, start_job
+from unificacion import (
+    CONFLICT_TYPES,
+    REFERENCE_ORIGIN,
+    conflicts_report,
+    find_entity,
+    other_daily_databases,
+    unify_devices,
+)
+from vigilancia import (
+    describe_file,
+    load_registry,
+    record_ingestion,
+    registered_files,
+    rescan_folder,
+)
 
 # Configuración básica de logging
-logging.basicConfig(level=logging.INFO, filename='procesamiento.log', filemode='w',
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Ruta predeterminada
-default_excel_path = r"C:\Users\capac\OneDrive\Escritorio\Actividades de Sims\bd_sims"
-
-# Mapeos predeterminados basados en el nombre de la pestaña
-default_mappings = {
-    "WIALON": {
-        'Nombre': 'Nombre',
-        'Cliente_Cuenta': 'Cuenta',
-        'Tipo_de_Dispositivo': 'Tipo de dispositivo',
-        'IMEI': 'IMEI',
-        'ICCID': 'Iccid',
-        'Fecha_de_Activacion': 'Creada',
-        'Fecha_de_Desactivacion': 'Desactivación',
-        'Hora_de_Ultimo_Mensaje': 'Hora de último mensaje',
-        'Ultimo_Reporte': 'Ultimo Reporte',
-        'Vehiculo': None,
-        'Servicios': None,
-        'Grupo': 'Grupos',
-        'Telefono': 'Teléfono',
-        'Origen': 'WIALON',  # Asignado manualmente
-        'Fecha_Archivo': None  # Extraído del nombre del archivo
-    },
-    "ADAS": {
-        'Nombre': 'equipo',
-        'Cliente_Cuenta': 'Subordinar',
-        'Tipo_de_Dispositivo': 'Modelo',
-        'IMEI': 'IMEI',
-        'ICCID': 'Iccid',
-        'Fecha_de_Activacion': 'Activation Date',
-        'Fecha_de_Desactivacion': None,
-        'Hora_de_Ultimo_Mensaje': None,
-        'Ultimo_Reporte': None,
-        'Vehiculo': None,
-        'Servicios': None,
-        'Grupo': None,
-        'Telefono': 'Número de tarjeta SIM',
-        'Origen': 'ADAS',  # Asignado manualmente
-        'Fecha_Archivo': None  # Extraído del nombre del archivo
-    },
-    "COMBUSTIBLE": {
-        'Nombre': 'Vehículo',
-        'Cliente_Cuenta': 'Cuenta',
-        'Tipo_de_Dispositivo': 'Tanques',
-        'IMEI': None,
-        'ICCID': None,
-        'Fecha_de_Activacion': None,
-        'Fecha_de_Desactivacion': None,
-        'Hora_de_Ultimo_Mensaje': None,
-        'Ultimo_Reporte': 'Último reporte',
-        'Vehiculo': 'Vehículo',
-        'Servicios': 'Servicios',
-        'Grupo': 'Grupos',
-        'Telefono': 'Línea',
-        'Origen': 'COMBUSTIBLE',  # Asignado manualmente
-        'Fecha_Archivo': None  # Extraído del nombre del archivo
-    }
-}
-
-def create_database(db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(''' 
-        CREATE TABLE IF NOT EXISTS datos ( 
-            Nombre TEXT,
-            Cliente_Cuenta TEXT,
-            Tipo_de_Dispositivo TEXT,
-            IMEI TEXT,
-            ICCID TEXT,
-            Fecha_de_Activacion TEXT,
-            Fecha_de_Desactivacion TEXT,
-            Hora_de_Ultimo_Mensaje TEXT,
-            Ultimo_Reporte TEXT,
-            Vehiculo TEXT,
-            Servicios TEXT,
-            Grupo TEXT,
-            Telefono TEXT,
-            Origen TEXT,
-            Fecha_Archivo TEXT,
-            UNIQUE(Nombre, Cliente_Cuenta, Telefono)
-        ) 
-    ''')
-    conn.commit()
-    conn.close()
-
-# Función para insertar datos en la base de datos con manejo de duplicados
-def insert_data(db_path, data):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    try:
-        cursor.executemany(
-            '''INSERT OR IGNORE INTO datos (
-                Nombre, Cliente_Cuenta, Tipo_de_Dispositivo, IMEI, ICCID,
-                Fecha_de_Activacion, Fecha_de_Desactivacion, Hora_de_Ultimo_Mensaje,
-                Ultimo_Reporte, Vehiculo, Servicios, Grupo, Telefono, Origen, Fecha_Archivo
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-            data
-        )
-        conn.commit()
-        logging.info(f"Insertados {cursor.rowcount} registros en la base de datos.")
-        inserted = cursor.rowcount
-    except sqlite3.IntegrityError as e:
-        logging.error(f"Error al insertar datos: {e}")
-        inserted = 0
-    conn.close()
-    return inserted
-
-# Función para limpiar el campo Telefono (sin validación de cantidad de dígitos)
-def clean_telefono(telefono):
-    if telefono:
-        telefono = re.sub(r'\D', '', str(telefono))
-        if telefono:  # Solo verifica que no esté vacío después de limpiar
-            return telefono
-    return None
-
-# Función para extraer la fecha del nombre del archivo
-def extract_date_from_filename(filename):
-    match = re.search(r'\d{4}-\d{2}-\d{2}', filename)
-    if match:
-        return match.group(0)
-    else:
-        return datetime.now().strftime('%Y-%m-%d')
-
-# Función para procesar el archivo Excel con múltiples pestañas
-def process_excel_file(excel_file, mappings):
-    all_data = []
-    invalid_data = []
-    total_records = 0
-    filename = os.path.basename(excel_file)  # Obtener solo el nombre del archivo
-    fecha_archivo = extract_date_from_filename(filename)
-    workbook = openpyxl.load_workbook(excel_file, data_only=True)
-    for sheet_name in workbook.sheetnames:
-        if sheet_name in mappings:
-            mapping = mappings[sheet_name]
-            sheet = workbook[sheet_name]
-            headers = [cell.value for cell in next(sheet.iter_rows(min_row=1, max_row=1))]
-            # Crear un diccionario que mapea nombres de columnas a índices
-            col_indices = {header: idx for idx, header in enumerate(headers)}
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                total_records += 1
-                row_dict = {headers[i]: row[i] for i in range(len(headers))}
-                record = {}
-                is_valid = True
-                # Validaciones específicas
-                required_field = 'Cliente_Cuenta'  # Solo Cliente_Cuenta es requerido
-                column_name = mapping.get(required_field)
-                value = row_dict.get(column_name) if column_name else None
-                if not value:
-                    is_valid = False
-                # Si es Cliente_Cuenta, no es necesario verificar otros campos
-                if is_valid:
-                    # Construcción del registro válido
-                    for field in [
-                        'Nombre', 'Cliente_Cuenta', 'Tipo_de_Dispositivo', 'IMEI', 'ICCID',
-                        'Fecha_de_Activacion', 'Fecha_de_Desactivacion', 'Hora_de_Ultimo_Mensaje',
-                        'Ultimo_Reporte', 'Vehiculo', 'Servicios', 'Grupo', 'Telefono', 'Origen', 'Fecha_Archivo'
-                    ]:
-                        if field == 'Origen':
-                            record[field] = mapping['Origen']
-                        elif field == 'Fecha_Archivo':
-                            record[field] = fecha_archivo
-                        else:
-                            column_name = mapping.get(field)
-                            if column_name:
-                                value = row_dict.get(column_name)
-                                if field == 'Telefono':
-                                    value = clean_telefono(value)
-                                record[field] = value
-                            else:
-                                record[field] = None
-                    all_data.append(tuple(record.values()))
-                    logging.info(f"Procesado registro válido en pestaña '{sheet_name}': {record}")
-                else:
-                    invalid_data.append(row_dict)
-                    logging.warning(f"Registro inválido en pestaña '{sheet_name}': {row_dict}")
-    return all_data, invalid_data, total_records
+configure_logging()
+
+# Segundos entre actualizaciones de la página mientras corre un procesamiento
+PROGRESS_REFRESH_S = 1.0
+
+# Función que corre como trabajo en segundo plano: ingesta del archivo (o lectura del
+# caché) y preparación del resultado que usa la interfaz
+def process_file(excel_file, db_path, registrar_cambios, progress=None, cancel=None):
+    resultado = load_or_ingest(excel_file, default_mappings, db_path, progress=progress, cancel=cancel)
+    # Un resultado del caché puede venir de una base de datos sin la columna Archivo
+    with closing(connect(db_path)) as conn:
+        create_schema(conn)
+    record_ingestion(default_excel_path, excel_file, db_path, resultado, resultado['sha256'])
+    resultado['archivo'] = excel_file
+    # Índice por plataforma: vistas del DataFrame completo y conteos precalculados
+    resultado['df_all'], resultado['particiones'], resultado['conteos'] = partition_records(
+        resultado.pop('all_data'), default_mappings)
+    # El perfil cuenta solo los registros insertados, los mismos que muestran las tablas
+    resultado['perfiles'] = build_profiles(resultado['particiones'],
+                                           np.frombuffer(resultado['flags'], dtype=np.uint8).astype(bool))
+    if registrar_cambios:
+        with closing(connect(db_path)) as conn:
+            compute_delta(conn, db_path)
+    return resultado
+
+# Función para describir el avance de una etapa del trabajo
+def describe_progress(etapa):
+    text = f"{etapa['etapa']}: {etapa['filas']:,} filas"
+    if etapa['total']:
+        text += f" de {etapa['total']:,}"
+    if etapa['filas_por_s']:
+        text += f" · {etapa['filas_por_s']:,.0f} filas/s"
+    if etapa['restante_s'] is not None:
+        text += f" · faltan {etapa['restante_s']:.0f} s"
+    return text
+
+# Función para mostrar una tabla leída por páginas desde SQLite, con la exportación
+# del resultado filtrado a CSV o Parquet solo cuando se pide. `key` distingue los
+# widgets de cada tabla.
+def show_paged_table(conn, key, table, filters, file_name, with_missing=False):
+    total = count_rows(conn, table, filters)
+    pages = page_count(total)
+    signature = repr(filters)
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        # La página vuelve a la primera cuando cambian los filtros
+        page = st.number_input("Página", min_value=1, max_value=pages, value=1, step=1,
+                               key=f'{key}_pagina_{abs(hash(signature))}')
+    with col2:
+        st.write(f"{total:,} registros · página {page} de {pages}")
+    st.dataframe(fetch_page(conn, table, filters, page, with_missing=with_missing), use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        fmt = st.radio("Formato de exportación", list(EXPORT_FORMATS), horizontal=True, key=f'{key}_formato')
+    with col2:
+        export_key = f'{key}_exportacion'
+        if st.button("Preparar exportación", key=f'{key}_exportar'):
+            # La exportación anterior de esta tabla en la sesión ya no se ofrece
+            previous = st.session_state.pop(export_key, None)
+            if previous and os.path.exists(previous[2]):
+                os.remove(previous[2])
+            path = export_path(file_name, fmt)
+            export_rows(conn, table, filters, fmt, path, with_missing)
+            st.session_state[export_key] = (signature, fmt, path)
+        exported = st.session_state.get(export_key)
+        if exported and exported[:2] == (signature, fmt) and os.path.exists(exported[2]):
+            # Se entrega el archivo abierto (no su contenido leído aquí) con el nombre
+            # de la tabla, sin el sufijo único
+            with open(exported[2], 'rb') as f:
+                st.download_button(
+                    label=f"Descargar {file_name}.{fmt}",
+                    data=f,
+                    file_name=f'{file_name}.{fmt}',
+                    mime=EXPORT_FORMATS[fmt],
+                    key=f'{key}_descargar',
+                )
 
 # Interfaz de usuario con Streamlit
 st.title("Carga y Homologación de Datos desde Excel con Múltiples Pestañas")
@@ -195,129 +157,169 @@ today_db_path = os.path.join(default_excel_path, f'{datetime.now().strftime("%Y-
 if os.path.exists(today_db_path):
     st.warning(f"Ya existe una base de datos para hoy ({os.path.basename(today_db_path)})")
     if st.button("Eliminar base de datos existente"):
-        try:
-            os.remove(today_db_path)
-            st.success("Base de datos eliminada correctamente")
-        except Exception as e:
-            st.error(f"Error al eliminar la base de datos: {str(e)}")
-
-# Permitir al usuario seleccionar un archivo Excel desde la ruta predeterminada
-excel_files = [f for f in os.listdir(default_excel_path) if f.endswith('.xlsx')]
-selected_file = st.selectbox("Selecciona un archivo Excel", excel_files)
+        if running_job(os.path.abspath(today_db_path)) is not None:
+            st.error("No se puede eliminar la base de datos mientras se procesa un archivo")
+        else:
+            try:
+                delete_database(today_db_path)
+                invalidate_database(today_db_path)
+                st.session_state.pop('resultado', None)
+                st.success("Base de datos eliminada correctamente")
+            except Exception as e:
+                st.error(f"Error al eliminar la base de datos: {str(e)}")
 
-# Ruta completa del archivo Excel
-uploaded_file_path = os.path.join(default_excel_path, selected_file)
+# Permitir al usuario seleccionar un archivo Excel de la ruta predeterminada. La lista
+# sale del registro de archivos (vigilancia.py); la carpeta solo se revisa la primera
+# vez o cuando se pide.
+registro = load_registry(default_excel_path)
+if not registro['files'] or st.button("Buscar archivos nuevos"):
+    registro, _ = rescan_folder(default_excel_path)
+uploaded_file_path = st.selectbox("Selecciona un archivo Excel", registered_files(registro),
+                                  format_func=lambda path: describe_file(registro, path))
+selected_file = os.path.basename(uploaded_file_path)
 
 # Ruta para almacenar la base de datos (hoy.db)
 today_db_path = os.path.join(default_excel_path, f'{datetime.now().strftime("%Y-%m-%d")}.db')
 
-# Botón para ejecutar la operación
+# Registro de cambios respecto a la base de datos del día anterior
+registrar_cambios = st.checkbox("Registrar cambios respecto al día anterior")
+
+# Revisión de los encabezados del archivo contra los mapeos (solo lee la primera fila
+# de cada pestaña)
+if st.button("Verificar encabezados"):
+    reporte_encabezados = {sheet: plan.report for sheet, plan in check_headers(uploaded_file_path,
+                                                                               default_mappings).items()}
+    diferencias = header_issues(reporte_encabezados)
+    if not diferencias:
+        st.success(f"Los encabezados de {selected_file} coinciden con los mapeos")
+    else:
+        if missing_required(reporte_encabezados):
+            st.error("Falta la columna de un campo requerido: todos los registros de esa pestaña serían inválidos")
+        else:
+            st.warning(f"{len(diferencias)} campos se resolvieron con un encabezado distinto al del mapeo")
+        st.dataframe(pd.DataFrame(diferencias), use_container_width=True)
+
+# Botón para ejecutar la operación. El procesamiento corre como trabajo en segundo
+# plano (uno por base de datos); la sesión guarda el id del trabajo y, al terminar,
+# su resultado, para que los filtros (que vuelven a ejecutar el script) no pierdan
+# los datos ni reprocesen el archivo.
 if st.button("Ejecutar procesamiento de datos"):
-    # Procesar el archivo Excel seleccionado
-    all_data, invalid_data, total_records = process_excel_file(uploaded_file_path, default_mappings)
-    
-    # Crear la base de datos si no existe y luego insertar datos
-    create_database(today_db_path)
-    
-    # Guardar los datos que se insertarán y los que no en DataFrames separados
-    columns = ['Nombre', 'Cliente_Cuenta', 'Tipo_de_Dispositivo', 'IMEI', 'ICCID',
-               'Fecha_de_Activacion', 'Fecha_de_Desactivacion', 'Hora_de_Ultimo_Mensaje',
-               'Ultimo_Reporte', 'Vehiculo', 'Servicios', 'Grupo', 'Telefono', 'Origen', 'Fecha_Archivo']
-    
-    # Intentar insertar los datos y obtener los duplicados
-    conn = sqlite3.connect(today_db_path)
-    cursor = conn.cursor()
-    
-    # Lista para almacenar registros no insertados (duplicados)
-    not_inserted = []
-    inserted = []
-    
-    for record in all_data:
-        try:
-            cursor.execute('''
-                INSERT INTO datos (
-                    Nombre, Cliente_Cuenta, Tipo_de_Dispositivo, IMEI, ICCID,
-                    Fecha_de_Activacion, Fecha_de_Desactivacion, Hora_de_Ultimo_Mensaje,
-                    Ultimo_Reporte, Vehiculo, Servicios, Grupo, Telefono, Origen, Fecha_Archivo
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', record)
-            inserted.append(record)
-        except sqlite3.IntegrityError:
-            not_inserted.append(record)
-    
-    conn.commit()
-    conn.close()
-    
-    # Convertir a DataFrames
-    df_inserted = pd.DataFrame(inserted, columns=columns)
-    df_not_inserted = pd.DataFrame(not_inserted, columns=columns)
+    trabajo = start_job(selected_file, process_file, uploaded_file_path, today_db_path, registrar_cambios,
+                        key=os.path.abspath(today_db_path))
+    st.session_state['trabajo'] = trabajo.id
+
+trabajo = get_job(st.session_state.get('trabajo'))
+if trabajo is not None:
+    if trabajo.is_running():
+        st.write(f"### Procesando {trabajo.name} ({trabajo.elapsed():.0f} s)")
+        etapas = trabajo.snapshot()
+        if not etapas:
+            st.progress(0.0, text="Abriendo el archivo...")
+        for etapa in etapas:
+            st.progress(etapa['fraccion'] or 0.0, text=describe_progress(etapa))
+        if trabajo.cancel_event.is_set():
+            st.info("Cancelando el procesamiento...")
+        elif st.button("Cancelar procesamiento"):
+            cancel_job(trabajo.id)
+    else:
+        del st.session_state['trabajo']
+        if trabajo.status == FINISHED:
+            st.session_state['resultado'] = trabajo.result
+        elif trabajo.status == CANCELLED:
+            st.warning(f"Se canceló el procesamiento de {trabajo.name}; no se insertaron registros")
+        elif trabajo.status == FAILED:
+            st.error(f"Error al procesar {trabajo.name}: {trabajo.error}")
+
+resultado = st.session_state.get('resultado')
+if resultado is not None and resultado['archivo'] == uploaded_file_path:
+    df_all = resultado['df_all']
+    total_records = resultado['total_records']
+    flags = np.frombuffer(resultado['flags'], dtype=np.uint8).astype(bool)
+    total_inserted = int(flags.sum())
+    total_not_inserted = len(flags) - total_inserted
+    # Las tablas por páginas muestran solo los registros de este archivo
+    archivo = os.path.basename(resultado['archivo'])
     
     # Mostrar resultados generales
     col1, col2, col3, col4 = st.columns(4)
     with col1:
         st.metric("Total de Registros", total_records)
     with col2:
-        st.metric("Registros Insertados", len(inserted))
+        st.metric("Registros Insertados", total_inserted)
     with col3:
-        st.metric("Registros No Insertados", len(not_inserted))
+        st.metric("Registros No Insertados", total_not_inserted)
     with col4:
-        st.metric("Registros Inválidos", len(invalid_data))
+        st.metric("Registros Inválidos", resultado['invalid_records'])
 
-    # Mostrar registros no insertados
-    if len(not_inserted) > 0:
+    # Métricas de la corrida: contadores por pestaña y tiempos por fase
+    if resultado.get('metricas'):
+        with st.expander("Métricas de la corrida"):
+            metricas_pestanas, metricas_fases = metrics_tables(resultado['metricas'])
+            st.write("#### Contadores por pestaña")
+            st.dataframe(pd.DataFrame(metricas_pestanas), use_container_width=True)
+            st.write("#### Tiempos por fase")
+            st.dataframe(pd.DataFrame(metricas_fases), use_container_width=True)
+
+    # Mostrar registros no insertados (consultados por páginas en la tabla no_insertados)
+    if total_not_inserted > 0:
         st.write("### Registros No Insertados en la Base de Datos")
         st.write("Los siguientes registros no fueron insertados por ser duplicados:")
-        
-        # Agregar filtros para los registros no insertados
-        col1, col2 = st.columns(2)
-        with col1:
-            unique_clients = sorted(df_not_inserted['Cliente_Cuenta'].unique())
-            selected_client = st.multiselect(
-                'Filtrar por Cliente:',
-                options=unique_clients,
-                default=[]
-            )
-        
-        with col2:
-            unique_origins = sorted(df_not_inserted['Origen'].unique())
-            selected_origin = st.multiselect(
-                'Filtrar por Origen:',
-                options=unique_origins,
-                default=[]
+        with closing(connect(today_db_path)) as conn:
+            create_schema(conn)
+            # Agregar filtros para los registros no insertados
+            col1, col2 = st.columns(2)
+            with col1:
+                selected_client = st.multiselect(
+                    'Filtrar por Cliente:',
+                    options=distinct_values(conn, NOT_INSERTED_TABLE, 'Cliente_Cuenta', build_filters(archivo)),
+                    default=[]
+                )
+            with col2:
+                selected_origin = st.multiselect(
+                    'Filtrar por Origen:',
+                    options=distinct_values(conn, NOT_INSERTED_TABLE, 'Origen', build_filters(archivo)),
+                    default=[]
+                )
+            show_paged_table(conn, 'no_insertados', NOT_INSERTED_TABLE,
+                             build_filters(archivo, clientes=selected_client, origenes=selected_origin),
+                             'registros_no_insertados')
+
+    # Posibles duplicados entre los registros insertados (claves normalizadas y
+    # nombres parecidos dentro de un mismo cliente)
+    if st.checkbox("Detectar posibles duplicados"):
+        alcance = st.radio("Buscar entre", ["Registros insertados de este archivo", "Toda la base de datos del día"],
+                           horizontal=True)
+        if alcance == "Registros insertados de este archivo":
+            if 'duplicados' not in resultado:
+                resultado['duplicados'] = find_near_duplicates(df_all[flags])
+            df_duplicados = resultado['duplicados']
+        else:
+            # Se vuelve a buscar solo si la base de datos cambió desde la última búsqueda
+            estado = tuple((os.stat(path).st_size, os.stat(path).st_mtime_ns)
+                           for path in (today_db_path, today_db_path + '-wal') if os.path.exists(path))
+            if resultado.get('duplicados_base', (None,))[0] != estado:
+                with closing(connect(today_db_path)) as conn:
+                    resultado['duplicados_base'] = (estado, database_near_duplicates(conn))
+            df_duplicados = resultado['duplicados_base'][1]
+        st.write("### Posibles Duplicados")
+        if df_duplicados.empty:
+            st.info("No se encontraron posibles duplicados")
+        else:
+            st.write(f"{df_duplicados['Grupo_Duplicado'].nunique()} grupos con {len(df_duplicados)} registros "
+                     "que podrían ser el mismo dispositivo:")
+            st.dataframe(df_duplicados, use_container_width=True)
+            csv_duplicados = df_duplicados.to_csv(index=False).encode('utf-8')
+            st.download_button(
+                label="Descargar posibles duplicados como CSV",
+                data=csv_duplicados,
+                file_name="posibles_duplicados.csv",
+                mime='text/csv',
             )
-        
-        # Aplicar filtros
-        df_filtered = df_not_inserted.copy()
-        if selected_client:
-            df_filtered = df_filtered[df_filtered['Cliente_Cuenta'].isin(selected_client)]
-        if selected_origin:
-            df_filtered = df_filtered[df_filtered['Origen'].isin(selected_origin)]
-        
-        # Mostrar tabla con registros no insertados
-        st.dataframe(df_filtered, use_container_width=True)
-        
-        # Botón para descargar registros no insertados
-        csv = df_filtered.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="Descargar registros no insertados como CSV",
-            data=csv,
-            file_name="registros_no_insertados.csv",
-            mime='text/csv',
-        )
 
     # Mostrar resumen por plataforma
     st.write("## Resumen por Plataforma")
-    summary_data = []
+    summary_data = summarize_by_platform(resultado['conteos'], total_records, default_mappings)
     sheets = list(default_mappings.keys())
-    for sheet in sheets:
-        sheet_data = [record for record in all_data if record[-2] == sheet]
-        total_sheet = len(sheet_data)
-        percentage = (total_sheet / total_records * 100) if total_records > 0 else 0
-        summary_data.append({
-            "Plataforma": sheet,
-            "Total Registros": total_sheet,
-            "Porcentaje": f"{percentage:.1f}%"
-        })
     
     # Crear DataFrame y mostrar resumen
     df_summary = pd.DataFrame(summary_data)
@@ -339,9 +341,9 @@ if st.button("Ejecutar procesamiento de datos"):
         with tabs[i]:
             st.write(f"## Análisis de {sheet}")
             
-            # Obtener datos de esta pestaña
-            sheet_data = [record for record in all_data if record[-2] == sheet]
-            total_sheet = len(sheet_data)
+            # Conteos de esta pestaña desde el índice por plataforma
+            origen = default_mappings[sheet]['Origen']
+            total_sheet = resultado['conteos'][origen]
             percentage = (total_sheet / total_records * 100) if total_records > 0 else 0
             
             # Mostrar resumen de la pestaña
@@ -359,9 +361,15 @@ if st.button("Ejecutar procesamiento de datos"):
             
             with col_mapping:
                 st.write("### Mapeo de Campos")
+                # Encabezado con el que se resolvió cada campo en este archivo
+                resoluciones = {row['Campo']: row for row in resultado.get('encabezados', {}).get(sheet, [])}
                 mapping_data = []
                 for field, mapped_field in default_mappings[sheet].items():
                     status = "✅ Mapeado" if mapped_field else "❌ No mapeado"
+                    resolucion = resoluciones.get(field)
+                    if resolucion is not None and resolucion['Resolución'] != EXACT:
+                        status = (f"⚠️ {resolucion['Encabezado encontrado']} ({resolucion['Resolución']})"
+                                  if resolucion['Encabezado encontrado'] is not None else "❌ No encontrado")
                     mapping_data.append({
                         "Campo": field,
                         "Mapeo": mapped_field if mapped_field else "No disponible",
@@ -373,29 +381,10 @@ if st.button("Ejecutar procesamiento de datos"):
             with col_stats:
                 st.write("### Estadísticas de Datos")
                 if total_sheet > 0:
-                    field_stats = []
-                    omitted_data = []
-                    for idx, field in enumerate(['Nombre', 'Cliente_Cuenta', 'Tipo_de_Dispositivo', 'IMEI', 'ICCID',
-                                              'Fecha_de_Activacion', 'Fecha_de_Desactivacion', 'Hora_de_Ultimo_Mensaje',
-                                              'Ultimo_Reporte', 'Vehiculo', 'Servicios', 'Grupo', 'Telefono']):
-                        non_empty = sum(1 for record in sheet_data if record[idx] is not None and str(record[idx]).strip())
-                        empty = total_sheet - non_empty
-                        percentage = (non_empty / total_sheet) * 100
-                        
-                        field_stats.append({
-                            "Campo": field,
-                            "Registros con Datos": non_empty,
-                            "Registros sin Datos": empty,
-                            "Porcentaje Completitud": f"{percentage:.1f}%"
-                        })
-                        
-                        # Agregar a datos omitidos si hay registros vacíos
-                        if empty > 0:
-                            omitted_data.append({
-                                "Campo": field,
-                                "Registros Omitidos": empty,
-                                "Porcentaje Omitido": f"{(empty/total_sheet)*100:.1f}%"
-                            })
+                    # Perfil de calidad calculado una sola vez junto con la ingesta
+                    perfil = resultado['perfiles'][origen]
+                    field_stats = perfil['field_stats']
+                    omitted_data = perfil['omitted_data']
                     
                     df_stats = pd.DataFrame(field_stats)
                     st.dataframe(df_stats, use_container_width=True)
@@ -419,66 +408,39 @@ if st.button("Ejecutar procesamiento de datos"):
                         st.write("### Registros con Datos Omitidos")
                         st.write("Esta tabla muestra los registros que tienen uno o más campos sin datos:")
                         
-                        # Convertir los datos de la pestaña a DataFrame
-                        df_sheet = pd.DataFrame(sheet_data, columns=[
-                            'Nombre', 'Cliente_Cuenta', 'Tipo_de_Dispositivo', 'IMEI', 'ICCID',
-                            'Fecha_de_Activacion', 'Fecha_de_Desactivacion', 'Hora_de_Ultimo_Mensaje',
-                            'Ultimo_Reporte', 'Vehiculo', 'Servicios', 'Grupo', 'Telefono', 'Origen', 'Fecha_Archivo'
-                        ])
-                        
-                        # Función para verificar si una fila tiene datos omitidos
-                        def has_missing_data(row):
-                            return any(pd.isna(val) or str(val).strip() == '' for val in row)
-                        
-                        # Filtrar registros con datos omitidos
-                        df_incomplete = df_sheet[df_sheet.apply(has_missing_data, axis=1)]
-                        
-                        if not df_incomplete.empty:
-                            # Agregar columna que indica qué campos están vacíos
-                            df_incomplete['Campos_Omitidos'] = df_incomplete.apply(
-                                lambda row: ', '.join([col for col in df_incomplete.columns 
-                                                     if pd.isna(row[col]) or str(row[col]).strip() == '']),
-                                axis=1
-                            )
-                            
+                        # Registros incompletos de la plataforma en la tabla datos, con la
+                        # columna que indica qué campos están vacíos calculada en SQL
+                        with closing(connect(today_db_path)) as conn:
+                            incompletos = build_filters(archivo, origen=origen, incompletos=True)
                             # Agregar filtros para la tabla de datos omitidos
-                            col1, col2 = st.columns(2)
+                            col1, col2, col3 = st.columns(3)
                             with col1:
-                                if 'Cliente_Cuenta' in df_incomplete.columns:
-                                    selected_client_incomplete = st.multiselect(
-                                        'Filtrar por Cliente (Datos Omitidos):',
-                                        options=sorted([x for x in df_incomplete['Cliente_Cuenta'].unique() 
-                                                      if x is not None and str(x).strip()], key=str),
-                                        default=[]
-                                    )
+                                selected_client_incomplete = st.multiselect(
+                                    'Filtrar por Cliente (Datos Omitidos):',
+                                    options=distinct_values(conn, 'datos', 'Cliente_Cuenta', incompletos),
+                                    default=[],
+                                    key=f'{sheet}_clientes_incompletos',
+                                )
                             with col2:
-                                if 'Tipo_de_Dispositivo' in df_incomplete.columns:
-                                    selected_device_incomplete = st.multiselect(
-                                        'Filtrar por Tipo de Dispositivo (Datos Omitidos):',
-                                        options=sorted([x for x in df_incomplete['Tipo_de_Dispositivo'].unique() 
-                                                      if x is not None and str(x).strip()], key=str),
-                                        default=[]
-                                    )
-                            
-                            # Aplicar filtros a los datos omitidos
-                            if selected_client_incomplete:
-                                df_incomplete = df_incomplete[df_incomplete['Cliente_Cuenta'].isin(selected_client_incomplete)]
-                            if selected_device_incomplete:
-                                df_incomplete = df_incomplete[df_incomplete['Tipo_de_Dispositivo'].isin(selected_device_incomplete)]
-                            
-                            # Mostrar la tabla de datos omitidos con opción de descarga
-                            st.dataframe(df_incomplete, use_container_width=True)
-                            
-                            # Botón para descargar datos omitidos
-                            csv_incomplete = df_incomplete.to_csv(index=False).encode('utf-8')
-                            st.download_button(
-                                label=f"Descargar registros incompletos de {sheet} como CSV",
-                                data=csv_incomplete,
-                                file_name=f'{sheet}_registros_incompletos.csv',
-                                mime='text/csv',
-                            )
-                        else:
-                            st.info("No se encontraron registros con datos omitidos.")
+                                selected_device_incomplete = st.multiselect(
+                                    'Filtrar por Tipo de Dispositivo (Datos Omitidos):',
+                                    options=distinct_values(conn, 'datos', 'Tipo_de_Dispositivo', incompletos),
+                                    default=[],
+                                    key=f'{sheet}_tipos_incompletos',
+                                )
+                            with col3:
+                                selected_missing_field = st.selectbox(
+                                    'Campo sin datos:',
+                                    [''] + [row['Campo'] for row in omitted_data],
+                                    format_func=lambda field: field or 'Cualquiera',
+                                    key=f'{sheet}_campo_vacio',
+                                )
+                            show_paged_table(conn, f'{sheet}_incompletos', 'datos',
+                                             build_filters(archivo, origen=origen, clientes=selected_client_incomplete,
+                                                           tipos=selected_device_incomplete,
+                                                           campo_vacio=selected_missing_field or None,
+                                                           incompletos=True),
+                                             f'{sheet}_registros_incompletos', with_missing=True)
                     
                     # Gráfico de completitud de datos
                     st.write("### Completitud de Datos por Campo")
@@ -493,52 +455,223 @@ if st.button("Ejecutar procesamiento de datos"):
 
             # Mostrar datos en tabla con filtros
             st.write("### Datos Detallados")
-            if sheet_data:
-                df = pd.DataFrame(sheet_data, columns=[
-                    'Nombre', 'Cliente_Cuenta', 'Tipo_de_Dispositivo', 'IMEI', 'ICCID',
-                    'Fecha_de_Activacion', 'Fecha_de_Desactivacion', 'Hora_de_Ultimo_Mensaje',
-                    'Ultimo_Reporte', 'Vehiculo', 'Servicios', 'Grupo', 'Telefono', 'Origen', 'Fecha_Archivo'
-                ])
-                
-                # Agregar filtros
-                col1, col2 = st.columns(2)
-                with col1:
-                    if 'Cliente_Cuenta' in df.columns:
-                        # Filtrar y manejar valores None
-                        unique_clients = df['Cliente_Cuenta'].unique()
-                        valid_clients = sorted([x for x in unique_clients if x is not None and str(x).strip()], key=str)
+            if total_sheet > 0:
+                with closing(connect(today_db_path)) as conn:
+                    plataforma = build_filters(archivo, origen=origen)
+                    # Agregar filtros
+                    col1, col2 = st.columns(2)
+                    with col1:
                         selected_client = st.multiselect(
                             'Filtrar por Cliente:',
-                            options=valid_clients,
-                            default=[]
+                            options=distinct_values(conn, 'datos', 'Cliente_Cuenta', plataforma),
+                            default=[],
+                            key=f'{sheet}_clientes',
                         )
-                with col2:
-                    if 'Tipo_de_Dispositivo' in df.columns:
-                        # Filtrar y manejar valores None
-                        unique_devices = df['Tipo_de_Dispositivo'].unique()
-                        valid_devices = sorted([x for x in unique_devices if x is not None and str(x).strip()], key=str)
+                    with col2:
                         selected_device = st.multiselect(
                             'Filtrar por Tipo de Dispositivo:',
-                            options=valid_devices,
-                            default=[]
+                            options=distinct_values(conn, 'datos', 'Tipo_de_Dispositivo', plataforma),
+                            default=[],
+                            key=f'{sheet}_tipos',
                         )
-                
-                # Aplicar filtros
-                if selected_client:
-                    df = df[df['Cliente_Cuenta'].isin(selected_client)]
-                if selected_device:
-                    df = df[df['Tipo_de_Dispositivo'].isin(selected_device)]
-                
-                # Mostrar datos filtrados
-                st.dataframe(df, use_container_width=True)
-                
-                # Exportar datos
-                csv = df.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label=f"Descargar datos de {sheet} como CSV",
-                    data=csv,
-                    file_name=f'{sheet}_datos.csv',
-                    mime='text/csv',
-                )
+                    # Mostrar la página de datos filtrados con opción de exportación
+                    show_paged_table(conn, f'{sheet}_datos', 'datos',
+                                     build_filters(archivo, origen=origen, clientes=selected_client,
+                                                   tipos=selected_device),
+                                     f'{sheet}_datos')
             else:
                 st.info(f"No hay datos disponibles para {sheet}")
+
+# Consultas sobre la base de datos del día (usan los índices de la tabla datos)
+if os.path.exists(today_db_path):
+    st.write("## Consulta de Dispositivos")
+    with closing(connect(today_db_path)) as conn:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            search_imei = st.text_input("IMEI")
+        with col2:
+            search_iccid = st.text_input("ICCID")
+        with col3:
+            search_telefono = st.text_input("Teléfono")
+        if search_imei or search_iccid or search_telefono:
+            df_found = find_devices(conn, imei=search_imei, iccid=search_iccid, telefono=search_telefono)
+            if df_found.empty:
+                st.info("No se encontraron dispositivos con esos datos")
+            else:
+                st.dataframe(df_found, use_container_width=True)
+            has_entities = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entidad_registros'").fetchone()
+            if has_entities:
+                df_entity = find_entity(conn, imei=search_imei, iccid=search_iccid, telefono=search_telefono)
+                if not df_entity.empty:
+                    st.write("Registros del mismo dispositivo en todas las plataformas:")
+                    st.dataframe(df_entity, use_container_width=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            query_client = st.selectbox("Dispositivos del cliente:", [''] + list_clients(conn))
+        with col2:
+            query_origin = st.selectbox("Plataforma:", [''] + list(default_mappings.keys()))
+        if query_client:
+            df_client = devices_by_client(conn, query_client, origen=query_origin or None)
+            st.write(f"{len(df_client)} dispositivos de {query_client}")
+            st.dataframe(df_client, use_container_width=True)
+
+        # Consultas por fecha (rangos sobre las columnas epoch indexadas)
+        col1, col2 = st.columns(2)
+        with col1:
+            dias_sin_reporte = st.number_input("Días sin mensaje ni reporte:", min_value=0, value=0, step=1)
+        with col2:
+            rango_activacion = st.date_input("Activados entre:", value=())
+        if dias_sin_reporte:
+            df_stale = stale_devices(conn, dias_sin_reporte, origen=query_origin or None)
+            st.write(f"{len(df_stale)} dispositivos sin mensaje ni reporte en {dias_sin_reporte} días")
+            st.dataframe(df_stale, use_container_width=True)
+        if len(rango_activacion) == 2:
+            inicio, fin = rango_activacion
+            df_activated = activated_between(conn, datetime.combine(inicio, datetime.min.time()),
+                                             datetime.combine(fin, datetime.min.time()) + timedelta(days=1),
+                                             origen=query_origin or None)
+            st.write(f"{len(df_activated)} dispositivos activados entre {inicio} y {fin}")
+            st.dataframe(df_activated, use_container_width=True)
+
+        df_fechas = unrecognized_dates_report(conn)
+        if not df_fechas.empty:
+            with st.expander(f"Fechas no reconocidas ({int(df_fechas['Registros'].sum())} valores)"):
+                st.dataframe(df_fechas, use_container_width=True)
+
+    # Unificación de dispositivos entre plataformas (por IMEI, ICCID y Teléfono)
+    st.write("## Dispositivos Unificados entre Plataformas")
+    incluir_anteriores = st.checkbox("Incluir las bases de datos de días anteriores")
+    if st.button("Unificar dispositivos"):
+        with closing(connect(today_db_path)) as conn:
+            otras = other_daily_databases(today_db_path) if incluir_anteriores else []
+            unify_devices(conn, today_db_path, otras)
+    with closing(connect(today_db_path)) as conn:
+        has_entities = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entidades'").fetchone()
+        if has_entities:
+            total_entities = conn.execute('SELECT COUNT(*) FROM entidades').fetchone()[0]
+            conflict_counts = dict(conn.execute('SELECT Tipo, COUNT(*) FROM conflictos_entidad GROUP BY Tipo'))
+            etiquetas = {
+                'varios_clientes': "Con varios clientes",
+                'varios_imei': "Con varios IMEI",
+                'varios_iccid': "Con varios ICCID",
+                'falta_en_referencia': f"Sin registro en {REFERENCE_ORIGIN}",
+            }
+            columns = st.columns(len(CONFLICT_TYPES) + 1)
+            with columns[0]:
+                st.metric("Dispositivos", total_entities)
+            for column, tipo in zip(columns[1:], CONFLICT_TYPES):
+                with column:
+                    st.metric(etiquetas[tipo], conflict_counts.get(tipo, 0))
+            tipo_conflicto = st.selectbox("Conflictos:", [''] + list(CONFLICT_TYPES),
+                                          format_func=lambda tipo: etiquetas.get(tipo, 'Todos'))
+            df_conflicts = conflicts_report(conn, tipo_conflicto or None)
+            if df_conflicts.empty:
+                st.info("No hay conflictos entre plataformas")
+            else:
+                st.dataframe(df_conflicts, use_container_width=True)
+        else:
+            st.info("Aún no se han unificado los dispositivos de la base de datos del día")
+
+    # Reporte de cambios del día (una consulta sobre el índice de la tabla cambios)
+    if registrar_cambios:
+        st.write("## Cambios Respecto al Día Anterior")
+        with closing(connect(today_db_path)) as conn:
+            has_changes = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cambios'").fetchone()
+            df_changes = changes_report(conn, database_date(today_db_path)) if has_changes else None
+        if df_changes is None or df_changes.empty:
+            st.info("No hay cambios registrados para hoy")
+        else:
+            col1, col2, col3 = st.columns(3)
+            counts = df_changes['Tipo'].value_counts()
+            with col1:
+                st.metric("Altas", int(counts.get('alta', 0)))
+            with col2:
+                st.metric("Bajas", int(counts.get('baja', 0)))
+            with col3:
+                st.metric("Modificados", int(counts.get('cambio', 0)))
+            st.dataframe(df_changes, use_container_width=True)
+
+# Histórico de las cargas diarias: las tendencias se consultan en el resumen diario
+# de historico.db, sin abrir las bases de cada día
+st.write("## Histórico")
+with closing(open_history(history_path(default_excel_path))) as conn:
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Consolidar bases diarias"):
+            consolidadas = consolidate_folder(conn, default_excel_path)
+            st.success(f"{len(consolidadas)} bases diarias consolidadas en el histórico")
+    with col2:
+        if st.button("Compactar histórico"):
+            counts = compact_history(conn)
+            st.success(f"{counts['compactadas']} fechas quedaron solo con su resumen; "
+                       f"{counts['eliminadas']} fechas eliminadas")
+    tab_tendencias, tab_equipo, tab_particiones = st.tabs(["Tendencias", "Historia de un equipo", "Particiones"])
+    with tab_tendencias:
+        inicio_historico, fin_historico = history_range(conn)
+        if inicio_historico is None:
+            st.info("El histórico está vacío; consolida las bases diarias para consultarlo")
+        else:
+            inicio_historico = datetime.strptime(inicio_historico, '%Y-%m-%d').date()
+            fin_historico = datetime.strptime(fin_historico, '%Y-%m-%d').date()
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                metrica = st.selectbox("Métrica:", ROLLUP_METRICS, index=ROLLUP_METRICS.index('Activos'))
+            with col2:
+                origen_historico = st.selectbox("Plataforma (histórico):", [''] + list(default_mappings.keys()),
+                                                format_func=lambda origen: origen or 'Todas')
+            with col3:
+                agrupar = st.selectbox("Agrupar por:", ['Origen', 'Cliente_Cuenta', 'Tipo_de_Dispositivo'])
+            col1, col2 = st.columns(2)
+            with col1:
+                clientes_historico = st.multiselect("Clientes (histórico):",
+                                                    history_clients(conn, origen_historico or None), default=[])
+            with col2:
+                rango_historico = st.date_input(
+                    "Fechas:", value=(max(inicio_historico, fin_historico - timedelta(days=90)), fin_historico),
+                    min_value=inicio_historico, max_value=fin_historico)
+            if len(rango_historico) == 2:
+                df_trend = trend(conn, rango_historico[0].isoformat(), rango_historico[1].isoformat(), metrica,
+                                 origen=origen_historico or None, clientes=clientes_historico, group_by=agrupar)
+                if df_trend.empty:
+                    st.info("No hay datos en el histórico para esos filtros")
+                else:
+                    df_trend[agrupar] = df_trend[agrupar].fillna('Sin dato')
+                    df_trend = df_trend.pivot(index='Fecha_Archivo', columns=agrupar, values=metrica).fillna(0)
+                    st.line_chart(df_trend)
+                    st.dataframe(df_trend, use_container_width=True)
+    with tab_equipo:
+        # Detalle de un IMEI en todas las fechas del histórico (las fechas compactadas
+        # ya no tienen detalle)
+        imei_historico = st.text_input("IMEI (histórico):")
+        if imei_historico.strip():
+            df_equipo = device_history(conn, imei_historico)
+            if df_equipo.empty:
+                st.info("El IMEI no aparece en el detalle del histórico")
+            else:
+                st.write(f"{len(df_equipo)} registros entre {df_equipo['Fecha_Archivo'].iloc[0]} "
+                         f"y {df_equipo['Fecha_Archivo'].iloc[-1]}")
+                st.dataframe(df_equipo, use_container_width=True)
+    with tab_particiones:
+        st.dataframe(partitions_report(conn), use_container_width=True)
+
+# Registro de trabajos de procesamiento del servidor
+jobs = list_jobs()
+if jobs:
+    with st.expander("Trabajos de procesamiento"):
+        st.dataframe(pd.DataFrame([{
+            'Trabajo': job.id,
+            'Archivo': job.name,
+            'Estado': job.status,
+            'Inicio': datetime.fromtimestamp(job.started).strftime('%H:%M:%S'),
+            'Duración (s)': round(job.elapsed(), 1),
+            'Error': job.error,
+        } for job in jobs]), use_container_width=True)
+
+# Mientras corre el procesamiento, la página se vuelve a ejecutar para mostrar el avance
+if trabajo is not None and trabajo.is_running():
+    time.sleep(PROGRESS_REFRESH_S)
+    st.experimental_rerun()
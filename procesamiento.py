@@ -0,0 +1,524 @@
+import itertools
+import numpy as np
+import pandas as pd
+import re
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from datetime import datetime
+
+# Funciones de almacenamiento (también disponibles desde este módulo)
+from almacenamiento import (
+    FIELDS,
+    bulk_insert,
+    clear_not_inserted,
+    connect,
+    create_indexes,
+    create_schema,
+)
+from fechas import normalize_dates
+from lectores import iter_sheets, list_sheets, resolve_reader
+from lotes import RecordBatch, count_records, records_frame
+from mapeos import check_headers, compile_mapping, log_plan_issues
+from metricas import RunMetrics, log_row, sample_positions
+
+# Archivo y formato del log de procesamiento
+LOG_FILE = 'procesamiento.log'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Configuración básica de logging (la llaman la interfaz y el procesamiento por lotes)
+def configure_logging(filemode='w'):
+    logging.basicConfig(level=logging.INFO, filename=LOG_FILE, filemode=filemode, format=LOG_FORMAT)
+
+# Ruta predeterminada
+default_excel_path = r"C:\Users\capac\OneDrive\Escritorio\Actividades de Sims\bd_sims"
+
+# Mapeos predeterminados basados en el nombre de la pestaña
+default_mappings = {
+    "WIALON": {
+        'Nombre': 'Nombre',
+        'Cliente_Cuenta': 'Cuenta',
+        'Tipo_de_Dispositivo': 'Tipo de dispositivo',
+        'IMEI': 'IMEI',
+        'ICCID': 'Iccid',
+        'Fecha_de_Activacion': 'Creada',
+        'Fecha_de_Desactivacion': 'Desactivación',
+        'Hora_de_Ultimo_Mensaje': 'Hora de último mensaje',
+        'Ultimo_Reporte': 'Ultimo Reporte',
+        'Vehiculo': None,
+        'Servicios': None,
+        'Grupo': 'Grupos',
+        'Telefono': 'Teléfono',
+        'Origen': 'WIALON',  # Asignado manualmente
+        'Fecha_Archivo': None  # Extraído del nombre del archivo
+    },
+    "ADAS": {
+        'Nombre': 'equipo',
+        'Cliente_Cuenta': 'Subordinar',
+        'Tipo_de_Dispositivo': 'Modelo',
+        'IMEI': 'IMEI',
+        'ICCID': 'Iccid',
+        'Fecha_de_Activacion': 'Activation Date',
+        'Fecha_de_Desactivacion': None,
+        'Hora_de_Ultimo_Mensaje': None,
+        'Ultimo_Reporte': None,
+        'Vehiculo': None,
+        'Servicios': None,
+        'Grupo': None,
+        'Telefono': 'Número de tarjeta SIM',
+        'Origen': 'ADAS',  # Asignado manualmente
+        'Fecha_Archivo': None  # Extraído del nombre del archivo
+    },
+    "COMBUSTIBLE": {
+        'Nombre': 'Vehículo',
+        'Cliente_Cuenta': 'Cuenta',
+        'Tipo_de_Dispositivo': 'Tanques',
+        'IMEI': None,
+        'ICCID': None,
+        'Fecha_de_Activacion': None,
+        'Fecha_de_Desactivacion': None,
+        'Hora_de_Ultimo_Mensaje': None,
+        'Ultimo_Reporte': 'Último reporte',
+        'Vehiculo': 'Vehículo',
+        'Servicios': 'Servicios',
+        'Grupo': 'Grupos',
+        'Telefono': 'Línea',
+        'Origen': 'COMBUSTIBLE',  # Asignado manualmente
+        'Fecha_Archivo': None  # Extraído del nombre del archivo
+    }
+}
+
+# Función para limpiar el campo Telefono (sin validación de cantidad de dígitos)
+def clean_telefono(telefono):
+    if telefono:
+        telefono = re.sub(r'\D', '', str(telefono))
+        if telefono:  # Solo verifica que no esté vacío después de limpiar
+            return telefono
+    return None
+
+# Función para extraer la fecha del nombre del archivo
+def extract_date_from_filename(filename):
+    match = re.search(r'\d{4}-\d{2}-\d{2}', filename)
+    if match:
+        return match.group(0)
+    else:
+        return datetime.now().strftime('%Y-%m-%d')
+
+# Extensiones de los archivos de entrada (los .csv son un archivo por plataforma)
+INPUT_EXTENSIONS = ('.xlsx', '.csv')
+
+# Cantidad de registros homologados que se entregan por lote al escritor de SQLite
+BATCH_SIZE = 5000
+
+# Excepción con la que se detiene un procesamiento cancelado (ver trabajos.py)
+class ProcessingCancelled(Exception):
+    pass
+
+# Función para detener el procesamiento si se pidió cancelarlo. `cancel` es un
+# threading.Event o None.
+def check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise ProcessingCancelled()
+
+# Función para convertir el mapeo de una pestaña en un plan de extracción: por cada
+# campo homologado, el índice de la columna de origen o el valor constante a usar.
+# Los índices salen del mapeo compilado contra los encabezados (ver mapeos.py), que
+# acepta diferencias de acentos, mayúsculas y espacios.
+def build_column_plan(headers, mapping, fecha_archivo, sheet_name=None):
+    indices = compile_mapping(sheet_name, headers, mapping).indices
+    plan = []
+    for field, idx in zip(FIELDS, indices):
+        if field == 'Origen':
+            plan.append((None, mapping['Origen']))
+        elif field == 'Fecha_Archivo':
+            plan.append((None, fecha_archivo))
+        else:
+            plan.append((idx, None))
+    return plan
+
+# Función para obtener los campos que el plan llena con un valor constante (Origen,
+# Fecha_Archivo y los campos sin columna de origen en un bloque de `width` columnas)
+def constant_fields(plan, width):
+    return {field: const for field, (idx, const) in zip(FIELDS, plan) if idx is None or idx >= width}
+
+# Máscara vectorizada equivalente a evaluar "if valor" en cada celda. Se evalúa sobre
+# el arreglo de objetos: las comparaciones de una Series de objetos cuestan varias
+# veces más.
+def _truthy_mask(column):
+    values = column.to_numpy(dtype=object)
+    return pd.Series(pd.notna(values) & (values != '') & (values != 0), index=column.index)
+
+# Caracteres que no son dígitos (los que quita clean_telefono)
+NON_DIGITS = re.compile(r'\D')
+
+# Versión vectorizada de clean_telefono para una columna completa. Trabaja sobre
+# arreglos de numpy: asignar con máscara en una Series de objetos pasa por la ruta
+# lenta de pandas.
+def clean_telefono_series(column):
+    cleaned = np.full(len(column), None, dtype=object)
+    truthy = _truthy_mask(column).to_numpy()
+    if truthy.any():
+        # Como texto con str(), igual que clean_telefono
+        digits = column.to_numpy(dtype=object)[truthy].astype(str)
+        # Solo se aplica la expresión regular a los valores que no son ya solo dígitos
+        needs_cleaning = ~np.char.isdecimal(digits)
+        digits = digits.astype(object)
+        if needs_cleaning.any():
+            digits[needs_cleaning] = [NON_DIGITS.sub('', value) for value in digits[needs_cleaning]]
+        digits[digits == ''] = None
+        cleaned[truthy] = digits
+    return pd.Series(cleaned, index=column.index)
+
+# Función para homologar un bloque de filas de una pestaña. El mapeo se aplica como
+# selección de columnas por posición, Origen y Fecha_Archivo se llenan como columnas
+# constantes y el campo requerido Cliente_Cuenta se filtra con una máscara. Si no se
+# recibe el plan de la pestaña, se construye con los encabezados.
+# Devuelve el DataFrame homologado (columnas FIELDS) y la máscara de filas válidas.
+def homologate_frame(frame, mapping, fecha_archivo, headers=None, plan=None):
+    if plan is None:
+        plan = build_column_plan(list(frame.columns) if headers is None else headers, mapping, fecha_archivo)
+    required_idx = plan[FIELDS.index('Cliente_Cuenta')][0]  # Solo Cliente_Cuenta es requerido
+    if required_idx is None or required_idx >= frame.shape[1]:
+        valid = pd.Series(False, index=frame.index)
+    else:
+        valid = _truthy_mask(frame.iloc[:, required_idx])
+    rows = frame[valid.to_numpy()]
+    columns = {}
+    for field, (idx, const) in zip(FIELDS, plan):
+        if idx is None or idx >= rows.shape[1]:
+            columns[field] = pd.Series(np.full(len(rows), const, dtype=object), index=rows.index)
+        else:
+            columns[field] = rows.iloc[:, idx]
+    columns['Telefono'] = clean_telefono_series(columns['Telefono'])
+    return pd.DataFrame(columns), valid
+
+# Función para leer el archivo de entrada en modo streaming y entregar lotes de
+# registros homologados. Las filas se leen con el lector indicado (ver lectores.py;
+# por defecto el más rápido disponible) en bloques de batch_size y cada bloque se
+# homologa de forma vectorizada. Los conteos se acumulan en stats y, si se
+# proporciona invalid_data, ahí se guardan los registros inválidos.
+# Con sheet_names se limita la lectura a esas pestañas. Si se proporciona progress, se
+# llama después de cada bloque con la pestaña, las filas leídas y las filas que
+# declara la pestaña (None si el archivo no lo indica); si se activa cancel, la
+# lectura se detiene con ProcessingCancelled.
+# Antes de leer cualquier fila se compilan los mapeos con solo los encabezados del
+# archivo; las diferencias se escriben en el log y el reporte de cada pestaña queda
+# en stats['encabezados'].
+def iter_excel_batches(excel_file, mappings, batch_size=BATCH_SIZE, stats=None, invalid_data=None,
+                       sheet_names=None, progress=None, cancel=None, reader=None):
+    if stats is None:
+        stats = {}
+    stats.setdefault('total_records', 0)
+    stats.setdefault('invalid_records', 0)
+    sheet_stats = stats.setdefault('sheets', {})
+    filename = os.path.basename(excel_file)  # Obtener solo el nombre del archivo
+    fecha_archivo = extract_date_from_filename(filename)
+    wanted = [sheet_name for sheet_name in mappings if sheet_names is None or sheet_name in sheet_names]
+    header_report = stats.setdefault('encabezados', {})
+    try:
+        mapping_plans = check_headers(excel_file, mappings, reader, wanted)
+    except Exception as e:
+        # Si no se pueden leer los encabezados por separado, cada pestaña se revisa al leerla
+        logging.warning(f"No se pudieron revisar los encabezados de '{filename}' antes de leerlo: {e}")
+        mapping_plans = {}
+    for sheet_name, mapping_plan in mapping_plans.items():
+        log_plan_issues(mapping_plan, filename)
+        header_report[sheet_name] = mapping_plan.report
+    with closing(iter_sheets(excel_file, wanted, reader)) as sheets:
+        for sheet_name, headers, rows, expected_rows in sheets:
+            counters = sheet_stats.setdefault(sheet_name, {'rows_read': 0, 'valid': 0, 'invalid': 0})
+            # El plan ya compilado se toma del caché de mapeos
+            mapping_plan = compile_mapping(sheet_name, headers, mappings[sheet_name])
+            if header_report.get(sheet_name) is not mapping_plan.report:
+                log_plan_issues(mapping_plan, filename)
+                header_report[sheet_name] = mapping_plan.report
+            plan = build_column_plan(headers, mappings[sheet_name], fecha_archivo, sheet_name)
+            for chunk in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+                frame = pd.DataFrame(chunk, dtype=object)
+                homologated, valid = homologate_frame(frame, mappings[sheet_name], fecha_archivo, headers, plan)
+                batch = RecordBatch.from_frame(homologated, constant_fields(plan, frame.shape[1]))
+                invalid_positions = np.flatnonzero(~valid.to_numpy())
+                # Detalle por fila solo para la muestra configurada en metricas
+                for pos in sample_positions(counters['rows_read'], len(chunk)):
+                    log_row(f"Muestra de la pestaña '{sheet_name}', fila {counters['rows_read'] + pos + 2} "
+                            f"({'válida' if valid.iat[pos] else 'inválida'}): {dict(zip(headers, chunk[pos]))}")
+                stats['total_records'] += len(chunk)
+                stats['invalid_records'] += len(invalid_positions)
+                counters['rows_read'] += len(chunk)
+                counters['valid'] += len(batch)
+                counters['invalid'] += len(invalid_positions)
+                if invalid_data is not None:
+                    invalid_data.extend(dict(zip(headers, chunk[pos])) for pos in invalid_positions)
+                if progress is not None:
+                    progress(sheet_name, counters['rows_read'], expected_rows)
+                check_cancelled(cancel)
+                if batch:
+                    yield batch
+            logging.info(f"Pestaña '{sheet_name}': {counters['valid']} registros válidos, {counters['invalid']} inválidos")
+
+# Función para procesar el archivo Excel con múltiples pestañas. Los registros
+# homologados se devuelven como la lista de lotes en columnas (RecordBatch) en el
+# orden de lectura. reader elige el lector (ver lectores.py).
+def process_excel_file(excel_file, mappings, stats=None, progress=None, cancel=None, reader=None):
+    all_data = []
+    invalid_data = []
+    stats = {} if stats is None else stats
+    for batch in iter_excel_batches(excel_file, mappings, stats=stats, invalid_data=invalid_data,
+                                    progress=progress, cancel=cancel, reader=reader):
+        all_data.append(batch)
+    return all_data, invalid_data, stats['total_records']
+
+# Función para repartir las marcas de insertado/duplicado entre las pestañas. Los
+# registros válidos de cada pestaña son contiguos y están en el orden de lectura.
+def count_inserted_by_sheet(metrics, flags):
+    start = 0
+    for counters in metrics.sheets.values():
+        stop = start + counters['valid']
+        inserted = flags.count(1, start, stop)
+        counters['inserted'] += inserted
+        counters['duplicates'] += stop - start - inserted
+        start = stop
+
+# Etiqueta con la que se informa el avance de la inserción
+INSERTION_PROGRESS = 'Inserción'
+
+# Función para entregar los lotes de la inserción informando el avance y revisando
+# la cancelación antes de cada lote
+def _watch_insertion(batches, progress, cancel):
+    total = count_records(batches)
+    done = 0
+    for batch in batches:
+        check_cancelled(cancel)
+        yield batch
+        done += len(batch)
+        if progress is not None:
+            progress(INSERTION_PROGRESS, done, total)
+
+# Función para procesar un archivo Excel completo e insertarlo en la base de datos.
+# Devuelve el resultado que usa la interfaz: los registros homologados, la marca de
+# insertado/duplicado de cada uno, los conteos de registros leídos e inválidos y
+# las métricas de la corrida (contadores por pestaña y tiempos por fase).
+# progress, cancel y reader son los de iter_excel_batches; progress y cancel también
+# se aplican a la inserción: si se cancela durante la inserción, bulk_insert revierte
+# la transacción y la base de datos queda como estaba. Una vez confirmada la inserción, la corrida termina.
+def ingest_excel_file(excel_file, mappings, db_path, progress=None, cancel=None, reader=None):
+    metrics = RunMetrics(os.path.basename(excel_file))
+    stats = {}
+    with metrics.phase('lectura_homologacion') as phase:
+        all_data, invalid_data, total_records = process_excel_file(excel_file, mappings, stats, progress, cancel,
+                                                                   reader)
+        phase['rows'] = total_records
+    metrics.add_sheet_stats(stats['sheets'])
+    conn = connect(db_path)
+    try:
+        create_schema(conn)
+        with metrics.phase('insercion', count_records(all_data)):
+            clear_not_inserted(conn, os.path.basename(excel_file))
+            flags = bulk_insert(conn, _watch_insertion(all_data, progress, cancel), os.path.basename(excel_file))
+        with metrics.phase('fechas') as phase:
+            phase['rows'] = normalize_dates(conn)['reviewed']
+        with metrics.phase('indices'):
+            create_indexes(conn)
+    finally:
+        conn.close()
+    count_inserted_by_sheet(metrics, flags)
+    metrics.log_summary()
+    return {
+        'all_data': all_data,
+        'flags': flags,
+        'total_records': total_records,
+        'invalid_records': len(invalid_data),
+        'metricas': metrics.to_dict(),
+        'encabezados': stats['encabezados'],
+    }
+
+# Función para cargar el archivo Excel directamente en la base de datos por lotes,
+# con una sola conexión y sin retener los registros en memoria (la memoria no crece
+# con el tamaño del archivo). Es la carga secuencial de procesar_lote.py. Sin reader
+# se lee con openpyxl, en streaming (calamine cargaría cada pestaña completa).
+def load_excel_file(excel_file, mappings, db_path, batch_size=BATCH_SIZE, reader=None):
+    reader = resolve_reader(excel_file, reader, streaming=True)
+    metrics = RunMetrics(os.path.basename(excel_file))
+    stats = {}
+    conn = connect(db_path)
+    try:
+        create_schema(conn)
+        with metrics.phase('lectura_insercion') as phase:
+            clear_not_inserted(conn, os.path.basename(excel_file))
+            flags = bulk_insert(conn, iter_excel_batches(excel_file, mappings, batch_size, stats=stats, reader=reader),
+                                os.path.basename(excel_file))
+            phase['rows'] = stats['total_records']
+        with metrics.phase('fechas') as phase:
+            phase['rows'] = normalize_dates(conn)['reviewed']
+        with metrics.phase('indices'):
+            create_indexes(conn)
+    finally:
+        conn.close()
+    metrics.add_sheet_stats(stats['sheets'])
+    count_inserted_by_sheet(metrics, flags)
+    metrics.log_summary()
+    stats['inserted'] = sum(flags)
+    stats['not_inserted'] = len(flags) - stats['inserted']
+    stats['metricas'] = metrics.to_dict()
+    return stats
+
+# Función para obtener las pestañas del archivo Excel que tienen un mapeo definido
+def list_mapped_sheets(excel_file, mappings, reader=None):
+    return list_sheets(excel_file, list(mappings), reader)
+
+# Función para obtener los archivos .xlsx y .csv a partir de una lista de archivos o directorios
+def collect_excel_files(paths):
+    excel_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            excel_files.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(INPUT_EXTENSIONS))
+        elif path.endswith(INPUT_EXTENSIONS):
+            excel_files.append(path)
+        else:
+            logging.warning(f"Se omite '{path}': no es un archivo .xlsx o .csv ni un directorio")
+    return excel_files
+
+# Función que ejecuta cada proceso del pool: homologa una sola pestaña de un archivo
+def process_excel_sheet(excel_file, sheet_name, mappings, reader=None):
+    stats = {}
+    batches = list(iter_excel_batches(excel_file, mappings, stats=stats, sheet_names=[sheet_name], reader=reader))
+    return batches, stats
+
+# Inicializador de los procesos del pool (en Windows no heredan la configuración de logging)
+def _init_worker():
+    configure_logging(filemode='a')
+
+# Función para procesar varios archivos Excel en paralelo. Cada pestaña se homologa
+# en un proceso del pool y un único escritor (este proceso) inserta los lotes en la
+# base de datos en el orden de los archivos, para que la clasificación de duplicados
+# sea la misma que en un procesamiento secuencial.
+def process_files_parallel(excel_files, mappings, db_path, max_workers=None, reader=None):
+    results = {}
+    metrics = RunMetrics(f'{len(excel_files)} archivo(s) en paralelo')
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        tasks = []
+        for excel_file in excel_files:
+            results[excel_file] = {'total_records': 0, 'invalid_records': 0, 'inserted': 0, 'not_inserted': 0,
+                                   'encabezados': {}}
+            for sheet_name in list_mapped_sheets(excel_file, mappings, reader):
+                tasks.append((excel_file, sheet_name,
+                              executor.submit(process_excel_sheet, excel_file, sheet_name, mappings, reader)))
+        conn = connect(db_path)
+        try:
+            create_schema(conn)
+            with metrics.phase('lectura_insercion') as phase:
+                started = set()
+                for excel_file, sheet_name, future in tasks:
+                    batches, stats = future.result()
+                    # Antes de la primera pestaña de cada archivo se quita su carga anterior de no_insertados
+                    if excel_file not in started:
+                        clear_not_inserted(conn, os.path.basename(excel_file))
+                        started.add(excel_file)
+                    flags = bulk_insert(conn, batches, os.path.basename(excel_file))
+                    inserted = flags.count(1)
+                    file_stats = results[excel_file]
+                    file_stats['total_records'] += stats['total_records']
+                    file_stats['invalid_records'] += stats['invalid_records']
+                    file_stats['inserted'] += inserted
+                    file_stats['not_inserted'] += len(flags) - inserted
+                    file_stats['encabezados'].update(stats['encabezados'])
+                    counters = metrics.sheet(f'{os.path.basename(excel_file)}/{sheet_name}')
+                    for sheet_counters in stats['sheets'].values():
+                        for counter, value in sheet_counters.items():
+                            counters[counter] += value
+                    counters['inserted'] += inserted
+                    counters['duplicates'] += len(flags) - inserted
+                    phase['rows'] += stats['total_records']
+            with metrics.phase('fechas') as phase:
+                phase['rows'] = normalize_dates(conn)['reviewed']
+            with metrics.phase('indices'):
+                create_indexes(conn)
+        finally:
+            conn.close()
+    metrics.log_summary()
+    return results
+
+# Función para calcular el resumen por plataforma (registros válidos y porcentaje del total leído)
+def summarize_by_platform(counts, total_records, mappings):
+    summary_data = []
+    for sheet in mappings:
+        total_sheet = counts.get(mappings[sheet]['Origen'], 0)
+        percentage = (total_sheet / total_records * 100) if total_records > 0 else 0
+        summary_data.append({
+            "Plataforma": sheet,
+            "Total Registros": total_sheet,
+            "Porcentaje": f"{percentage:.1f}%"
+        })
+    return summary_data
+
+# Función para construir el resultado particionado por Origen a partir de los lotes:
+# un único DataFrame con todos los registros (los campos codificados o constantes
+# quedan como columnas categóricas) y, por cada Origen, una vista de sus filas y su conteo. Como cada
+# pestaña se lee completa antes de la siguiente, las filas de un Origen suelen ser
+# contiguas y la partición es un corte (sin copia) del DataFrame completo.
+def partition_records(all_data, mappings):
+    df_all = records_frame(all_data)
+    positions = df_all.groupby('Origen', sort=False, observed=True).indices
+    partitions = {}
+    for sheet in mappings:
+        origen = mappings[sheet]['Origen']
+        rows = positions.get(origen)
+        if rows is None:
+            partitions[origen] = df_all.iloc[0:0]
+        elif rows[-1] - rows[0] + 1 == len(rows):
+            partitions[origen] = df_all.iloc[rows[0]:rows[-1] + 1]
+        else:
+            partitions[origen] = df_all.take(rows)
+    counts = {origen: len(partition) for origen, partition in partitions.items()}
+    return df_all, partitions, counts
+
+# Campos que se evalúan en las estadísticas de completitud (Origen y Fecha_Archivo
+# siempre tienen valor)
+PROFILE_FIELDS = FIELDS[:-2]
+
+# Función para marcar los datos omitidos de una columna: True donde el valor es nulo
+# o queda vacío al quitar espacios. En las columnas categóricas la comparación se
+# hace una sola vez por categoría.
+def missing_values(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        blank = np.flatnonzero(column.cat.categories.astype(str).str.strip() == '')
+        return pd.Series(np.isin(column.cat.codes.to_numpy(), np.append(blank, -1)), index=column.index)
+    return column.isna() | column.astype(str).str.strip().eq('')
+
+# Función para calcular el perfil de calidad de datos de una plataforma: conteos y
+# porcentajes por campo y el resumen de los campos con datos omitidos
+def profile_platform(df_sheet):
+    total_sheet = len(df_sheet)
+    field_stats = []
+    omitted_data = []
+    for field in PROFILE_FIELDS:
+        empty = int(missing_values(df_sheet[field]).sum())
+        non_empty = total_sheet - empty
+        field_stats.append({
+            "Campo": field,
+            "Registros con Datos": non_empty,
+            "Registros sin Datos": empty,
+            "Porcentaje Completitud": f"{(non_empty / total_sheet) * 100 if total_sheet else 0:.1f}%"
+        })
+        if empty > 0:
+            omitted_data.append({
+                "Campo": field,
+                "Registros Omitidos": empty,
+                "Porcentaje Omitido": f"{(empty / total_sheet) * 100:.1f}%"
+            })
+    return {
+        'total': total_sheet,
+        'field_stats': field_stats,
+        'omitted_data': omitted_data,
+    }
+
+# Función para calcular el perfil de cada plataforma a partir de sus particiones. Con
+# inserted (máscara de las filas del DataFrame completo que entraron en la tabla
+# datos), el perfil cuenta solo esas filas, las mismas que listan las tablas por
+# páginas de la interfaz.
+def build_profiles(partitions, inserted=None):
+    if inserted is not None:
+        partitions = {origen: partition[inserted[partition.index.to_numpy()]]
+                      for origen, partition in partitions.items()}
+    return {origen: profile_platform(partition) for origen, partition in partitions.items()}
@@ -0,0 +1,161 @@
+import argparse
+import os
+from contextlib import closing
+from datetime import datetime
+
+from almacenamiento import connect
+from cambios_diarios import compute_delta
+from procesamiento import (
+    collect_excel_files,
+    configure_logging,
+    default_excel_path,
+    default_mappings,
+    load_excel_file,
+    process_files_parallel,
+)
+from historico import compact_history, consolidate_folder, history_path, open_history
+from lectores import CALAMINE, OPENPYXL
+from mapeos import check_headers, describe_issue, header_issues, missing_required
+from unificacion import REFERENCE_ORIGIN, other_daily_databases, unify_devices
+from vigilancia import WATCH_INTERVAL, ingest_ready_files, watch_folder
+
+# Procesamiento por lotes sin interfaz: homologa uno o varios archivos Excel en
+# paralelo y los carga en la base de datos del día. Con --workers 1 los archivos se
+# cargan uno a uno en streaming (load_excel_file), con memoria constante sin importar
+# su tamaño.
+#
+#   python procesar_lote.py                       (todos los .xlsx y .csv de la ruta predeterminada)
+#   python procesar_lote.py exportes/ extra.xlsx --db 2024-05-01.db --workers 4
+#   python procesar_lote.py exportes/ --workers 1 (carga secuencial en streaming)
+#   python procesar_lote.py --delta               (además registra los cambios respecto al día anterior)
+#   python procesar_lote.py --unificar            (además unifica los dispositivos de todas las bases diarias)
+#   python procesar_lote.py --historico           (además consolida las bases diarias en historico.db)
+#   python procesar_lote.py --historico --compactar --sin-carga
+#   python procesar_lote.py exportes/ --verificar (solo revisa los encabezados contra los mapeos, sin leer filas)
+#   python procesar_lote.py exportes/ --vigilar   (carga los archivos nuevos o modificados de la carpeta cada minuto)
+#   python procesar_lote.py exportes/ --vigilar --una-vez
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Carga y homologación de archivos Excel en SQLite")
+    parser.add_argument('paths', nargs='*', default=[default_excel_path],
+                        help="Archivos .xlsx o directorios que los contienen")
+    parser.add_argument('--db', dest='db_path', default=None,
+                        help="Base de datos destino (por defecto AAAA-MM-DD.db en la ruta predeterminada)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Número de procesos para leer los archivos (por defecto, todos los núcleos; "
+                             "con 1 se cargan en streaming, sin retener los registros en memoria)")
+    parser.add_argument('--lector', choices=[CALAMINE, OPENPYXL], default=None,
+                        help="Lector de los .xlsx (por defecto calamine si está instalado, u openpyxl con --workers 1, "
+                             "que lee en streaming; los .csv usan el lector csv)")
+    parser.add_argument('--verificar', action='store_true',
+                        help="Solo revisar los encabezados de los archivos contra los mapeos, sin cargar nada")
+    parser.add_argument('--delta', action='store_true',
+                        help="Registrar altas, bajas y cambios respecto a la base de datos del día anterior")
+    parser.add_argument('--unificar', action='store_true',
+                        help="Unificar los dispositivos entre plataformas con las demás bases de datos diarias")
+    parser.add_argument('--historico', action='store_true',
+                        help="Consolidar las bases diarias nuevas o modificadas de la carpeta en historico.db")
+    parser.add_argument('--compactar', action='store_true',
+                        help="Con --historico, borrar el detalle antiguo del histórico (ver historico.py)")
+    parser.add_argument('--sin-carga', dest='sin_carga', action='store_true',
+                        help="No cargar archivos; solo las operaciones sobre el histórico")
+    parser.add_argument('--vigilar', action='store_true',
+                        help="Vigilar la carpeta y cargar solo los archivos nuevos o modificados (ver vigilancia.py)")
+    parser.add_argument('--intervalo', type=int, default=WATCH_INTERVAL,
+                        help="Segundos entre revisiones de la carpeta en el modo de vigilancia")
+    parser.add_argument('--una-vez', dest='una_vez', action='store_true',
+                        help="Con --vigilar, revisar la carpeta una sola vez y terminar")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    if args.vigilar:
+        folders = [path for path in args.paths if os.path.isdir(path)]
+        if len(folders) != 1:
+            print("Con --vigilar se indica una sola carpeta")
+            return 1
+        if args.una_vez:
+            for path, status in ingest_ready_files(folders[0], default_mappings, args.db_path).items():
+                print(f"{os.path.basename(path)}: {status}")
+        else:
+            watch_folder(folders[0], default_mappings, args.intervalo, args.db_path)
+        return 0
+    db_path = args.db_path or os.path.join(default_excel_path, f'{datetime.now().strftime("%Y-%m-%d")}.db')
+    if args.sin_carga:
+        return update_history(db_path, args.compactar)
+    excel_files = collect_excel_files(args.paths)
+    if not excel_files:
+        print("No se encontraron archivos .xlsx para procesar")
+        return 1
+    if args.verificar:
+        return verify_headers(excel_files, args.lector)
+    if args.workers == 1:
+        results = {excel_file: load_excel_file(excel_file, default_mappings, db_path, reader=args.lector)
+                   for excel_file in excel_files}
+    else:
+        results = process_files_parallel(excel_files, default_mappings, db_path, max_workers=args.workers,
+                                         reader=args.lector)
+    totals = {'total_records': 0, 'invalid_records': 0, 'inserted': 0, 'not_inserted': 0}
+    for excel_file, stats in results.items():
+        print(f"{os.path.basename(excel_file)}: {stats['total_records']} registros, "
+              f"{stats['inserted']} insertados, {stats['not_inserted']} no insertados, "
+              f"{stats['invalid_records']} inválidos")
+        print_header_issues(stats['encabezados'])
+        for key in totals:
+            totals[key] += stats[key]
+    print(f"Total: {totals['total_records']} registros, {totals['inserted']} insertados, "
+          f"{totals['not_inserted']} no insertados, {totals['invalid_records']} inválidos -> {db_path}")
+    if args.delta:
+        with closing(connect(db_path)) as conn:
+            counts = compute_delta(conn, db_path)
+        if counts is None:
+            print("No hay base de datos de un día anterior para comparar")
+        else:
+            print(f"Cambios respecto al día anterior: {counts['alta']} altas, {counts['baja']} bajas, "
+                  f"{counts['cambio']} modificados")
+    if args.unificar:
+        with closing(connect(db_path)) as conn:
+            counts = unify_devices(conn, db_path, other_daily_databases(db_path))
+        print(f"Unificación: {counts['entidades']} dispositivos en {counts['registros']} registros; conflictos: "
+              f"{counts['varios_clientes']} con varios clientes, {counts['varios_imei']} con varios IMEI, "
+              f"{counts['varios_iccid']} con varios ICCID, {counts['falta_en_referencia']} sin {REFERENCE_ORIGIN}")
+    if args.historico:
+        return update_history(db_path, args.compactar)
+    return 0
+
+# Función para imprimir los campos cuyo encabezado no coincidió exactamente con el mapeo
+def print_header_issues(report):
+    for row in header_issues(report):
+        print(f"  {describe_issue(row)}")
+
+# Función para revisar los encabezados de los archivos sin leer sus filas. Termina con
+# error si a algún archivo le falta la columna de un campo requerido.
+def verify_headers(excel_files, reader=None):
+    failed = False
+    for excel_file in excel_files:
+        report = {sheet_name: plan.report
+                  for sheet_name, plan in check_headers(excel_file, default_mappings, reader).items()}
+        issues = header_issues(report)
+        print(f"{os.path.basename(excel_file)}: {len(report)} pestañas, "
+              f"{'encabezados sin diferencias' if not issues else f'{len(issues)} campos con diferencias'}")
+        print_header_issues(report)
+        failed = failed or missing_required(report)
+    return 1 if failed else 0
+
+# Función para consolidar en el histórico las bases diarias de la carpeta de db_path
+# y, opcionalmente, compactarlo
+def update_history(db_path, compactar=False):
+    folder = os.path.dirname(os.path.abspath(db_path))
+    with closing(open_history(history_path(folder))) as conn:
+        results = consolidate_folder(conn, folder)
+        print(f"Histórico: {len(results)} bases consolidadas, "
+              f"{sum(sum(copied.values()) for copied in results.values())} registros -> {history_path(folder)}")
+        if compactar:
+            counts = compact_history(conn)
+            print(f"Histórico compactado: {counts['compactadas']} fechas solo con resumen, "
+                  f"{counts['eliminadas']} fechas eliminadas")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacenamiento import FIELDS, NOT_INSERTED_TABLE, bulk_insert, connect, create_schema
+from lotes import RecordBatch
+
+# Clasificación de bulk_insert contra la inserción original de la interfaz: un INSERT
+# por registro y la excepción de IntegrityError para separar los duplicados. Los
+# casos: claves repetidas entre lotes y dentro de un lote, claves con algún NULL
+# (nunca duplicadas), fechas como datetime y lotes en columnas con campos nulos.
+
+def _record(nombre, cuenta, telefono, **values):
+    values.update(Nombre=nombre, Cliente_Cuenta=cuenta, Telefono=telefono)
+    return tuple(values.get(field) for field in FIELDS)
+
+BATCHES = [
+    [
+        _record('Unidad 1', 'ACME', '5512345678', Origen='WIALON', Fecha_Archivo='2024-05-01',
+                Fecha_de_Activacion=datetime(2024, 1, 15, 8, 30)),
+        _record('Unidad 2', 'ACME', '5512345679', Origen='WIALON', IMEI=356938035643809),
+        # Repetido dentro del lote
+        _record('Unidad 1', 'ACME', '5512345678', Origen='WIALON', Grupo='Norte'),
+        # Claves con NULL: nunca duplicadas
+        _record('Unidad 3', 'ACME', None, Origen='WIALON'),
+        _record('Unidad 3', 'ACME', None, Origen='WIALON'),
+    ],
+    [
+        # Repetido de un lote anterior
+        _record('Unidad 2', 'ACME', '5512345679', Origen='COMBUSTIBLE'),
+        _record(None, 'Beta', '8112345', Origen='COMBUSTIBLE'),
+        _record('Unidad 4', 'Beta', '8112346', Origen='COMBUSTIBLE',
+                Fecha_de_Activacion=datetime(2023, 12, 31, 23, 59, 59)),
+    ],
+]
+
+def _insert_row_by_row(db_path, batches):
+    with closing(connect(db_path)) as conn:
+        create_schema(conn)
+        cursor = conn.cursor()
+        sql = f'INSERT INTO datos ({", ".join(FIELDS)}) VALUES ({", ".join("?" for _ in FIELDS)})'
+        flags = bytearray()
+        for record in (record for batch in batches for record in batch):
+            try:
+                cursor.execute(sql, record)
+                flags.append(1)
+            except sqlite3.IntegrityError:
+                flags.append(0)
+        conn.commit()
+    return flags
+
+def _datos(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        return conn.execute(f'SELECT {", ".join(FIELDS)} FROM datos ORDER BY rowid').fetchall()
+
+def _bulk(db_path, batches, archivo=None):
+    with closing(connect(db_path)) as conn:
+        create_schema(conn)
+        return bulk_insert(conn, batches, archivo)
+
+def test_bulk_insert_matches_row_by_row(tmp_path):
+    expected = _insert_row_by_row(str(tmp_path / 'fila.db'), BATCHES)
+    flags = _bulk(str(tmp_path / 'bloque.db'), BATCHES, '2024-05-01_prueba.xlsx')
+
+    assert list(flags) == [1, 1, 0, 1, 1, 0, 1, 1]
+    assert flags == expected
+    assert _datos(str(tmp_path / 'bloque.db')) == _datos(str(tmp_path / 'fila.db'))
+
+def test_bulk_insert_keeps_rejected_records(tmp_path):
+    db_path = str(tmp_path / 'bloque.db')
+    flags = _bulk(db_path, BATCHES, '2024-05-01_prueba.xlsx')
+    records = [record for batch in BATCHES for record in batch]
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        rejected = conn.execute(f'SELECT Nombre, Grupo, Origen, Archivo FROM {NOT_INSERTED_TABLE} '
+                                f'ORDER BY rowid').fetchall()
+        archivos = conn.execute('SELECT DISTINCT Archivo FROM datos').fetchall()
+    assert rejected == [('Unidad 1', 'Norte', 'WIALON', '2024-05-01_prueba.xlsx'),
+                        ('Unidad 2', None, 'COMBUSTIBLE', '2024-05-01_prueba.xlsx')]
+    assert len(rejected) == flags.count(0) == len(records) - sum(flags)
+    assert archivos == [('2024-05-01_prueba.xlsx',)]
+
+def test_bulk_insert_without_duplicates_skips_not_inserted(tmp_path):
+    db_path = str(tmp_path / 'bloque.db')
+    flags = _bulk(db_path, [BATCHES[0][:2], BATCHES[1][1:]])
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        assert conn.execute(f'SELECT COUNT(*) FROM {NOT_INSERTED_TABLE}').fetchone() == (0,)
+        assert conn.execute('SELECT COUNT(*) FROM datos WHERE Archivo IS NULL').fetchone() == (4,)
+    assert list(flags) == [1, 1, 1, 1]
+
+# Los lotes en columnas omiten sus campos nulos y pasan las fechas como texto; lo
+# guardado debe ser lo mismo que con las tuplas
+def test_bulk_insert_record_batches_match_tuples(tmp_path):
+    column_batches = []
+    for batch in BATCHES:
+        frame = pd.DataFrame(batch, columns=FIELDS, dtype=object)
+        constants = {field: None for field in FIELDS if frame[field].isna().all()}
+        column_batches.append(RecordBatch.from_frame(frame, constants))
+    assert column_batches[0].null_fields()
+
+    expected = _bulk(str(tmp_path / 'tuplas.db'), BATCHES, 'prueba.xlsx')
+    flags = _bulk(str(tmp_path / 'lotes.db'), column_batches, 'prueba.xlsx')
+
+    assert flags == expected
+    assert _datos(str(tmp_path / 'lotes.db')) == _datos(str(tmp_path / 'tuplas.db'))
+    assert _datos(str(tmp_path / 'lotes.db'))[0][FIELDS.index('Fecha_de_Activacion')] == '2024-01-15 08:30:00'
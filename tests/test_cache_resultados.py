@@ -0,0 +1,117 @@
+import os
+import shutil
+import sys
+import threading
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_resultados
+from almacenamiento import FIELDS
+from cache_resultados import file_content_hash, load_or_ingest
+from lectores import OPENPYXL
+from procesamiento import default_mappings
+
+# Ida y vuelta del caché de resultados: la segunda carga del mismo archivo en la
+# misma base de datos sale del caché con los mismos registros (como texto, igual que
+# en la tabla datos), la misma clasificación de inserción y los mismos conteos; con
+# otros mapeos, otro lector u otra base de datos se vuelve a procesar.
+
+@pytest.fixture
+def excel_file(tmp_path):
+    path = tmp_path / '2024-05-01_cache.xlsx'
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    mapping = default_mappings['WIALON']
+    headers = [mapping[field] for field in FIELDS if field not in ('Origen', 'Fecha_Archivo') and mapping[field]]
+    sheet = workbook.create_sheet('WIALON')
+    sheet.append(headers)
+    rows = [
+        {'Nombre': 'Unidad 1', 'Cliente_Cuenta': 'ACME', 'Telefono': '+52 55 1234 5678',
+         'Fecha_de_Activacion': datetime(2024, 1, 15, 8, 30)},
+        {'Nombre': 'Unidad 2', 'Cliente_Cuenta': 1234, 'Telefono': 5512345679, 'IMEI': 356938035643809},
+        {'Nombre': 'Unidad 1', 'Cliente_Cuenta': 'ACME', 'Telefono': '52 (55) 1234-5678'},
+        {'Nombre': 'Unidad 3', 'Cliente_Cuenta': None},
+    ]
+    for row in rows:
+        sheet.append([row.get(field) for field in FIELDS if field not in ('Origen', 'Fecha_Archivo')
+                      and mapping[field]])
+    workbook.save(path)
+    return str(path)
+
+def _as_text(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+def _records(result):
+    return [tuple(_as_text(value) for value in record) for batch in result['all_data'] for record in batch]
+
+def _fail_ingest(*args, **kwargs):
+    raise AssertionError('se esperaba el resultado del caché')
+
+def test_load_or_ingest_round_trip(tmp_path, excel_file, monkeypatch):
+    db_path, cache_dir = str(tmp_path / 'datos.db'), str(tmp_path / 'cache')
+    first = load_or_ingest(excel_file, default_mappings, db_path, cache_dir=cache_dir, reader=OPENPYXL)
+
+    monkeypatch.setattr(cache_resultados, 'ingest_excel_file', _fail_ingest)
+    cached = load_or_ingest(excel_file, default_mappings, db_path, cache_dir=cache_dir, reader=OPENPYXL)
+
+    assert list(first['flags']) == [1, 1, 0]
+    assert cached['flags'] == first['flags']
+    assert _records(cached) == _records(first)
+    assert (cached['total_records'], cached['invalid_records']) == (4, 1)
+    assert cached['encabezados'] == first['encabezados']
+    assert 'lectura_cache' in cached['metricas']['phases']
+    # El hash del contenido se entrega para registrar la carga sin volver a leer el archivo
+    assert first['sha256'] == cached['sha256'] == file_content_hash(excel_file)
+
+def test_load_or_ingest_misses_on_other_inputs(tmp_path, excel_file, monkeypatch):
+    db_path, cache_dir = str(tmp_path / 'datos.db'), str(tmp_path / 'cache')
+    load_or_ingest(excel_file, default_mappings, db_path, cache_dir=cache_dir, reader=OPENPYXL)
+    calls = []
+    original = cache_resultados.ingest_excel_file
+
+    def counting_ingest(*args, **kwargs):
+        calls.append(args[2])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(cache_resultados, 'ingest_excel_file', counting_ingest)
+    mappings = {sheet: dict(mapping) for sheet, mapping in default_mappings.items()}
+    mappings['WIALON']['Grupo'] = None
+    load_or_ingest(excel_file, mappings, db_path, cache_dir=cache_dir, reader=OPENPYXL)
+    load_or_ingest(excel_file, default_mappings, str(tmp_path / 'otra.db'), cache_dir=cache_dir, reader=OPENPYXL)
+    # Sin la base de datos que cargó la entrada, el caché no sirve
+    os.remove(db_path)
+    load_or_ingest(excel_file, default_mappings, db_path, cache_dir=cache_dir, reader=OPENPYXL)
+
+    assert calls == [db_path, str(tmp_path / 'otra.db'), db_path]
+
+# Dos hilos que cargan archivos distintos con el mismo caché: el índice conserva las
+# dos entradas y no quedan archivos temporales
+def test_load_or_ingest_concurrent_index_updates(tmp_path, excel_file):
+    cache_dir = str(tmp_path / 'cache')
+    other_file = str(tmp_path / '2024-05-02_cache.xlsx')
+    shutil.copy(excel_file, other_file)
+    errors = []
+
+    def ingest(path, db_name):
+        try:
+            load_or_ingest(path, default_mappings, str(tmp_path / db_name), cache_dir=cache_dir, reader=OPENPYXL)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=ingest, args=(excel_file, 'uno.db')),
+               threading.Thread(target=ingest, args=(other_file, 'dos.db'))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    index = cache_resultados._load_index(cache_dir)
+    assert errors == []
+    assert sorted(entry['db_path'] for entry in index['entries'].values()) == [str(tmp_path / 'dos.db'),
+                                                                                str(tmp_path / 'uno.db')]
+    assert set(index['hashes']) == {excel_file, other_file}
+    assert [name for name in os.listdir(cache_dir) if name.endswith('.tmp')] == []
@@ -0,0 +1,124 @@
+import os
+import sys
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacenamiento import FIELDS
+from lectores import CSV, available_readers
+from procesamiento import clean_telefono, default_mappings, extract_date_from_filename, process_excel_file
+
+# Paridad de la homologación por lotes (process_excel_file) con el procesamiento
+# fila por fila original, sobre un libro pequeño con los casos límite: cuentas 0 y
+# '', teléfonos numéricos (enteros y flotantes) y de texto, filas más cortas que los
+# encabezados y celdas vacías al final de la fila.
+
+EXCEL_READERS = [reader for reader in available_readers() if reader != CSV]
+
+# Procesamiento fila por fila original: un diccionario por fila, Cliente_Cuenta
+# requerido con `if value`, Telefono con clean_telefono y el resto tal cual
+def reference_process(excel_file, mappings):
+    all_data, invalid_data, total_records = [], [], 0
+    fecha_archivo = extract_date_from_filename(os.path.basename(excel_file))
+    workbook = openpyxl.load_workbook(excel_file, data_only=True)
+    for sheet_name in workbook.sheetnames:
+        if sheet_name not in mappings:
+            continue
+        mapping = mappings[sheet_name]
+        sheet = workbook[sheet_name]
+        headers = [cell.value for cell in next(sheet.iter_rows(min_row=1, max_row=1))]
+        for row in sheet.iter_rows(min_row=2, values_only=True):
+            total_records += 1
+            row_dict = {headers[i]: row[i] for i in range(len(headers))}
+            if not row_dict.get(mapping['Cliente_Cuenta']):
+                invalid_data.append(row_dict)
+                continue
+            record = []
+            for field in FIELDS:
+                if field == 'Origen':
+                    record.append(mapping['Origen'])
+                elif field == 'Fecha_Archivo':
+                    record.append(fecha_archivo)
+                elif mapping.get(field):
+                    value = row_dict.get(mapping[field])
+                    record.append(clean_telefono(value) if field == 'Telefono' else value)
+                else:
+                    record.append(None)
+            all_data.append(tuple(record))
+    return all_data, invalid_data, total_records
+
+def _without_blank_header(rows):
+    return [{header: value for header, value in row.items() if header is not None} for row in rows]
+
+def _row(mapping, headers, **values):
+    by_header = {mapping[field]: value for field, value in values.items()}
+    return [by_header.get(header) for header in headers]
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    path = tmp_path / '2024-05-01_paridad.xlsx'
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+
+    mapping = default_mappings['WIALON']
+    headers = [mapping[field] for field in FIELDS if field not in ('Origen', 'Fecha_Archivo') and mapping[field]]
+    sheet = workbook.create_sheet('WIALON')
+    sheet.append(headers + ['Notas'])
+    rows = [
+        _row(mapping, headers, Nombre='Unidad 1', Cliente_Cuenta='ACME', Telefono='+52 (55) 1234-5678',
+             IMEI='356938035643809', Fecha_de_Activacion=datetime(2024, 1, 15, 8, 30)),
+        _row(mapping, headers, Nombre='Unidad 2', Cliente_Cuenta=0, Telefono=5512345678),
+        _row(mapping, headers, Nombre='Unidad 3', Cliente_Cuenta='', Telefono='5511112222'),
+        _row(mapping, headers, Nombre='Unidad 4', Cliente_Cuenta=1234, Telefono=5512345678.0),
+        _row(mapping, headers, Nombre='Unidad 5', Cliente_Cuenta='ACME', Telefono='sin línea'),
+        _row(mapping, headers, Nombre='Unidad 6', Cliente_Cuenta='  ', Telefono=0),
+        _row(mapping, headers, Nombre=None, Cliente_Cuenta='Beta', Grupo='Norte'),
+    ]
+    for row in rows:
+        sheet.append(row + ['nota'])
+    # Fila más corta que los encabezados (solo las primeras celdas) y fila con celdas
+    # vacías al final
+    sheet.append(['Unidad 7', 'Beta'])
+    sheet.append(_row(mapping, headers, Nombre='Unidad 8', Cliente_Cuenta='Gamma') + [None, None])
+
+    mapping = default_mappings['COMBUSTIBLE']
+    headers = list(dict.fromkeys(mapping[field] for field in FIELDS
+                                 if field not in ('Origen', 'Fecha_Archivo') and mapping[field]))
+    sheet = workbook.create_sheet('COMBUSTIBLE')
+    sheet.append(headers)
+    sheet.append(_row(mapping, headers, Nombre='Tracto 9', Cliente_Cuenta='Delta', Telefono=8112345,
+                      Servicios='Combustible'))
+    sheet.append(_row(mapping, headers, Nombre='Tracto 10', Cliente_Cuenta=None, Telefono='811 999 0000'))
+
+    # Pestaña sin mapeo: no se lee
+    workbook.create_sheet('OTRA').append(['Cuenta', 'Teléfono'])
+    workbook.save(path)
+    return str(path)
+
+@pytest.mark.parametrize('reader', EXCEL_READERS)
+def test_process_excel_file_matches_row_by_row(workbook_path, reader):
+    expected_data, expected_invalid, expected_total = reference_process(workbook_path, default_mappings)
+    batches, invalid_data, total_records = process_excel_file(workbook_path, default_mappings, reader=reader)
+
+    assert total_records == expected_total
+    assert [record for batch in batches for record in batch] == expected_data
+    # openpyxl en modo de solo lectura toma el número de columnas de la dimensión
+    # guardada en el libro, que incluye las celdas vacías escritas al final de una
+    # fila; esas columnas sin encabezado (llave None) no se comparan
+    assert _without_blank_header(invalid_data) == _without_blank_header(expected_invalid)
+
+def test_reference_covers_edge_cases(workbook_path):
+    data, invalid_data, total_records = reference_process(workbook_path, default_mappings)
+    telefonos = {record[FIELDS.index('Nombre')]: record[FIELDS.index('Telefono')] for record in data}
+
+    assert total_records == 11
+    assert len(invalid_data) == 3
+    assert telefonos['Unidad 1'] == '525512345678'
+    # openpyxl guarda el flotante entero 5512345678.0 como número entero
+    assert telefonos['Unidad 4'] == '5512345678'
+    assert telefonos['Unidad 5'] is None
+    assert telefonos['Unidad 6'] is None
+    assert 'Unidad 7' in telefonos
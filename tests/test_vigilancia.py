@@ -0,0 +1,72 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_resultados import file_content_hash
+from vigilancia import (
+    PENDING,
+    PROCESSED,
+    SETTLE_SECONDS,
+    load_registry,
+    record_ingestion,
+    save_registry,
+    scan_folder,
+)
+
+# Revisión de la carpeta de exportes: qué archivos entran al registro, cuándo quedan
+# listos para procesar y qué pasa con un archivo ya cargado que se toca o cambia.
+
+RESULT = {'flags': bytearray([1, 1, 0]), 'total_records': 4, 'invalid_records': 1}
+
+def _write(path, content, mtime):
+    with open(path, 'wb') as f:
+        f.write(content)
+    os.utime(path, (mtime, mtime))
+    return os.path.abspath(path)
+
+def test_scan_folder_waits_for_settled_exports(tmp_path):
+    mtime = 1_700_000_000
+    xlsx = _write(tmp_path / '2024-05-01_exporte.xlsx', b'libro', mtime)
+    csv = _write(tmp_path / '2024-05-01_WIALON.csv', b'Cuenta,Nombre\n', mtime)
+    _write(tmp_path / '~$2024-05-01_exporte.xlsx', b'bloqueo', mtime)
+    _write(tmp_path / 'notas.txt', b'texto', mtime)
+    registry = {'files': {}}
+
+    assert scan_folder(str(tmp_path), registry, now=mtime + 1) == []
+    assert set(registry['files']) == {xlsx, csv}
+    assert {entry['status'] for entry in registry['files'].values()} == {PENDING}
+
+    assert scan_folder(str(tmp_path), registry, now=mtime + SETTLE_SECONDS) == sorted([xlsx, csv])
+
+def test_scan_folder_drops_removed_files(tmp_path):
+    mtime = 1_700_000_000
+    path = _write(tmp_path / '2024-05-01_exporte.xlsx', b'libro', mtime)
+    registry = {'files': {}}
+    scan_folder(str(tmp_path), registry, now=mtime + SETTLE_SECONDS)
+
+    os.remove(path)
+    assert scan_folder(str(tmp_path), registry, now=mtime + SETTLE_SECONDS) == []
+    assert registry['files'] == {}
+
+def test_scan_folder_keeps_touched_file_processed(tmp_path):
+    folder = str(tmp_path)
+    mtime = 1_700_000_000
+    path = _write(tmp_path / '2024-05-01_exporte.xlsx', b'libro', mtime)
+    save_registry(folder, {'files': {}})
+    record_ingestion(folder, path, str(tmp_path / 'datos.db'), RESULT)
+    registry = load_registry(folder)
+    assert registry['files'][path]['sha256'] == file_content_hash(path)
+    assert registry['files'][path]['inserted'] == 2
+
+    # Mismo contenido con otro mtime: sigue cargado y no se vuelve a procesar
+    os.utime(path, (mtime + 100, mtime + 100))
+    assert scan_folder(folder, registry, now=mtime + 100 + SETTLE_SECONDS) == []
+    assert registry['files'][path]['status'] == PROCESSED
+    assert registry['files'][path]['mtime_ns'] == (mtime + 100) * 10 ** 9
+
+    # Otro contenido: queda pendiente y, ya estable, listo para procesar
+    _write(path, b'libro modificado', mtime + 200)
+    assert scan_folder(folder, registry, now=mtime + 201) == []
+    assert registry['files'][path]['status'] == PENDING
+    assert scan_folder(folder, registry, now=mtime + 200 + SETTLE_SECONDS) == [path]
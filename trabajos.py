@@ -0,0 +1,135 @@
+import itertools
+import logging
+import threading
+import time
+
+from procesamiento import ProcessingCancelled
+
+# Trabajos en segundo plano para la interfaz. El procesamiento de un archivo corre en
+# un hilo propio, de modo que el script de Streamlit puede volver a ejecutarse (por
+# un filtro, un botón o la actualización del avance) sin reiniciarlo. El registro de
+# trabajos vive en este módulo, que Streamlit importa una sola vez por servidor; la
+# sesión solo guarda el id del trabajo y, al terminar, toma su resultado.
+
+# Estados de un trabajo
+RUNNING = 'en_curso'
+FINISHED = 'terminado'
+CANCELLED = 'cancelado'
+FAILED = 'error'
+
+# Trabajos terminados que se conservan en el registro (los más recientes)
+MAX_FINISHED_JOBS = 5
+
+_jobs = {}
+_lock = threading.Lock()
+_ids = itertools.count(1)
+
+class Job:
+    def __init__(self, job_id, name, key):
+        self.id = job_id
+        self.name = name
+        self.key = key
+        self.status = RUNNING
+        self.started = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.progress = {}
+        self.last_report = self.started
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    # Registra el avance de una etapa (una pestaña o la inserción): filas procesadas
+    # y filas esperadas (None si no se conocen). Una etapa empieza con el último
+    # informe de la etapa anterior.
+    def report(self, stage, rows, total=None):
+        now = time.time()
+        record = self.progress.get(stage)
+        if record is None:
+            record = self.progress[stage] = {'started': self.last_report}
+        record.update(rows=rows, total=total, updated=now)
+        self.last_report = now
+
+    # Avance de cada etapa con filas por segundo y tiempo restante estimado
+    def snapshot(self):
+        stages = []
+        for stage, record in list(self.progress.items()):
+            elapsed = record['updated'] - record['started']
+            rows_per_s = record['rows'] / elapsed if elapsed > 0 else None
+            total = record['total']
+            fraction = min(record['rows'] / total, 1.0) if total else None
+            eta_s = (total - record['rows']) / rows_per_s if total and rows_per_s else None
+            stages.append({'etapa': stage, 'filas': record['rows'], 'total': total, 'fraccion': fraction,
+                           'filas_por_s': rows_per_s, 'restante_s': max(eta_s, 0) if eta_s is not None else None})
+        return stages
+
+    def is_running(self):
+        return self.status == RUNNING
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+def _run(job, target, args, kwargs):
+    status = FAILED
+    try:
+        job.result = target(*args, progress=job.report, cancel=job.cancel_event, **kwargs)
+        status = FINISHED
+    except ProcessingCancelled:
+        status = CANCELLED
+        logging.info(f"Trabajo {job.id} ({job.name}) cancelado")
+    except Exception as e:
+        job.error = str(e)
+        logging.exception(f"Error en el trabajo {job.id} ({job.name})")
+    finally:
+        job.finished = time.time()
+        job.status = status
+        _discard_finished()
+
+# Función para conservar solo los MAX_FINISHED_JOBS trabajos terminados más recientes
+def _discard_finished():
+    with _lock:
+        finished = sorted((job for job in _jobs.values() if not job.is_running()), key=lambda job: job.finished)
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del _jobs[job.id]
+
+# Función para iniciar un trabajo. target se llama en un hilo con args, kwargs y los
+# argumentos progress (el método report del trabajo) y cancel (un threading.Event que
+# se activa al cancelar). Si ya hay un trabajo en curso con la misma clave (por
+# ejemplo, la misma base de datos), se devuelve ese en lugar de iniciar otro.
+def start_job(name, target, *args, key=None, **kwargs):
+    with _lock:
+        job = running_job(key)
+        if job is not None:
+            return job
+        job = Job(next(_ids), name, key)
+        _jobs[job.id] = job
+    job.thread = threading.Thread(target=_run, args=(job, target, args, kwargs), name=f'trabajo-{job.id}',
+                                  daemon=True)
+    job.thread.start()
+    logging.info(f"Trabajo {job.id} ({name}) iniciado")
+    return job
+
+# Función para obtener un trabajo del registro (None si no existe o ya se descartó)
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+# Función para obtener el trabajo en curso con una clave (None si no hay)
+def running_job(key):
+    if key is None:
+        return None
+    for job in list(_jobs.values()):
+        if job.key == key and job.is_running():
+            return job
+    return None
+
+# Función para listar los trabajos del registro, del más reciente al más antiguo
+def list_jobs():
+    return sorted(_jobs.values(), key=lambda job: job.started, reverse=True)
+
+# Función para pedir la cancelación de un trabajo. El trabajo se detiene en el
+# siguiente bloque que procese.
+def cancel_job(job_id):
+    job = _jobs.get(job_id)
+    if job is not None and job.is_running():
+        job.cancel_event.set()
+    return job
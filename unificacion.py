@@ -0,0 +1,291 @@
+import glob
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import create_schema
+from cambios_diarios import database_date
+from procesamiento import clean_telefono_series
+
+# Unificación de dispositivos entre plataformas. Los registros de WIALON, ADAS y
+# COMBUSTIBLE (de una o varias bases de datos diarias) se agrupan en entidades: dos
+# registros son la misma entidad si comparten IMEI, ICCID o Telefono normalizados,
+# directamente o a través de otros registros. Cada identificador se busca en un
+# diccionario (índice hash) y los grupos se unen con union-find, así que el costo
+# es lineal en el número de registros y nunca se comparan registros por pares.
+# El resultado se guarda en las tablas entidades, entidad_registros y
+# conflictos_entidad de la base de datos destino.
+
+ID_FIELDS = ['IMEI', 'ICCID', 'Telefono']
+
+# Los teléfonos se comparan por sus últimos 10 dígitos (sin lada internacional)
+TELEFONO_DIGITS = 10
+
+# Plataforma de referencia: una SIM o equipo que aparece en otra plataforma debería
+# estar también en ésta
+REFERENCE_ORIGIN = 'WIALON'
+
+# Filas que se leen de la tabla datos en cada bloque
+READ_CHUNK_SIZE = 200000
+
+CONFLICT_TYPES = ('varios_clientes', 'varios_imei', 'varios_iccid', 'falta_en_referencia')
+
+# Mínimo de dígitos para que un identificador se use al vincular registros. Los
+# valores más cortos o formados por un solo dígito repetido (0, 000000, 9999999999)
+# suelen ser marcadores de "sin dato" y unirían equipos que no tienen relación.
+MIN_DIGITS = {'IMEI': 8, 'ICCID': 10, 'Telefono': TELEFONO_DIGITS}
+
+# Función para normalizar una columna de identificadores: solo dígitos (la misma
+# limpieza que clean_telefono) y sin el '.0' que dejan los números leídos como flotantes
+def normalize_identifier(column, min_digits=1):
+    text = column.where(column.isna(), column.astype(str))
+    floats = text.str.endswith('.0').fillna(False).astype(bool)
+    if floats.any():
+        text[floats] = text[floats].str[:-2]
+    cleaned = clean_telefono_series(text)
+    present = cleaned.notna().to_numpy()
+    values = cleaned[present]
+    placeholder = values.str.len().lt(min_digits) | values.str.fullmatch(r'(\d)\1*').astype(bool)
+    cleaned[values.index[placeholder.to_numpy()]] = None
+    return cleaned
+
+def normalize_telefono(column):
+    cleaned = normalize_identifier(column, MIN_DIGITS['Telefono'])
+    return cleaned.where(cleaned.isna(), cleaned.str[-TELEFONO_DIGITS:])
+
+def _find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+def _create_entity_tables(conn):
+    conn.execute('DROP TABLE IF EXISTS entidad_registros')
+    conn.execute('DROP TABLE IF EXISTS entidades')
+    conn.execute('DROP TABLE IF EXISTS conflictos_entidad')
+    conn.execute('''
+        CREATE TABLE entidad_registros (
+            Entidad INTEGER,
+            Base TEXT,
+            Fila INTEGER,
+            Nombre TEXT,
+            Cliente_Cuenta TEXT,
+            Origen TEXT,
+            Fecha_Archivo TEXT,
+            IMEI TEXT,
+            ICCID TEXT,
+            Telefono TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE entidades (
+            Entidad INTEGER PRIMARY KEY,
+            Registros INTEGER,
+            Plataformas TEXT,
+            Clientes INTEGER,
+            IMEI TEXT,
+            ICCID TEXT,
+            Telefono TEXT,
+            Fecha_Primera TEXT,
+            Fecha_Ultima TEXT,
+            Conflictos TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE conflictos_entidad (
+            Entidad INTEGER,
+            Tipo TEXT,
+            Detalle TEXT
+        )
+    ''')
+
+# Función para leer por bloques los registros de la tabla datos de un esquema (main o
+# una base adjunta) con los identificadores ya normalizados
+def _read_records(conn, schema):
+    sql = (f'SELECT rowid AS Fila, Nombre, Cliente_Cuenta, Origen, Fecha_Archivo, {", ".join(ID_FIELDS)} '
+           f'FROM {schema}.datos')
+    for chunk in pd.read_sql_query(sql, conn, chunksize=READ_CHUNK_SIZE, dtype=object):
+        chunk['IMEI'] = normalize_identifier(chunk['IMEI'], MIN_DIGITS['IMEI'])
+        chunk['ICCID'] = normalize_identifier(chunk['ICCID'], MIN_DIGITS['ICCID'])
+        chunk['Telefono'] = normalize_telefono(chunk['Telefono'])
+        yield chunk
+
+# Función para unir en un texto los valores de cada entidad (en el orden recibido)
+def _join_by_entity(entities, values):
+    joined = {}
+    for entity, value in zip(entities.tolist(), values.tolist()):
+        joined.setdefault(entity, []).append(value)
+    return pd.Series({entity: ', '.join(items) for entity, items in joined.items()}, dtype=object)
+
+# Función para unir los valores distintos de una columna por entidad (solo de las
+# entidades indicadas)
+def _distinct_values(records, column, entities):
+    subset = records.loc[records['Entidad'].isin(entities), ['Entidad', column]].dropna().drop_duplicates()
+    subset = subset.sort_values(['Entidad', column])
+    return _join_by_entity(subset['Entidad'], subset[column])
+
+# Función para calcular, por entidad, el resumen y los conflictos. Las plataformas de
+# cada entidad se acumulan como bits para no recorrer los grupos en Python.
+def _summarize_entities(records):
+    grouped = records.groupby('Entidad', sort=True)
+    origins = sorted(records['Origen'].dropna().unique())
+    pairs = records[['Entidad', 'Origen']].dropna().drop_duplicates()
+    bits = pairs['Origen'].map({origen: 1 << i for i, origen in enumerate(origins)}).astype(np.int64)
+    platform_bits = bits.groupby(pairs['Entidad']).sum().reindex(grouped.size().index, fill_value=0)
+    labels = {code: ', '.join(origen for i, origen in enumerate(origins) if code >> i & 1)
+              for code in platform_bits.unique()}
+    # Primera y última fecha por ordenamiento (min/max de columnas de texto no son
+    # vectorizados en groupby)
+    dates = records[['Entidad', 'Fecha_Archivo']].dropna().sort_values(['Entidad', 'Fecha_Archivo'])
+    dates = dates.groupby('Entidad')['Fecha_Archivo']
+    summary = pd.DataFrame({
+        'Registros': grouped.size(),
+        'Plataformas': platform_bits.map(labels),
+        'Clientes': grouped['Cliente_Cuenta'].nunique(),
+        'IMEI': grouped['IMEI'].first(),
+        'ICCID': grouped['ICCID'].first(),
+        'Telefono': grouped['Telefono'].first(),
+        'Fecha_Primera': dates.first(),
+        'Fecha_Ultima': dates.last(),
+    })
+    # Las entidades sin ningún identificador no se pueden vincular y no se reportan
+    # como faltantes en la plataforma de referencia
+    identified = summary[ID_FIELDS].notna().any(axis=1)
+    reference_bit = 1 << origins.index(REFERENCE_ORIGIN) if REFERENCE_ORIGIN in origins else 0
+    checks = {
+        'varios_clientes': ('Cliente_Cuenta', summary['Clientes'] > 1),
+        'varios_imei': ('IMEI', grouped['IMEI'].nunique() > 1),
+        'varios_iccid': ('ICCID', grouped['ICCID'].nunique() > 1),
+        'falta_en_referencia': (None, identified & (platform_bits & reference_bit == 0)),
+    }
+    conflicts = []
+    for tipo, (column, mask) in checks.items():
+        entities = mask.index[mask.to_numpy()]
+        if not len(entities):
+            continue
+        if column is None:
+            detail = 'Solo en ' + summary.loc[entities, 'Plataformas'] + f', sin {REFERENCE_ORIGIN}'
+        else:
+            detail = _distinct_values(records, column, entities).reindex(entities)
+        conflicts.append(pd.DataFrame({'Entidad': entities, 'Tipo': tipo, 'Detalle': detail.to_numpy()}))
+    if conflicts:
+        conflicts = pd.concat(conflicts, ignore_index=True)
+    else:
+        conflicts = pd.DataFrame({'Entidad': pd.Series(dtype=np.int64), 'Tipo': pd.Series(dtype=object),
+                                  'Detalle': pd.Series(dtype=object)})
+    summary['Conflictos'] = _join_by_entity(conflicts['Entidad'], conflicts['Tipo']).reindex(summary.index)
+    return summary, conflicts
+
+# Función para obtener las demás bases de datos diarias (AAAA-MM-DD.db) de la carpeta de db_path
+def other_daily_databases(db_path):
+    db_path = os.path.abspath(db_path)
+    paths = glob.glob(os.path.join(os.path.dirname(db_path), '*.db'))
+    return sorted(path for path in paths if database_date(path) is not None and os.path.abspath(path) != db_path)
+
+# Función para unificar los dispositivos de la base de datos de conn y, opcionalmente,
+# de otras bases de datos diarias (other_db_paths). Las entidades se guardan en la
+# base de datos de conn, reemplazando las de una unificación anterior.
+# Devuelve los conteos de registros, entidades y conflictos por tipo.
+def unify_devices(conn, db_path, other_db_paths=()):
+    create_schema(conn)
+    parent = []
+    indexes = {field: {} for field in ID_FIELDS}
+    parts = []
+    sources = [('main', db_path)] + [(None, path) for path in other_db_paths]
+    for schema, path in sources:
+        if schema is None:
+            conn.execute('ATTACH DATABASE ? AS fuente', (path,))
+            schema = 'fuente'
+        try:
+            for chunk in _read_records(conn, schema):
+                start = len(parent)
+                parent.extend(range(start, start + len(chunk)))
+                for field in ID_FIELDS:
+                    index = indexes[field]
+                    for row, value in enumerate(chunk[field].tolist(), start):
+                        if value is None:
+                            continue
+                        first = index.setdefault(value, row)
+                        if first != row:
+                            a, b = _find(parent, first), _find(parent, row)
+                            if a != b:
+                                parent[b] = a
+                chunk.insert(0, 'Base', database_date(path) or os.path.basename(path))
+                parts.append(chunk)
+        finally:
+            if schema == 'fuente':
+                conn.execute('DETACH DATABASE fuente')
+
+    columns = ['Entidad', 'Base', 'Fila', 'Nombre', 'Cliente_Cuenta', 'Origen', 'Fecha_Archivo'] + ID_FIELDS
+    if parts:
+        records = pd.concat(parts, ignore_index=True)
+        # Número de entidad consecutivo en el orden en que aparece su primer registro
+        roots = np.fromiter((_find(parent, i) for i in range(len(parent))), dtype=np.int64, count=len(parent))
+        _, first_rows, entity = np.unique(roots, return_index=True, return_inverse=True)
+        order = np.argsort(np.argsort(first_rows))
+        records.insert(0, 'Entidad', order[entity] + 1)
+    else:
+        records = pd.DataFrame(columns=columns)
+    summary, conflicts = _summarize_entities(records)
+
+    try:
+        _create_entity_tables(conn)
+        conn.executemany(f'INSERT INTO entidad_registros ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})',
+                         zip(*(records[column].astype(object).where(records[column].notna(), None).tolist()
+                               if column not in ('Entidad', 'Fila') else records[column].astype(int).tolist()
+                               for column in columns)))
+        summary_columns = ['Registros', 'Plataformas', 'Clientes', 'IMEI', 'ICCID', 'Telefono',
+                           'Fecha_Primera', 'Fecha_Ultima', 'Conflictos']
+        conn.executemany('INSERT INTO entidades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         zip(summary.index.astype(int).tolist(),
+                             *(summary[column].astype(object).where(summary[column].notna(), None).tolist()
+                               for column in summary_columns)))
+        conn.executemany('INSERT INTO conflictos_entidad VALUES (?, ?, ?)',
+                         zip(conflicts['Entidad'].astype(int).tolist(), conflicts['Tipo'].tolist(),
+                             conflicts['Detalle'].tolist()))
+        for field in ['Entidad'] + ID_FIELDS:
+            conn.execute(f'CREATE INDEX idx_entidad_registros_{field.lower()} ON entidad_registros ({field})')
+        conn.execute('CREATE INDEX idx_conflictos_entidad_tipo ON conflictos_entidad (Tipo)')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    counts = {'registros': len(records), 'entidades': len(summary)}
+    counts.update({tipo: int((conflicts['Tipo'] == tipo).sum()) for tipo in CONFLICT_TYPES})
+    logging.info(f"Unificación de dispositivos ({len(sources)} base(s) de datos, "
+                 f"{datetime.now().isoformat(timespec='seconds')}): {counts}")
+    return counts
+
+# Función para obtener los registros de la entidad de un IMEI, ICCID o Telefono
+def find_entity(conn, imei=None, iccid=None, telefono=None):
+    values = {'IMEI': normalize_identifier(pd.Series([imei or None], dtype=object), MIN_DIGITS['IMEI'])[0],
+              'ICCID': normalize_identifier(pd.Series([iccid or None], dtype=object), MIN_DIGITS['ICCID'])[0],
+              'Telefono': normalize_telefono(pd.Series([telefono or None], dtype=object))[0]}
+    where = [f'{field} = ?' for field, value in values.items() if value is not None]
+    if not where:
+        return pd.DataFrame(columns=['Entidad', 'Base', 'Fila', 'Nombre', 'Cliente_Cuenta', 'Origen',
+                                     'Fecha_Archivo'] + ID_FIELDS)
+    params = [value for value in values.values() if value is not None]
+    return pd.read_sql_query(f'''
+        SELECT * FROM entidad_registros
+        WHERE Entidad IN (SELECT Entidad FROM entidad_registros WHERE {' OR '.join(where)})
+        ORDER BY Entidad, Base, Origen, Cliente_Cuenta, Nombre
+    ''', conn, params=params)
+
+# Función para obtener el reporte de conflictos, opcionalmente de un solo tipo
+def conflicts_report(conn, tipo=None):
+    sql = '''
+        SELECT c.Entidad, c.Tipo, c.Detalle, e.Registros, e.Plataformas, e.IMEI, e.ICCID, e.Telefono
+        FROM conflictos_entidad c JOIN entidades e ON e.Entidad = c.Entidad
+    '''
+    params = []
+    if tipo:
+        sql += ' WHERE c.Tipo = ?'
+        params.append(tipo)
+    return pd.read_sql_query(sql + ' ORDER BY c.Tipo, c.Entidad', conn, params=params)
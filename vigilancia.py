@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from cache_resultados import CACHE_DIR, file_content_hash, load_or_ingest
+from procesamiento import INPUT_EXTENSIONS
+
+# Vigilancia de la carpeta de exportes. Un registro JSON en la misma carpeta guarda
+# cada exporte (.xlsx o .csv) visto (ruta, tamaño, mtime, hash de contenido), su
+# estado, la base de datos en la que se cargó y los conteos de la carga. Cada revisión de la
+# carpeta solo procesa los archivos nuevos o modificados, y espera a que un archivo
+# deje de cambiar durante SETTLE_SECONDS antes de leerlo (los exportes se copian a la
+# carpeta mientras se descargan). La interfaz lista los archivos desde este registro.
+
+REGISTRY_FILE = 'registro_archivos.json'
+
+# Segundos sin cambios en un archivo antes de considerarlo completo
+SETTLE_SECONDS = 30
+
+# Segundos entre revisiones de la carpeta en el modo de vigilancia
+WATCH_INTERVAL = 60
+
+# Estados de un archivo en el registro
+PENDING = 'pendiente'
+PROCESSED = 'procesado'
+REPEATED = 'repetido'
+FAILED = 'error'
+
+# Lectura, cambio y escritura del registro desde los hilos de un mismo proceso (la
+# interfaz y su trabajo en segundo plano)
+_registry_lock = threading.Lock()
+
+def _registry_path(folder):
+    return os.path.join(folder, REGISTRY_FILE)
+
+# Función para leer el registro de archivos de una carpeta
+def load_registry(folder):
+    try:
+        with open(_registry_path(folder), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'files': {}}
+
+# Cada escritura usa su propio archivo temporal, así que la interfaz, su trabajo en
+# segundo plano y la vigilancia no se pisan el archivo a medio escribir
+def save_registry(folder, registry):
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=REGISTRY_FILE + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(registry, f, indent=1)
+        os.replace(tmp_path, _registry_path(folder))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Función para obtener la ruta de la base de datos del día en una carpeta
+def daily_db_path(folder):
+    return os.path.join(folder, f'{datetime.now().strftime("%Y-%m-%d")}.db')
+
+# Los exportes son los archivos de entrada (.xlsx y los .csv por plataforma); los
+# archivos temporales de Excel (~$archivo.xlsx) no
+def _is_export(name):
+    return name.lower().endswith(INPUT_EXTENSIONS) and not name.startswith('~$')
+
+# Función para revisar la carpeta y actualizar el registro. Los archivos nuevos o con
+# otro tamaño o mtime quedan pendientes, salvo los ya cargados cuyo contenido es el
+# mismo (se tocaron o se copiaron encima); los que ya no están se quitan del registro.
+# El registro conserva el hash y la base de datos de la última carga de cada archivo.
+# Devuelve los archivos pendientes que ya no cambian (listos para procesar).
+def scan_folder(folder, registry, now=None):
+    now = time.time() if now is None else now
+    files = registry['files']
+    present = set()
+    ready = []
+    for name in sorted(os.listdir(folder)):
+        if not _is_export(name):
+            continue
+        path = os.path.abspath(os.path.join(folder, name))
+        stat = os.stat(path)
+        present.add(path)
+        entry = files.get(path)
+        settled = now - stat.st_mtime >= SETTLE_SECONDS
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            unchanged = (entry is not None and settled and entry.get('status') in (PROCESSED, REPEATED)
+                         and entry.get('sha256') == file_content_hash(path))
+            entry = files[path] = dict(entry or {}, path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                                       detected=now)
+            if not unchanged:
+                entry['status'] = PENDING
+        if entry['status'] == PENDING and settled:
+            ready.append(path)
+    for path in [path for path in files if path not in present]:
+        del files[path]
+    return ready
+
+# Función para revisar la carpeta y guardar el registro actualizado (lo usan la
+# vigilancia y la interfaz). Devuelve el registro y los archivos listos para procesar.
+def rescan_folder(folder):
+    with _registry_lock:
+        registry = load_registry(folder)
+        ready = scan_folder(folder, registry)
+        save_registry(folder, registry)
+    return registry, ready
+
+# Función para guardar en el registro el resultado de cargar un archivo (lo usan la
+# vigilancia y la interfaz)
+def record_ingestion(folder, excel_file, db_path, result, content_hash=None):
+    with _registry_lock:
+        _record_ingestion(folder, excel_file, db_path, result, content_hash)
+
+def _record_ingestion(folder, excel_file, db_path, result, content_hash):
+    registry = load_registry(folder)
+    path = os.path.abspath(excel_file)
+    stat = os.stat(path)
+    inserted = sum(result['flags'])
+    registry['files'][path] = dict(
+        registry['files'].get(path, {}),
+        path=path,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        sha256=content_hash or file_content_hash(path),
+        status=PROCESSED,
+        db_path=os.path.abspath(db_path),
+        total_records=result['total_records'],
+        invalid_records=result['invalid_records'],
+        inserted=inserted,
+        not_inserted=len(result['flags']) - inserted,
+        processed=time.time(),
+    )
+    save_registry(folder, registry)
+
+# Función para buscar en el registro un archivo ya cargado en db_path con el mismo
+# contenido: el mismo archivo, que quedó pendiente al cambiar su mtime antes de poder
+# comparar el contenido, o una copia con otro nombre
+def _processed_copy(registry, path, content_hash, db_path):
+    own = registry['files'].get(path, {})
+    if own.get('processed') and own.get('sha256') == content_hash and own.get('db_path') == os.path.abspath(db_path):
+        return path
+    for entry in registry['files'].values():
+        if (entry['status'] == PROCESSED and entry.get('sha256') == content_hash
+                and entry.get('db_path') == os.path.abspath(db_path)):
+            return entry['path']
+    return None
+
+# Función para revisar la carpeta una vez y cargar los archivos listos. Un archivo
+# cuyo contenido ya se cargó en la misma base de datos se marca como repetido sin
+# volver a leerlo. Devuelve el estado final de cada archivo procesado.
+def ingest_ready_files(folder, mappings, db_path=None):
+    registry, ready = rescan_folder(folder)
+    outcome = {}
+    for path in ready:
+        target_db = db_path or daily_db_path(folder)
+        try:
+            content_hash = file_content_hash(path)
+            copy_of = _processed_copy(registry, path, content_hash, target_db)
+            if copy_of == path:
+                registry['files'][path]['status'] = PROCESSED
+                save_registry(folder, registry)
+                logging.info(f"Vigilancia: '{path}' no cambió de contenido desde que se cargó; no se carga")
+            elif copy_of is not None:
+                registry['files'][path].update(sha256=content_hash, status=REPEATED, copy_of=copy_of)
+                save_registry(folder, registry)
+                logging.info(f"Vigilancia: '{path}' tiene el mismo contenido que '{copy_of}'; no se carga")
+            else:
+                # El caché es el de la carpeta, el mismo que usa la interfaz para la ruta predeterminada
+                result = load_or_ingest(path, mappings, target_db,
+                                        cache_dir=os.path.join(folder, os.path.basename(CACHE_DIR)))
+                record_ingestion(folder, path, target_db, result, content_hash)
+                registry = load_registry(folder)
+                logging.info(f"Vigilancia: '{path}' cargado en '{target_db}' "
+                             f"({result['total_records']} registros)")
+        except Exception as e:
+            registry['files'][path].update(status=FAILED, error=str(e))
+            save_registry(folder, registry)
+            logging.exception(f"Vigilancia: error al cargar '{path}'")
+        outcome[path] = registry['files'][path]['status']
+    return outcome
+
+# Función para vigilar la carpeta: la revisa cada `interval` segundos hasta que se
+# interrumpa
+def watch_folder(folder, mappings, interval=WATCH_INTERVAL, db_path=None):
+    logging.info(f"Vigilancia de '{folder}' cada {interval} s")
+    try:
+        while True:
+            for path, status in ingest_ready_files(folder, mappings, db_path).items():
+                print(f"{os.path.basename(path)}: {status}")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        logging.info("Vigilancia detenida")
+
+# Función para listar los archivos del registro, del más reciente al más antiguo
+def registered_files(registry):
+    return sorted(registry['files'], key=lambda path: registry['files'][path]['mtime_ns'], reverse=True)
+
+# Función para describir un archivo del registro en el selector de la interfaz
+def describe_file(registry, path):
+    entry = registry['files'].get(path, {})
+    text = f"{os.path.basename(path)} ({entry.get('status', PENDING)}"
+    if entry.get('status') == PROCESSED:
+        text += f", {entry['total_records']} registros en {os.path.basename(entry['db_path'])}"
+    return text + ')'